@@ -0,0 +1,81 @@
+"""
+Benchmark of the field backends.
+
+Times the element-wise operations, the wire format and the share operations
+of the protocol for every available backend:
+
+    python bench_fields.py [length] [repeat]
+"""
+
+import sys
+import time
+from typing import Callable, List
+
+from field import Field, GmpyField, MersenneField, PrimeField
+from secret_sharing import (
+    beaver_multiply,
+    default_q,
+    gen_share_batch,
+    reconstruct_share_batch,
+)
+
+
+# A 127-bit Mersenne prime, for the big integer backend.
+BIG_Q = 2 ** 127 - 1
+
+
+def available_fields() -> List[Field]:
+    fields: List[Field] = [PrimeField(default_q), MersenneField()]
+    try:
+        fields.append(GmpyField(BIG_Q))
+    except ImportError as error:
+        print(f"Skipping the gmpy2 backend: {error}")
+    return fields
+
+
+def measure(function: Callable[[], object], repeat: int) -> float:
+    """Returns the best time of `repeat` runs, in milliseconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def benchmark(field: Field, length: int, repeat: int) -> dict:
+    a = field.random(length)
+    b = field.random(length)
+    side = max(1, int(length ** 0.5) // 4)
+    m = field.random((side, side))
+    packed = field.pack(a)
+    shares = gen_share_batch(a, 3, field)
+    triplet = [gen_share_batch(values, 3, field)[1] for values in (a, b, field.mul(a, b))]
+    return {
+        "random": measure(lambda: field.random(length), repeat),
+        "add": measure(lambda: field.add(a, b), repeat),
+        "mul": measure(lambda: field.mul(a, b), repeat),
+        "sum": measure(lambda: field.sum(a), repeat),
+        f"matmul {side}x{side}": measure(lambda: field.matmul(m, m), repeat),
+        "pack": measure(lambda: field.pack(a), repeat),
+        "unpack": measure(lambda: field.unpack(packed), repeat),
+        "share (3 parties)": measure(lambda: gen_share_batch(a, 3, field), repeat),
+        "reconstruct": measure(lambda: reconstruct_share_batch(shares), repeat),
+        "beaver multiply": measure(lambda: beaver_multiply(1, triplet, a, b), repeat),
+    }
+
+
+def main(args: List[str]) -> None:
+    length = int(args[0]) if args else 100000
+    repeat = int(args[1]) if len(args) > 1 else 5
+    print(f"Field backends, {length} elements, best of {repeat} runs (ms)")
+    results = {field.name: benchmark(field, length, repeat) for field in available_fields()}
+    operations = list(next(iter(results.values())))
+    width = max(len(operation) for operation in operations)
+    print(" " * width + "".join(f"{name:>14}" for name in results))
+    for operation in operations:
+        print(f"{operation:<{width}}" + "".join(f"{timings[operation]:>14.3f}" for timings in results.values()))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
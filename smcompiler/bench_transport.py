@@ -0,0 +1,128 @@
+"""
+Benchmark of the client transport.
+
+Runs the 10-party workload of perf_eval (every party adds its secrets to a
+shared sum) plus a round of multiplications with fresh connections for every
+request, with persistent connections, and with persistent connections and long
+polling, and with the openings summed by the server. Reports per party the
+number of connections opened, the number of requests, their latency and the
+bytes received:
+
+    python bench_transport.py [party_count] [port]
+"""
+
+import random
+import sys
+import time
+from multiprocessing import Process, Queue
+from typing import Dict, List
+
+import urllib3.connection
+
+from communication import Communication
+from expression import Scalar, Secret
+from protocol import ProtocolSpec
+from secret_sharing import default_q
+from server import run
+from smc_party import SMCParty
+
+
+def count_connections() -> List[int]:
+    """Counts the TCP connections the process opens from now on."""
+    opened = [0]
+    connect = urllib3.connection.HTTPConnection.connect
+
+    def counting_connect(self):
+        opened[0] += 1
+        return connect(self)
+
+    urllib3.connection.HTTPConnection.connect = counting_connect
+    return opened
+
+
+def transport_client(client_id, prot, value_dict, port, options, queue):
+    opened = count_connections()
+    options = dict(options)
+    server_opening = options.pop("server_opening", False)
+    party = SMCParty(client_id, "localhost", port, protocol_spec=prot, value_dict=value_dict, server_opening=server_opening)
+    party.comm = Communication("localhost", port, client_id, **options)
+    latencies: List[float] = []
+    party.comm.session.hooks["response"].append(lambda res, *args, **kwargs: latencies.append(res.elapsed.total_seconds()))
+    start = time.perf_counter()
+    result = party.run()
+    elapsed = time.perf_counter() - start
+    queue.put((result, opened[0], latencies, elapsed, party.comm.get_bytes_received()))
+
+
+def workload(party_count: int):
+    """The sum of 50 secrets spread over the parties, plus the product of the first secret of every party."""
+    secrets_per_party = max(1, 50 // party_count)
+    parties: Dict[str, dict] = {}
+    total = Scalar(0)
+    product = Scalar(1)
+    expected_sum, expected_product = 0, 1
+    for i in range(party_count):
+        secrets = [Secret() for _ in range(secrets_per_party)]
+        values = [random.randint(1, 10) for _ in secrets]
+        parties[f"p{i + 1}"] = dict(zip(secrets, values))
+        for secret in secrets:
+            total += secret
+        product *= secrets[0]
+        expected_sum += sum(values)
+        expected_product *= values[0]
+    return parties, total + product, (expected_sum + expected_product) % default_q
+
+
+def measure(party_count: int, port: int, options: dict) -> dict:
+    parties, expr, expected = workload(party_count)
+    prot = ProtocolSpec(expr=expr, participant_ids=list(parties))
+    queue: Queue = Queue()
+    server = Process(target=run, args=("localhost", port, list(parties)))
+    server.start()
+    time.sleep(3)
+    clients = [
+        Process(target=transport_client, args=(name, prot, value_dict, port, options, queue))
+        for name, value_dict in parties.items()
+    ]
+    for client in clients:
+        client.start()
+    outcomes = [queue.get() for _ in clients]
+    for client in clients:
+        client.join()
+    server.terminate()
+    server.join()
+
+    assert all(result == expected for result, *_ in outcomes)
+    latencies = [latency for _, _, party_latencies, _, _ in outcomes for latency in party_latencies]
+    return {
+        "connections per party": sum(connections for _, connections, _, _, _ in outcomes) / len(outcomes),
+        "requests per party": len(latencies) / len(outcomes),
+        "mean latency (ms)": 1000 * sum(latencies) / len(latencies),
+        "received per party (B)": sum(received for *_, received in outcomes) / len(outcomes),
+        "run time (s)": max(elapsed for _, _, _, elapsed, _ in outcomes),
+    }
+
+
+def main(args: List[str]) -> None:
+    party_count = int(args[0]) if args else 10
+    port = int(args[1]) if len(args) > 1 else 8000
+    configurations = {
+        "no keep-alive": dict(keep_alive=False, long_poll_timeout=None),
+        "keep-alive": dict(long_poll_timeout=None),
+        "long poll": dict(),
+        "server opening": dict(server_opening=True),
+    }
+    results = {
+        name: measure(party_count, port + i, options)
+        for i, (name, options) in enumerate(configurations.items())
+    }
+    print(f"Transport, {party_count} parties")
+    metrics = list(next(iter(results.values())))
+    width = max(len(metric) for metric in metrics)
+    print(" " * width + "".join(f"{name:>16}" for name in results))
+    for metric in metrics:
+        print(f"{metric:<{width}}" + "".join(f"{values[metric]:>16.2f}" for values in results.values()))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,116 @@
+"""
+Compact binary wire format.
+
+Field elements are written as fixed-width little-endian integers, 4 bytes
+for the default field (q < 2^31), see `Field.pack` for the others. Lengths
+and counts are unsigned LEB128 varints. Every payload starts with a 2-byte magic telling what it holds, a
+NUL byte followed by a letter, which the old text format never started with.
+
+The batch envelope carries many labeled payloads in a single message:
+
+    MAGIC_BATCH | varint count | (varint len | label | varint len | payload) * count
+
+On a stream connection (see push_server.py), every message is a frame: a
+4-byte little-endian length followed by an envelope of named fields.
+
+Example:
+>>> payload = encode_envelope([("a", b"..."), ("b", b"...")])
+>>> decode_envelope(payload)
+[('a', b'...'), ('b', b'...')]
+"""
+
+import struct
+from typing import (
+    Dict,
+    List,
+    Tuple,
+    Union,
+)
+
+
+MAGIC_SCALAR = b"\x00S"
+MAGIC_VECTOR = b"\x00V"
+MAGIC_BATCH = b"\x00B"
+MAGIC_SEEDED = b"\x00R"
+
+# magic, share index, followed by the value as one field element
+SCALAR_HEADER = struct.Struct("<2sI")
+# magic, share index, number of elements
+VECTOR_HEADER = struct.Struct("<2sII")
+# magic, share index, number of elements, followed by the PRG seed
+SEEDED_HEADER = struct.Struct("<2sII")
+# length of the frame, followed by the envelope of its fields
+FRAME_HEADER = struct.Struct("<I")
+
+
+def encode_varint(value: int) -> bytes:
+    """Encode a non-negative integer as an unsigned LEB128 varint."""
+    if value < 0:
+        raise ValueError("Varints are unsigned")
+    encoded = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            encoded.append(byte | 0x80)
+        else:
+            encoded.append(byte)
+            return bytes(encoded)
+
+
+def decode_varint(buffer: bytes, offset: int = 0) -> Tuple[int, int]:
+    """Decode a varint at the given offset, returns the value and the offset after it."""
+    value = 0
+    shift = 0
+    while True:
+        byte = buffer[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, offset
+        shift += 7
+
+
+def encode_envelope(entries: List[Tuple[str, bytes]]) -> bytes:
+    """Pack many labeled payloads into a single message."""
+    parts = [MAGIC_BATCH, encode_varint(len(entries))]
+    for label, payload in entries:
+        label_bytes = label.encode("utf-8")
+        parts += [encode_varint(len(label_bytes)), label_bytes, encode_varint(len(payload)), payload]
+    return b"".join(parts)
+
+
+def decode_envelope(buffer: bytes) -> List[Tuple[str, bytes]]:
+    """Unpack the labeled payloads of a message built by encode_envelope."""
+    if not buffer.startswith(MAGIC_BATCH):
+        raise ValueError("Not a batch envelope")
+    count, offset = decode_varint(buffer, len(MAGIC_BATCH))
+    entries = []
+    for _ in range(count):
+        length, offset = decode_varint(buffer, offset)
+        label = buffer[offset:offset + length].decode("utf-8")
+        offset += length
+        length, offset = decode_varint(buffer, offset)
+        entries.append((label, buffer[offset:offset + length]))
+        offset += length
+    return entries
+
+
+def encode_frame(fields: Dict[str, Union[bytes, str]]) -> bytes:
+    """Pack named fields into a length-prefixed frame, strings are UTF-8 encoded."""
+    body = encode_envelope([
+        (name, value.encode("utf-8") if isinstance(value, str) else value)
+        for name, value in fields.items()
+    ])
+    return FRAME_HEADER.pack(len(body)) + body
+
+
+def decode_frame(body: bytes) -> Dict[str, bytes]:
+    """Unpack the fields of a frame, without its length prefix."""
+    return dict(decode_envelope(body))
+
+
+async def read_frame(reader) -> Dict[str, bytes]:
+    """Read the next frame from an asyncio stream."""
+    (length,) = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+    return decode_frame(await reader.readexactly(length))
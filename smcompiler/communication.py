@@ -3,13 +3,20 @@ Utilities for client communication with the trusted server.
 You should not need to change this file.
 """
 
+import asyncio
+import itertools
 import json
+import threading
 import time
-from typing import Union, Tuple
-import sys
+from typing import Dict, List, Optional, Union, Tuple
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from secret_sharing import Share
+from codec import decode_envelope, encode_envelope, encode_frame, read_frame
+from compiler import PREP_MATRIX, PREP_POWERS, PREP_SQUARE, PREP_TRIPLET
+from field import Field
+from secret_sharing import Share, ShareVector, deserialize_share_batch, group_share_batch
 
 
 def sanitize_url_param(url_param: Union[bytes, str]) -> str:
@@ -34,8 +41,23 @@ class Communication:
         server_host: hostname of the server
         server_port: port of the server
         client_id: Identifier of this client
-        poll_delay: delay between requests in seconds (default: 0.2 s)
+        poll_delay: delay between requests in seconds when long polling is disabled (default: 0.2 s)
         protocol: network protocol to use (default: "http")
+        field: field of the shares received from the trusted server (default: the default field)
+        pool_size: number of connections kept open to the server (default: 4)
+        keep_alive: whether to reuse the connections between requests, otherwise every
+            request opens a new one (default: True)
+        retries: number of times a request is retried when the connection to the
+            server fails or a retrieval times out (default: 3)
+        backoff: base delay in seconds between retries, doubled at every retry (default: 0.1 s)
+        timeout: timeout in seconds to connect and to wait for a response, None to
+            wait forever (default: 10 s)
+        long_poll_timeout: time in seconds the server holds a retrieval until the message
+            is published, None to poll every poll_delay instead (default: 30 s)
+
+    All the requests go through a single session, so the connections are opened
+    once and reused by the polling loops. A retrieval returns as soon as the
+    message reaches the server, the server answers the pending request at once.
     """
 
     def __init__(
@@ -44,13 +66,56 @@ class Communication:
             server_port: int,
             client_id: str,
             poll_delay: float = 0.2,
-            protocol: str = "http"
+            protocol: str = "http",
+            field: Optional[Field] = None,
+            pool_size: int = 4,
+            keep_alive: bool = True,
+            retries: int = 3,
+            backoff: float = 0.1,
+            timeout: Optional[float] = 10.0,
+            long_poll_timeout: Optional[float] = 30.0
     ):
         self.base_url = f"{protocol}://{server_host}:{server_port}"
         self.client_id = client_id
         self.poll_delay = poll_delay
+        self.field = field
+        self.timeout = timeout
+        self.long_poll_timeout = long_poll_timeout
         self.bytes_sent = 0
         self.bytes_received = 0
+        self.session = self._create_session(self.base_url, pool_size, keep_alive, retries, backoff)
+
+
+    # Routes of the trusted parameters: every GET hands out the next parameters of the
+    # client, so a request that reached the server must not be sent again.
+    TTP_ROUTES = ("shares", "squares", "powers", "matrix_shares")
+
+    @staticmethod
+    def _create_session(
+            base_url: str,
+            pool_size: int,
+            keep_alive: bool,
+            retries: int,
+            backoff: float
+        ) -> requests.Session:
+        """
+        Create the session of the client, with a pool of persistent connections.
+        """
+        # Connection errors are retried for every method, as the request never reached
+        # the server. Read errors are only retried for GET requests, as urllib3 does by
+        # default, and never for the trusted parameters.
+        retry = Retry(total=retries, connect=retries, read=retries, status=0, backoff_factor=backoff)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        ttp_retry = Retry(total=retries, connect=retries, read=0, status=0, backoff_factor=backoff)
+        ttp_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=ttp_retry)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        for route in Communication.TTP_ROUTES:
+            session.mount(f"{base_url}/{route}/", ttp_adapter)
+        if not keep_alive:
+            session.headers["Connection"] = "close"
+        return session
 
 
     def send_private_message(
@@ -66,11 +131,11 @@ class Communication:
         client_id_san = sanitize_url_param(self.client_id)
         receiver_id_san = sanitize_url_param(receiver_id)
         label_san = sanitize_url_param(label)
-        self.bytes_sent += sys.getsizeof(message)
+        self.bytes_sent += len(message.encode("utf-8") if isinstance(message, str) else message)
 
         url = f"{self.base_url}/private/{client_id_san}/{receiver_id_san}/{label_san}"
         print(f"POST {url}")
-        requests.post(url, message)
+        self.session.post(url, message, timeout=self.timeout).raise_for_status()
 
 
     def retrieve_private_message(
@@ -85,15 +150,7 @@ class Communication:
         label_san = sanitize_url_param(label)
 
         url = f"{self.base_url}/private/{client_id_san}/{label_san}"
-        # We can either use a websocket, or do some polling, but websockets would require asyncio.
-        # So we are doing polling to avoid introducing a new programming paradigm.
-        while True:
-            print(f"GET  {url}")
-            res = requests.get(url)
-            if res.status_code == 200:
-                self.bytes_received += sys.getsizeof(res.content)
-                return res.content
-            time.sleep(self.poll_delay)
+        return self._poll_message(url)
 
 
     def publish_message(
@@ -107,10 +164,10 @@ class Communication:
 
         client_id_san = sanitize_url_param(self.client_id)
         label_san = sanitize_url_param(label)
-        self.bytes_sent += sys.getsizeof(message)
+        self.bytes_sent += len(message.encode("utf-8") if isinstance(message, str) else message)
         url = f"{self.base_url}/public/{client_id_san}/{label_san}"
         print(f"POST {url}")
-        requests.post(url, message)
+        self.session.post(url, message, timeout=self.timeout).raise_for_status()
 
 
     def retrieve_public_message(
@@ -127,38 +184,584 @@ class Communication:
         label_san = sanitize_url_param(label)
 
         url = f"{self.base_url}/public/{client_id_san}/{sender_id_san}/{label_san}"
+        return self._poll_message(url)
 
+    def _poll_message(
+            self,
+            url: str
+        ) -> bytes:
+        """
+        Poll the server until the message is available. With long polling, the server
+        holds every request until the message arrives or long_poll_timeout expires.
+        Any answer but the message or a 404 for a message not published yet is an error.
+        """
         # We can either use a websocket, or do some polling, but websockets would require asyncio.
-        # So we are doing polling to avoid introducing a new programming paradigm.
+        # So we are doing (long) polling to avoid introducing a new programming paradigm.
+        params, timeout = self._poll_settings()
         while True:
             print(f"GET  {url}")
-            res = requests.get(url)
+            res = self.session.get(url, params=params, timeout=timeout)
             if res.status_code == 200:
-                self.bytes_received += sys.getsizeof(res.content)
+                self.bytes_received += len(res.content)
                 return res.content
+            if res.status_code != 404:
+                res.raise_for_status()
+            self._wait_before_polling(res)
+
+    def _wait_before_polling(self, res: requests.Response) -> None:
+        """
+        Wait before polling again, unless the server held the request for a long poll.
+        """
+        if not self.long_poll_timeout or res.elapsed.total_seconds() < self.poll_delay:
             time.sleep(self.poll_delay)
 
+    def _poll_settings(self) -> Tuple[Dict[str, float], Union[None, float, Tuple[float, float]]]:
+        """
+        Query parameters and timeout of the polling requests.
+        """
+        if not self.long_poll_timeout:
+            return {}, self.timeout
+        if self.timeout is None:
+            return {"wait": self.long_poll_timeout}, None
+        return {"wait": self.long_poll_timeout}, (self.timeout, self.timeout + self.long_poll_timeout)
+
+
+    def send_many(
+            self,
+            messages: List[Tuple[str, str, Union[bytes, str]]]
+        ) -> None:
+        """
+        Send many private messages to the server in a single request.
+        Every message is `(receiver_id, label, message)`.
+        """
+        if not messages:
+            return
+        client_id_san = sanitize_url_param(self.client_id)
+        entries = [
+            (
+                f"{sanitize_url_param(receiver_id)}/{sanitize_url_param(label)}",
+                message.encode("utf-8") if isinstance(message, str) else message
+            )
+            for receiver_id, label, message in messages
+        ]
+        self.bytes_sent += sum(len(message) for _, message in entries)
+
+        url = f"{self.base_url}/private_many/{client_id_san}"
+        print(f"POST {url} ({len(entries)} messages)")
+        self.session.post(url, encode_envelope(entries), timeout=self.timeout).raise_for_status()
+
+
+    def retrieve_many(
+            self,
+            labels: List[str]
+        ) -> List[bytes]:
+        """
+        Retrieve many private messages from the server. Each request asks for all the
+        messages still missing, the server sends back the available ones.
+        """
+        client_id_san = sanitize_url_param(self.client_id)
+        url = f"{self.base_url}/private_many/{client_id_san}"
+        queries = {}
+        for label in labels:
+            label_san = sanitize_url_param(label)
+            queries[label_san] = [("label", label_san)]
+        found = self._poll_messages(url, queries)
+        return [found[sanitize_url_param(label)] for label in labels]
+
+
+    def retrieve_public_many(
+            self,
+            channels: List[Tuple[str, str]]
+        ) -> List[bytes]:
+        """
+        Retrieve many public messages from the server, every channel is `(sender_id, label)`.
+        Each request asks for all the messages still missing, the server sends back the
+        available ones.
+        """
+        client_id_san = sanitize_url_param(self.client_id)
+        url = f"{self.base_url}/public_many/{client_id_san}"
+        keys = []
+        queries = {}
+        for sender_id, label in channels:
+            sender_id_san, label_san = sanitize_url_param(sender_id), sanitize_url_param(label)
+            keys.append(f"{sender_id_san}/{label_san}")
+            queries[keys[-1]] = [("sender", sender_id_san), ("label", label_san)]
+        found = self._poll_messages(url, queries)
+        return [found[key] for key in keys]
+
+    def _poll_messages(
+            self,
+            url: str,
+            queries: Dict[str, List[Tuple[str, str]]]
+        ) -> Dict[str, bytes]:
+        """
+        Poll the server until all the messages are available. `queries` gives the query
+        parameters of every message, by its label in the envelope sent back.
+        """
+        params, timeout = self._poll_settings()
+        found: Dict[str, bytes] = {}
+        while True:
+            missing = [key for key in queries if key not in found]
+            if not missing:
+                return found
+            print(f"GET  {url} ({len(missing)} messages)")
+            query = [pair for key in missing for pair in queries[key]] + list(params.items())
+            res = self.session.get(url, params=query, timeout=timeout)
+            res.raise_for_status()
+            self.bytes_received += len(res.content)
+            found.update(decode_envelope(res.content))
+            if len(found) < len(queries):
+                self._wait_before_polling(res)
+
+
+    def open_message(
+            self,
+            label: str,
+            message: bytes
+        ) -> bytes:
+        """
+        Send a share of a public value to the server and retrieve the opened value,
+        the sum of the shares of all the participants, once the server has them all.
+        """
+        client_id_san = sanitize_url_param(self.client_id)
+        label_san = sanitize_url_param(label)
+        self.bytes_sent += len(message)
+        url = f"{self.base_url}/open/{client_id_san}/{label_san}"
+        params, timeout = self._poll_settings()
+        print(f"POST {url}")
+        res = self.session.post(url, message, params=params, timeout=timeout)
+        if res.status_code == 200:
+            self.bytes_received += len(res.content)
+            return res.content
+        if res.status_code != 404:
+            res.raise_for_status()
+        return self._poll_message(url)
+
 
     def retrieve_beaver_triplet_shares(
             self,
-            op_id: str
+            op_id: str,
+            length: Optional[int] = None
         ) -> Tuple[Share, Share, Share]:
         """
         Retrieve a triplet of shares generated by the trusted server.
+        If a length is given, retrieve a triplet of share vectors instead.
         """
 
         client_id_san = sanitize_url_param(self.client_id)
         op_id_san = sanitize_url_param(op_id)
 
         url = f"{self.base_url}/shares/{client_id_san}/{op_id_san}"
+        if length is not None:
+            url = f"{url}/{length}"
+
+        return self._retrieve_shares(url) # type: ignore
+
+    def retrieve_square_pair_shares(
+            self,
+            op_id: str,
+            length: Optional[int] = None
+        ) -> Tuple[Share, Share]:
+        """
+        Retrieve the shares of a square pair (a, a^2) generated by the trusted server.
+        If a length is given, retrieve a pair of share vectors instead.
+        """
+
+        client_id_san = sanitize_url_param(self.client_id)
+        op_id_san = sanitize_url_param(op_id)
+
+        url = f"{self.base_url}/squares/{client_id_san}/{op_id_san}"
+        if length is not None:
+            url = f"{url}/{length}"
+
+        return self._retrieve_shares(url) # type: ignore
+
+    def retrieve_power_shares(
+            self,
+            op_id: str,
+            degree: int,
+            length: Optional[int] = None
+        ) -> Tuple[Share, ...]:
+        """
+        Retrieve the shares of the powers r, r^2, ..., r^degree of a random r
+        generated by the trusted server. If a length is given, retrieve share
+        vectors of element-wise powers instead.
+        """
+
+        client_id_san = sanitize_url_param(self.client_id)
+        op_id_san = sanitize_url_param(op_id)
+
+        url = f"{self.base_url}/powers/{client_id_san}/{op_id_san}/{degree}"
+        if length is not None:
+            url = f"{url}/{length}"
+
+        return self._retrieve_shares(url) # type: ignore
+
+    def retrieve_matrix_triplet_shares(
+            self,
+            op_id: str,
+            m: int,
+            k: int,
+            n: int
+        ) -> Tuple[ShareVector, ShareVector, ShareVector]:
+        """
+        Retrieve the shares of a matrix triplet (A, B, C = AB) for an m x k
+        times k x n product, flattened row by row.
+        """
+
+        client_id_san = sanitize_url_param(self.client_id)
+        op_id_san = sanitize_url_param(op_id)
+
+        url = f"{self.base_url}/matrix_shares/{client_id_san}/{op_id_san}/{m}/{k}/{n}"
+
+        return self._retrieve_shares(url) # type: ignore
+
+    def retrieve_preprocessing(
+            self,
+            preprocessing: List[Tuple]
+        ) -> Dict[str, Tuple[Union[Share, ShareVector], ...]]:
+        """
+        Retrieve the preprocessed material of many Beaver multiplications in a
+        single request. Every request is `(op_id, kind, *parameters)`, the
+        shares are returned by op_id.
+        """
+        client_id_san = sanitize_url_param(self.client_id)
+        url = f"{self.base_url}/preprocessing/{client_id_san}"
+        print(f"POST {url}")
+        message = json.dumps([list(request) for request in preprocessing])
+        self.bytes_sent += len(message)
+        res = self.session.post(url, message, timeout=self.timeout)
+        res.raise_for_status()
+        self.bytes_received += len(res.content)
+        return group_share_batch(deserialize_share_batch(res.content, self.field))
+
+    def _retrieve_shares(
+            self,
+            url: str
+        ) -> Tuple[Union[Share, ShareVector], ...]:
+        """
+        Retrieve the shares generated by the trusted server, sent in a single batch envelope.
+        """
         print(f"GET  {url}")
+        res = self.session.get(url, timeout=self.timeout)
+        res.raise_for_status()
+        self.bytes_received += len(res.content)
+        return tuple(share for _, share in deserialize_share_batch(res.content, self.field))
+
+    def close(self) -> None:
+        """
+        Close the connections to the server.
+        """
+        self.session.close()
+
+    def get_bytes_received(self):
+        return self.bytes_received
+
+    def get_bytes_sent(self):
+        return self.bytes_sent    
+
+
+class AsyncCommunication:
+    """
+    Network communications with the push server (see push_server.py), a drop-in
+    replacement of Communication.
+
+    The client keeps a single TCP connection to the server, driven by an asyncio
+    event loop in a background thread. Retrievals subscribe to their message and
+    return as soon as the server pushes it, many of them can wait at once.
+
+    Attributes:
+        server_host: hostname of the server
+        server_port: port of the server
+        client_id: Identifier of this client
+        field: field of the shares received from the trusted server (default: the default field)
+        timeout: timeout in seconds of every call, None to wait forever (default: None)
+    """
+
+    def __init__(
+            self,
+            server_host: str,
+            server_port: int,
+            client_id: str,
+            field: Optional[Field] = None,
+            timeout: Optional[float] = None
+    ):
+        self.client_id = client_id
+        self.field = field
+        self.timeout = timeout
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        # Retrievals waiting for the answer of the server, by request id.
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._request_ids = itertools.count()
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name=f"comm-{client_id}", daemon=True)
+        self._thread.start()
+        self._call(self._connect(server_host, server_port))
+
+
+    async def _connect(self, server_host: str, server_port: int) -> None:
+        self._reader, self._writer = await asyncio.open_connection(server_host, server_port)
+        self._writer.write(encode_frame({"op": "hello", "client": self.client_id}))
+        self._receiver = asyncio.ensure_future(self._receive())
+
+    async def _receive(self) -> None:
+        """
+        Hand the frames pushed by the server to the retrievals waiting for them.
+        """
+        try:
+            while True:
+                frame = await read_frame(self._reader)
+                future = self._pending.pop(frame["id"].decode("utf-8"), None)
+                if future is None or future.done():
+                    continue
+                if frame["op"] == b"error":
+                    future.set_exception(RuntimeError(frame["data"].decode("utf-8")))
+                else:
+                    future.set_result(frame["data"])
+        except (asyncio.IncompleteReadError, ConnectionError) as error:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError(f"Connection to the server lost: {error}"))
+            self._pending.clear()
+
+    async def _send(self, *frames: Dict[str, Union[bytes, str]]) -> None:
+        self._writer.write(b"".join(encode_frame(fields) for fields in frames))
+        await self._writer.drain()
+
+    async def _request(self, fields: Dict[str, Union[bytes, str]]) -> bytes:
+        """
+        Send a request and wait for the server to answer it.
+        """
+        request_id = str(next(self._request_ids))
+        future = self.loop.create_future()
+        self._pending[request_id] = future
+        await self._send({**fields, "id": request_id})
+        data = await future
+        self.bytes_received += len(data)
+        return data
+
+    def _call(self, coroutine):
+        """
+        Run a coroutine on the event loop of the connection and wait for its result.
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(self.timeout)
+
+
+    def send_private_message(
+            self,
+            receiver_id: str,
+            label: str,
+            message: Union[bytes, str]
+        ) -> None:
+        """
+        Send a private message to the server.
+        """
+        receiver_id_san = sanitize_url_param(receiver_id)
+        label_san = sanitize_url_param(label)
+        print(f"SEND {self.client_id} -> {receiver_id_san}/{label_san}")
+        self.bytes_sent += len(message.encode("utf-8") if isinstance(message, str) else message)
+        self._call(self._send({"op": "private", "receiver": receiver_id_san, "label": label_san, "data": message}))
+
+
+    def retrieve_private_message(
+            self,
+            label: str
+        ) -> bytes:
+        """
+        Retrieve a private message from the server.
+        """
+        label_san = sanitize_url_param(label)
+        print(f"WAIT {self.client_id}/{label_san}")
+        return self._call(self._request({"op": "get_private", "label": label_san}))
+
+
+    def publish_message(
+            self,
+            label: str,
+            message: Union[bytes, str]
+        ) -> None:
+        """
+        Publish a message on the server.
+        """
+        label_san = sanitize_url_param(label)
+        print(f"PUBLISH {self.client_id}/{label_san}")
+        self.bytes_sent += len(message.encode("utf-8") if isinstance(message, str) else message)
+        self._call(self._send({"op": "public", "label": label_san, "data": message}))
+
+
+    def retrieve_public_message(
+            self,
+            sender_id: str,
+            label: str
+        ) -> bytes:
+        """
+        Retrieve a public message from the server.
+        """
+        sender_id_san = sanitize_url_param(sender_id)
+        label_san = sanitize_url_param(label)
+        print(f"WAIT {sender_id_san}/{label_san}")
+        return self._call(self._request({"op": "get_public", "sender": sender_id_san, "label": label_san}))
+
+
+    def send_many(
+            self,
+            messages: List[Tuple[str, str, Union[bytes, str]]]
+        ) -> None:
+        """
+        Send many private messages to the server in a single write.
+        Every message is `(receiver_id, label, message)`.
+        """
+        if not messages:
+            return
+        print(f"SEND {self.client_id} -> {len(messages)} messages")
+        frames = []
+        for receiver_id, label, message in messages:
+            self.bytes_sent += len(message.encode("utf-8") if isinstance(message, str) else message)
+            frames.append({
+                "op": "private",
+                "receiver": sanitize_url_param(receiver_id),
+                "label": sanitize_url_param(label),
+                "data": message
+            })
+        self._call(self._send(*frames))
+
+
+    def retrieve_many(
+            self,
+            labels: List[str]
+        ) -> List[bytes]:
+        """
+        Retrieve many private messages from the server, subscribing to all of them at once.
+        """
+        print(f"WAIT {self.client_id} <- {len(labels)} messages")
+        return self._call(self._request_many([
+            {"op": "get_private", "label": sanitize_url_param(label)} for label in labels
+        ]))
+
+
+    def retrieve_public_many(
+            self,
+            channels: List[Tuple[str, str]]
+        ) -> List[bytes]:
+        """
+        Retrieve many public messages from the server, every channel is `(sender_id, label)`.
+        """
+        print(f"WAIT {self.client_id} <- {len(channels)} public messages")
+        return self._call(self._request_many([
+            {"op": "get_public", "sender": sanitize_url_param(sender_id), "label": sanitize_url_param(label)}
+            for sender_id, label in channels
+        ]))
+
+    async def _request_many(self, frames: List[Dict[str, Union[bytes, str]]]) -> List[bytes]:
+        return list(await asyncio.gather(*(self._request(fields) for fields in frames)))
+
+
+    def open_message(
+            self,
+            label: str,
+            message: bytes
+        ) -> bytes:
+        """
+        Send a share of a public value to the server and retrieve the opened value,
+        the sum of the shares of all the participants, once the server has them all.
+        """
+        label_san = sanitize_url_param(label)
+        print(f"OPEN {self.client_id}/{label_san}")
+        self.bytes_sent += len(message)
+        return self._call(self._request({"op": "open", "label": label_san, "data": message}))
+
+
+    def retrieve_beaver_triplet_shares(
+            self,
+            op_id: str,
+            length: Optional[int] = None
+        ) -> Tuple[Share, Share, Share]:
+        """
+        Retrieve a triplet of shares generated by the trusted server.
+        If a length is given, retrieve a triplet of share vectors instead.
+        """
+        return self._retrieve_shares(op_id, PREP_TRIPLET, length) # type: ignore
+
+    def retrieve_square_pair_shares(
+            self,
+            op_id: str,
+            length: Optional[int] = None
+        ) -> Tuple[Share, Share]:
+        """
+        Retrieve the shares of a square pair (a, a^2) generated by the trusted server.
+        If a length is given, retrieve a pair of share vectors instead.
+        """
+        return self._retrieve_shares(op_id, PREP_SQUARE, length) # type: ignore
+
+    def retrieve_power_shares(
+            self,
+            op_id: str,
+            degree: int,
+            length: Optional[int] = None
+        ) -> Tuple[Share, ...]:
+        """
+        Retrieve the shares of the powers r, r^2, ..., r^degree of a random r
+        generated by the trusted server. If a length is given, retrieve share
+        vectors of element-wise powers instead.
+        """
+        return self._retrieve_shares(op_id, PREP_POWERS, degree, length) # type: ignore
+
+    def retrieve_matrix_triplet_shares(
+            self,
+            op_id: str,
+            m: int,
+            k: int,
+            n: int
+        ) -> Tuple[ShareVector, ShareVector, ShareVector]:
+        """
+        Retrieve the shares of a matrix triplet (A, B, C = AB) for an m x k
+        times k x n product, flattened row by row.
+        """
+        return self._retrieve_shares(op_id, PREP_MATRIX, m, k, n) # type: ignore
+
+    def retrieve_preprocessing(
+            self,
+            preprocessing: List[Tuple]
+        ) -> Dict[str, Tuple[Union[Share, ShareVector], ...]]:
+        """
+        Retrieve the preprocessed material of many Beaver multiplications in a
+        single request. Every request is `(op_id, kind, *parameters)`, the
+        shares are returned by op_id.
+        """
+        print(f"PREPROCESS {self.client_id}")
+        message = json.dumps([list(request) for request in preprocessing])
+        self.bytes_sent += len(message)
+        batch = self._call(self._request({"op": "preprocess", "data": message}))
+        return group_share_batch(deserialize_share_batch(batch, self.field))
+
+    def _retrieve_shares(
+            self,
+            op_id: str,
+            kind: str,
+            *parameters
+        ) -> Tuple[Union[Share, ShareVector], ...]:
+        """
+        Retrieve the shares of a single operation generated by the trusted server.
+        """
+        op_id_san = sanitize_url_param(op_id)
+        return self.retrieve_preprocessing([(op_id_san, kind, *parameters)])[op_id_san]
+
+    def close(self) -> None:
+        """
+        Close the connection to the server and stop its event loop.
+        """
+        async def shutdown():
+            self._receiver.cancel()
+            self._writer.close()
 
-        res = requests.get(url)
-        self.bytes_received += sys.getsizeof(res.content)
-        return tuple([Share.deserialize(s) for s in json.loads(res.text)]) # type: ignore
+        self._call(shutdown())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
 
     def get_bytes_received(self):
         return self.bytes_received
 
     def get_bytes_sent(self):
-        return self.bytes_sent    
\ No newline at end of file
+        return self.bytes_sent
@@ -0,0 +1,372 @@
+"""
+Compiler turning an expression tree into a flat execution plan.
+
+The plan is a topologically ordered list of instructions over virtual
+registers (a small register-based IR). SMC parties evaluate it with a simple
+loop, so arbitrarily deep expressions can be computed without recursion.
+
+Every instruction is annotated with whether its result is secret-shared and
+with the communication round in which it becomes available. Multiplications of
+two secret values (Beaver multiplications) of the same round are independent
+and can be opened together, see `ExecutionPlan.rounds`.
+
+Example:
+>>> plan = compile_expression(Secret() * Scalar(2) + Secret())
+>>> for instruction in plan:
+...     print(instruction)
+"""
+
+from typing import (
+    Any,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+import numpy as np
+
+from expression import (
+    Expression,
+    InnerProduct,
+    Secret,
+    Scalar,
+    AddOperation,
+    LinearCombination,
+    MatMul,
+    MultOperation,
+    Polynomial,
+    SecretVector,
+    SubOperation,
+    VectorSum,
+)
+
+
+# Opcodes of the IR.
+OP_SCALAR = "scalar"
+OP_SECRET = "secret"
+OP_ADD = "add"
+OP_SUB = "sub"
+OP_MULT = "mult"
+OP_LINEAR = "linear"
+OP_VECTOR_SUM = "vsum"
+OP_MATMUL = "matmul"
+OP_INNER_PRODUCT = "inner"
+OP_POLYNOMIAL = "poly"
+
+# Kinds of preprocessed material consumed by Beaver multiplications.
+PREP_TRIPLET = "triplet"
+PREP_SQUARE = "square"
+PREP_POWERS = "powers"
+PREP_MATRIX = "matrix"
+
+BINARY_OPCODES = {
+    AddOperation: OP_ADD,
+    SubOperation: OP_SUB,
+    MultOperation: OP_MULT,
+}
+
+
+class Instruction:
+    """
+    A single step of an execution plan: `dest <- op(args)`.
+
+    Attributes:
+        op: Opcode of the instruction
+        dest: Register receiving the result
+        args: Registers holding the operands
+        value: Immediate operand of terms (scalar value or secret id),
+            `(coefficients, constant)` of linear combinations, the
+            dimensions `(m, k, n)` of matrix products, the length of
+            inner products, or the coefficients of polynomials
+        secret: Whether the result is secret-shared (otherwise it is public)
+        round: Number of Beaver multiplication rounds needed before the result is known
+        beaver: Whether the instruction multiplies two secret values
+        square: Whether both operands of the Beaver multiplication are the same
+            register, it then only needs a square pair `(a, a^2)` and opens `x - a`
+        shape: Shape of the result for vectors `(n,)` and matrices `(m, n)`, None for scalars
+    """
+
+    def __init__(
+            self,
+            op: str,
+            dest: int,
+            args: Tuple[int, ...] = (),
+            value: Any = None,
+            secret: bool = False,
+            round: int = 0,
+            beaver: bool = False,
+            square: bool = False,
+            shape: Optional[Tuple[int, ...]] = None
+        ):
+        self.op = op
+        self.dest = dest
+        self.args = args
+        self.value = value
+        self.secret = secret
+        self.round = round
+        self.beaver = beaver
+        self.square = square
+        self.shape = shape
+
+    @property
+    def length(self) -> Optional[int]:
+        """Number of elements of the result, None for scalars. Shares are stored flat."""
+        if self.shape is None:
+            return None
+        return int(np.prod(self.shape))
+
+    def __repr__(self):
+        if self.op in (OP_SCALAR, OP_SECRET):
+            return f"r{self.dest} = {self.op} {self.value!r}"
+        operands = ", ".join(f"r{arg}" for arg in self.args)
+        if self.square:
+            return f"r{self.dest} = {self.op} r{self.args[0]}^2"
+        if self.op == OP_LINEAR:
+            coeffs, constant = self.value
+            return f"r{self.dest} = {self.op} {list(coeffs)} . [{operands}] + {constant}"
+        return f"r{self.dest} = {self.op} {operands}"
+
+
+def broadcast_shape(operands: Sequence[Instruction]) -> Optional[Tuple[int, ...]]:
+    """
+    Returns the shape of the result of an element-wise operation: scalars are
+    broadcast, vectors and matrices must all have the same shape.
+    """
+    shapes = {operand.shape for operand in operands if operand.shape is not None}
+    if len(shapes) > 1:
+        raise ValueError(f"Cannot combine operands of different shapes {sorted(shapes)}")
+    return shapes.pop() if shapes else None
+
+
+def matmul_dimensions(left: Instruction, right: Instruction) -> Tuple[Tuple[int, int, int], Tuple[int, ...]]:
+    """
+    Returns the dimensions `(m, k, n)` of the product of an m x k and a k x n
+    matrix, and the shape of the result. A vector on the left is a row, a
+    vector on the right is a column, like in NumPy.
+    """
+    if left.shape is None or right.shape is None:
+        raise ValueError("Both operands of a matrix product must be vectors or matrices")
+    if len(left.shape) == 1 and len(right.shape) == 1:
+        raise ValueError("Use dot() for the product of two vectors")
+    m, k = (1,) + left.shape if len(left.shape) == 1 else left.shape
+    k_right, n = right.shape + (1,) if len(right.shape) == 1 else right.shape
+    if k != k_right:
+        raise ValueError(f"Cannot multiply matrices of shapes {left.shape} and {right.shape}")
+    shape = left.shape[:-1] + right.shape[1:]
+    return (m, k, n), shape
+
+
+class ExecutionPlan:
+    """
+    Topologically ordered list of instructions computing an expression.
+
+    Attributes:
+        instructions: Instructions, every operand is defined before it is used
+        num_registers: Number of registers needed to run the plan
+        output: Register holding the value of the whole expression
+        depth: Multiplicative depth, i.e. number of Beaver multiplication rounds
+    """
+
+    def __init__(self, instructions: List[Instruction], num_registers: int, output: int):
+        self.instructions = instructions
+        self.num_registers = num_registers
+        self.output = output
+        self.depth = max((i.round for i in instructions), default=0)
+
+    def __len__(self) -> int:
+        return len(self.instructions)
+
+    def __iter__(self) -> Iterator[Instruction]:
+        return iter(self.instructions)
+
+    def __repr__(self):
+        return f"ExecutionPlan({len(self)} instructions, output=r{self.output})"
+
+    def secret_ids(self) -> List[bytes]:
+        """Returns the ids of the secrets read by the plan, in order of first use."""
+        return [i.value for i in self.instructions if i.op == OP_SECRET]
+
+    def beaver_count(self) -> int:
+        """Returns the number of Beaver multiplications (and thus triplets) of the plan."""
+        return sum(1 for i in self.instructions if i.beaver)
+
+    def square_count(self) -> int:
+        """Returns the number of Beaver multiplications served by a square pair instead of a triplet."""
+        return sum(1 for i in self.instructions if i.square)
+
+    def preprocessing(self) -> List[Tuple]:
+        """
+        Returns the preprocessed material of every Beaver multiplication, see
+        `preprocessing_request`, in the order the multiplications are run:
+        round by round, in plan order within a round.
+        """
+        return [
+            preprocessing_request(instruction)
+            for multiplications, _ in self.rounds()
+            for instruction in multiplications
+        ]
+
+    def rounds(self) -> List[Tuple[List[Instruction], List[Instruction]]]:
+        """
+        Schedule the plan by communication round.
+
+        Returns one `(multiplications, local)` pair per round. The Beaver
+        multiplications of a round only depend on values of earlier rounds, so
+        they can all be opened together. The local instructions of a round,
+        kept in plan order, depend on these multiplications and on each other.
+        """
+        schedule: List[Tuple[List[Instruction], List[Instruction]]] = [
+            ([], []) for _ in range(self.depth + 1)
+        ]
+        for instruction in self.instructions:
+            multiplications, local = schedule[instruction.round]
+            if instruction.beaver:
+                multiplications.append(instruction)
+            else:
+                local.append(instruction)
+        return schedule
+
+
+def preprocessing_request(instruction: Instruction) -> Tuple:
+    """
+    Returns the preprocessed material consumed by a Beaver multiplication:
+
+    - `(PREP_POWERS, degree, length)`: the powers r, ..., r^degree of a random
+      r, a polynomial only opens d = x - r
+    - `(PREP_SQUARE, length)`: a square pair (a, a^2), a square only opens d
+    - `(PREP_MATRIX, m, k, n)`: a matrix triplet, inner products are 1 x n
+      times n x 1 matrix products
+    - `(PREP_TRIPLET, length)`: an element-wise triplet, scalar operands are broadcast
+
+    Lengths are None for scalars.
+    """
+    if instruction.op == OP_POLYNOMIAL:
+        return (PREP_POWERS, len(instruction.value) - 1, instruction.length)
+    if instruction.square:
+        length = instruction.value if instruction.op == OP_INNER_PRODUCT else instruction.length
+        return (PREP_SQUARE, length)
+    if instruction.op == OP_MATMUL:
+        return (PREP_MATRIX,) + tuple(instruction.value)
+    if instruction.op == OP_INNER_PRODUCT:
+        return (PREP_MATRIX, 1, instruction.value, 1)
+    return (PREP_TRIPLET, instruction.length)
+
+
+def compile_expression(expr: Expression) -> ExecutionPlan:
+    """
+    Compile an expression into an execution plan.
+
+    The tree is walked in post-order with an explicit stack. A node object
+    reachable through several paths is compiled once and its register reused.
+    """
+    instructions: List[Instruction] = []
+    registers: Dict[int, int] = {}
+
+    # Each entry is (node, children_done).
+    stack: List[Tuple[Expression, bool]] = [(expr, False)]
+    while stack:
+        node, children_done = stack.pop()
+        if id(node) in registers:
+            continue
+
+        if isinstance(node, Scalar):
+            instruction = Instruction(OP_SCALAR, len(instructions), value=node.value)
+        elif isinstance(node, SecretVector):
+            instruction = Instruction(OP_SECRET, len(instructions), value=node.id, secret=True, shape=node.shape)
+        elif isinstance(node, Secret):
+            instruction = Instruction(OP_SECRET, len(instructions), value=node.id, secret=True)
+        elif not children_done:
+            stack.append((node, True))
+            # Push the last child first so that the first one is compiled first.
+            stack.extend((child, False) for child in reversed(node.children()))
+            continue
+        elif isinstance(node, LinearCombination):
+            operands = [instructions[registers[id(term)]] for term in node.terms]
+            instruction = Instruction(
+                OP_LINEAR,
+                len(instructions),
+                tuple(operand.dest for operand in operands),
+                value=(tuple(node.coeffs), node.constant),
+                secret=any(operand.secret for operand in operands),
+                round=max((operand.round for operand in operands), default=0),
+                shape=broadcast_shape(operands),
+            )
+        elif isinstance(node, VectorSum):
+            operand = instructions[registers[id(node.operand)]]
+            if operand.shape is None:
+                raise ValueError("Only vectors and matrices can be summed")
+            instruction = Instruction(
+                OP_VECTOR_SUM, len(instructions), (operand.dest,), secret=operand.secret, round=operand.round
+            )
+        elif type(node) in BINARY_OPCODES:
+            left = instructions[registers[id(node.left)]]
+            right = instructions[registers[id(node.right)]]
+            op = BINARY_OPCODES[type(node)]
+            beaver = op == OP_MULT and left.secret and right.secret
+            instruction = Instruction(
+                op,
+                len(instructions),
+                (left.dest, right.dest),
+                secret=left.secret or right.secret,
+                round=max(left.round, right.round) + (1 if beaver else 0),
+                beaver=beaver,
+                square=beaver and left.dest == right.dest,
+                shape=broadcast_shape((left, right)),
+            )
+        elif isinstance(node, MatMul):
+            left = instructions[registers[id(node.left)]]
+            right = instructions[registers[id(node.right)]]
+            dimensions, shape = matmul_dimensions(left, right)
+            # A public operand, like a constant polynomial, is multiplied locally.
+            beaver = left.secret and right.secret
+            instruction = Instruction(
+                OP_MATMUL,
+                len(instructions),
+                (left.dest, right.dest),
+                value=dimensions,
+                secret=left.secret or right.secret,
+                round=max(left.round, right.round) + (1 if beaver else 0),
+                beaver=beaver,
+                shape=shape,
+            )
+        elif isinstance(node, Polynomial):
+            operand = instructions[registers[id(node.operand)]]
+            # Polynomials of degree 1 are linear, they are evaluated locally like public ones.
+            beaver = operand.secret and node.degree > 1
+            instruction = Instruction(
+                OP_POLYNOMIAL,
+                len(instructions),
+                (operand.dest,),
+                value=tuple(node.coeffs),
+                secret=operand.secret and node.degree > 0,
+                round=operand.round + (1 if beaver else 0),
+                beaver=beaver,
+                shape=operand.shape,
+            )
+        elif isinstance(node, InnerProduct):
+            left = instructions[registers[id(node.left)]]
+            right = instructions[registers[id(node.right)]]
+            if left.shape is None or left.shape != right.shape:
+                raise ValueError(f"Cannot compute the inner product of shapes {left.shape} and {right.shape}")
+            # A public operand, like a constant polynomial, only scales the shares.
+            beaver = left.secret and right.secret
+            instruction = Instruction(
+                OP_INNER_PRODUCT,
+                len(instructions),
+                (left.dest, right.dest),
+                value=left.length,
+                secret=left.secret or right.secret,
+                round=max(left.round, right.round) + (1 if beaver else 0),
+                beaver=beaver,
+                square=beaver and left.dest == right.dest,
+            )
+        else:
+            raise TypeError(f"Cannot compile expression of type {type(node).__name__}")
+
+        registers[id(node)] = instruction.dest
+        instructions.append(instruction)
+
+    return ExecutionPlan(instructions, len(instructions), registers[id(expr)])
@@ -11,7 +11,7 @@ MODIFY THIS FILE.
 
 import base64
 import random
-from typing import Optional
+from typing import List, Optional, Sequence
 
 
 ID_BYTES = 4
@@ -40,12 +40,14 @@ class Expression:
     
     def prec(self) -> int:
         """Returns the precedence of the expression."""
-        if isinstance(self, MultOperation):
+        if isinstance(self, (MultOperation, MatMul)):
             return 2
         elif isinstance(self, AddOperation):
             return 1
         elif isinstance(self, SubOperation):
             return 1
+        elif isinstance(self, LinearCombination):
+            return 1
         return 3
 
     def child_repr(self, child) -> str:
@@ -56,16 +58,83 @@ class Expression:
         return child_str
 
     def __add__(self, other):
+        if isinstance(other, LinearCombination):
+            return LinearCombination([1], [self]) + other
         return AddOperation(self, other)
 
+    def __radd__(self, other):
+        # Lets `sum(secrets)` build a single Sum node, starting from 0.
+        if not isinstance(other, int):
+            return NotImplemented
+        return Sum([self]) + other
+
     def __sub__(self, other):
+        if isinstance(other, LinearCombination):
+            return LinearCombination([1], [self]) - other
         return SubOperation(self, other);
 
     def __mul__(self, other):
+        if isinstance(self, Scalar) and isinstance(other, LinearCombination):
+            return other * self
         return MultOperation(self, other);
 
+    def __matmul__(self, other):
+        return MatMul(self, other)
+
+    def __pow__(self, exponent: int):
+        return Power(self, exponent)
+
+    def sum(self) -> "VectorSum":
+        """Returns the sum of the elements of a vector expression."""
+        return VectorSum(self)
+
+    def dot(self, other: "Expression") -> "InnerProduct":
+        """Returns the dot product of two vector expressions."""
+        return InnerProduct(self, other)
+
+    def children(self) -> Sequence["Expression"]:
+        """Returns the operands of the expression, none for terms."""
+        if self.is_term():
+            return ()
+        return (self.left, self.right)
+
+    def with_children(self, children: Sequence["Expression"]) -> "Expression":
+        """Returns a copy of the operation applied to other operands."""
+        return self.__class__(*children)
+
     def __hash__(self):
-        return hash(self.id)
+        return self.structural_hash()
+
+    def structural_hash(self) -> int:
+        """
+        Returns a hash of the structure of the expression.
+
+        Identical subtrees hash the same, also when the operands of an addition
+        or a multiplication are swapped. Secrets hash by their id. The hash is
+        computed without recursion and cached on every node.
+        """
+        stack = [self]
+        while stack:
+            node = stack[-1]
+            if getattr(node, "_structural_hash", None) is not None:
+                stack.pop()
+                continue
+            if node.is_term():
+                node._structural_hash = node.term_hash()
+                stack.pop()
+                continue
+            pending = [child for child in node.children() if getattr(child, "_structural_hash", None) is None]
+            if pending:
+                stack.extend(pending)
+                continue
+            node._structural_hash = node.operation_hash([child._structural_hash for child in node.children()])
+            stack.pop()
+        return self._structural_hash
+
+    def operation_hash(self, children_hashes: List[int]) -> int:
+        if isinstance(self, (AddOperation, MultOperation)):
+            children_hashes = sorted(children_hashes)
+        return hash((self.__class__.__name__,) + tuple(children_hashes))
 
     def is_term(self) -> bool:
         """Returns true iff the expression is a term."""
@@ -77,9 +146,8 @@ class Expression:
             print(" " * indent + "↳", self)
         else:
             print(self)
-        if not self.is_term():
-            self.left.print_tree_unix(indent + 2)
-            self.right.print_tree_unix(indent + 2)
+        for child in self.children():
+            child.print_tree_unix(indent + 2)
     
     def get_tree_lines(self):
         """Prints the experssion tree like a binary tree showing the left and right childs."""
@@ -91,6 +159,10 @@ class Expression:
             middle = width // 2
             return [line], width, height, middle
 
+        children = self.children()
+        if len(children) != 2:
+            return self.get_nary_tree_lines(children)
+
         # Two children.
         left, n, p, x = self.left.get_tree_lines()
         right, m, q, y = self.right.get_tree_lines()
@@ -106,6 +178,40 @@ class Expression:
         lines = [first_line, second_line] + [a + u * ' ' + b for a, b in zipped_lines]
         return lines, n + m + u, max(p, q) + 2, n + u // 2
     
+    def get_nary_tree_lines(self, children):
+        """Same as get_tree_lines, for operations with any number of children drawn side by side."""
+        blocks = [child.get_tree_lines() for child in children]
+        s = self.__repr__()
+        u = len(s)
+        offsets = []
+        position = 0
+        for _, width, _, _ in blocks:
+            offsets.append(position)
+            position += width + 1
+        width = max(position - 1, u)
+        middles = [offset + block[3] for offset, block in zip(offsets, blocks)]
+        start = min(max(0, (middles[0] + middles[-1]) // 2 - u // 2), width - u)
+
+        first_line = [' '] * width
+        for i in range(middles[0] + 1, middles[-1]):
+            first_line[i] = '_'
+        first_line[start:start + u] = s
+        second_line = [' '] * width
+        for middle in middles:
+            second_line[middle] = '|'
+        if len(middles) > 1:
+            second_line[middles[0]] = '/'
+            second_line[middles[-1]] = '\\'
+
+        height = max(block[2] for block in blocks)
+        lines = [''.join(first_line), ''.join(second_line)]
+        for row in range(height):
+            line = ' '.join(
+                block[0][row] if row < block[2] else block[1] * ' ' for block in blocks
+            )
+            lines.append(line + (width - len(line)) * ' ')
+        return lines, width, height + 2, start + u // 2
+
     def print_tree(self):
         lines, *_ = self.get_tree_lines()
         for line in lines:
@@ -129,8 +235,8 @@ class Scalar(Expression):
         return f"{self.__class__.__name__}({repr(self.value)})"
 
 
-    def __hash__(self):
-        return
+    def term_hash(self) -> int:
+        return hash((self.__class__.__name__, self.value))
 
     # Feel free to add as many methods as you like.
 
@@ -151,9 +257,58 @@ class Secret(Expression):
             f"{self.__class__.__name__}({self.value if self.value is not None else ''})"
         )
 
+    def term_hash(self) -> int:
+        return hash(self.id)
+
 
     # Feel free to add as many methods as you like.
 
+class SecretVector(Secret):
+    """
+    Term representing a vector of secret finite field values.
+
+    Operations on vectors are element-wise, scalars are broadcast to every
+    element. The value given in the value dictionary is a list of ints.
+    """
+
+    def __init__(
+            self,
+            length: int,
+            value: Optional[List[int]] = None,
+            id: Optional[bytes] = None
+        ):
+        self.length = length
+        self.shape = (length,)
+        super().__init__(value, id)
+
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.length})"
+
+
+class SecretMatrix(SecretVector):
+    """
+    Term representing a matrix of secret finite field values.
+
+    Element-wise operations behave like for vectors, `@` is the matrix product.
+    The value given in the value dictionary is a list of rows.
+    """
+
+    def __init__(
+            self,
+            rows: int,
+            cols: int,
+            value: Optional[List[List[int]]] = None,
+            id: Optional[bytes] = None
+        ):
+        super().__init__(rows * cols, value, id)
+        self.shape = (rows, cols)
+
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}{self.shape}"
+
+
 """ A simple class representing the addition of two variables"""
 class AddOperation(Expression):
     def __init__(self, operand1, operand2):
@@ -180,4 +335,242 @@ class MultOperation(Expression):
     def __repr__(self):
         return f"{self.child_repr(self.left)} * {self.child_repr(self.right)}"  
 
+class MatMul(Expression):
+    """Matrix product of two secret matrices, or of a secret vector and a secret matrix."""
+
+    def __init__(self, operand1, operand2):
+        self.left = operand1
+        self.right = operand2
+
+    def __repr__(self):
+        # The matrix product is not associative with the element-wise product.
+        right = repr(self.right) if self.right.prec() > self.prec() else f"({self.right!r})"
+        return f"{self.child_repr(self.left)} @ {right}"
+
+class InnerProduct(Expression):
+    """
+    Inner product of two secret vectors (or matrices, element by element).
+
+    Unlike `(x * y).sum()`, it consumes a single inner-product triplet,
+    whatever the length of the vectors.
+    """
+
+    def __init__(self, operand1, operand2):
+        self.left = operand1
+        self.right = operand2
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.left!r}, {self.right!r})"
+
+class Polynomial(Expression):
+    """
+    Polynomial `coeffs[0] + coeffs[1] * x + ... + coeffs[k] * x^k` of an
+    expression, with public integer coefficients.
+
+    It is evaluated with preprocessed shares of r, r^2, ..., r^k and a single
+    opening of x - r, so any degree costs one round.
+    """
+
+    def __init__(self, coeffs: Sequence[int], operand: Expression):
+        if not coeffs:
+            raise ValueError("A polynomial needs at least one coefficient")
+        self.coeffs = list(coeffs)
+        self.operand = operand
+
+    @property
+    def degree(self) -> int:
+        return len(self.coeffs) - 1
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.coeffs}, {self.operand!r})"
+
+    def children(self) -> Sequence[Expression]:
+        return (self.operand,)
+
+    def with_children(self, children: Sequence[Expression]) -> Expression:
+        return Polynomial(self.coeffs, *children)
+
+    def operation_hash(self, children_hashes: List[int]) -> int:
+        return hash((Polynomial.__name__, tuple(self.coeffs)) + tuple(children_hashes))
+
+
+class Power(Polynomial):
+    """Power `x^exponent` of an expression, a polynomial with a single coefficient."""
+
+    def __init__(self, operand: Expression, exponent: int):
+        if exponent < 0:
+            raise ValueError("Only non-negative exponents are supported")
+        super().__init__([0] * exponent + [1], operand)
+        self.exponent = exponent
+
+    def __repr__(self):
+        return f"{self.child_repr(self.operand)} ** {self.exponent}"
+
+    def with_children(self, children: Sequence[Expression]) -> Expression:
+        return Power(*children, self.exponent)
+
+class VectorSum(Expression):
+    """Sum of the elements of a vector expression."""
+
+    def __init__(self, operand: Expression):
+        self.operand = operand
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.operand!r})"
+
+    def children(self) -> Sequence[Expression]:
+        return (self.operand,)
+
+
+class LinearCombination(Expression):
+    """
+    Weighted sum `coeffs[0] * terms[0] + ... + coeffs[n-1] * terms[n-1] + constant`
+    of expressions, with public integer coefficients.
+
+    Adding or subtracting an expression, a scalar or a scalar multiple of an
+    expression to a linear combination extends it instead of creating a binary
+    operation, so `sum(secrets)` builds a single node that the parties
+    evaluate in one vectorized pass.
+    """
+
+    def __init__(
+            self,
+            coeffs: Sequence[int],
+            terms: Sequence[Expression],
+            constant: int = 0
+        ):
+        if len(coeffs) != len(terms):
+            raise ValueError("A linear combination needs one coefficient per term")
+        self._coeffs = list(coeffs)
+        self._terms = list(terms)
+        self._length = len(self._terms)
+        self.constant = constant
+
+    @property
+    def coeffs(self) -> List[int]:
+        if len(self._coeffs) == self._length:
+            return self._coeffs
+        return self._coeffs[:self._length]
+
+    @property
+    def terms(self) -> List[Expression]:
+        if len(self._terms) == self._length:
+            return self._terms
+        return self._terms[:self._length]
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __repr__(self):
+        result = ""
+        for coeff, term in zip(self.coeffs, self.terms):
+            if result:
+                result += " - " if coeff < 0 else " + "
+                coeff = abs(coeff)
+            result += self.term_repr(coeff, term)
+        if self.constant or not result:
+            if result:
+                result += f" - {Scalar(-self.constant)!r}" if self.constant < 0 else f" + {Scalar(self.constant)!r}"
+            else:
+                result = repr(Scalar(self.constant))
+        return result
+
+    @staticmethod
+    def term_repr(coeff: int, term: Expression) -> str:
+        """Returns the representation of a weighted term, as a multiplication."""
+        term_str = repr(term)
+        if coeff == 1:
+            return term_str
+        if term.prec() < 2:
+            term_str = f"({term_str})"
+        return f"Scalar({coeff}) * {term_str}"
+
+    def children(self) -> Sequence[Expression]:
+        return self.terms
+
+    def with_children(self, children: Sequence[Expression]) -> Expression:
+        return LinearCombination(self.coeffs, children, self.constant)
+
+    def operation_hash(self, children_hashes: List[int]) -> int:
+        return hash((
+            LinearCombination.__name__,
+            tuple(sorted(zip(children_hashes, self.coeffs))),
+            self.constant,
+        ))
+
+    def extended(self, coeffs: Sequence[int], terms: Sequence[Expression], constant: int = 0) -> "LinearCombination":
+        """Returns the combination with more terms and the constant increased."""
+        # Chains like `sum(secrets)` extend each partial result exactly once, so
+        # the term lists are shared with the extension when nothing was appended
+        # to them yet. This keeps building a sum of n terms linear in n.
+        if len(self._terms) == self._length:
+            new_coeffs, new_terms = self._coeffs, self._terms
+        else:
+            new_coeffs, new_terms = self.coeffs, self.terms
+        new_coeffs.extend(coeffs)
+        new_terms.extend(terms)
+
+        unit = type(self) is Sum and constant == 0 and all(coeff == 1 for coeff in coeffs)
+        result = Sum.__new__(Sum) if unit else LinearCombination.__new__(LinearCombination)
+        result._coeffs = new_coeffs
+        result._terms = new_terms
+        result._length = len(new_terms)
+        result.constant = self.constant + constant
+        return result
+
+    def scaled(self, factor: int) -> "LinearCombination":
+        """Returns the combination multiplied by a public factor."""
+        return LinearCombination(
+            [coeff * factor for coeff in self.coeffs], self.terms, self.constant * factor
+        )
+
+    def __add__(self, other):
+        return self._combine(other, 1)
+
+    def __radd__(self, other):
+        if not isinstance(other, int):
+            return NotImplemented
+        return self._combine(other, 1)
+
+    def __sub__(self, other):
+        return self._combine(other, -1)
+
+    def __rsub__(self, other):
+        if not isinstance(other, int):
+            return NotImplemented
+        return self.scaled(-1)._combine(other, 1)
+
+    def __mul__(self, other):
+        if isinstance(other, int):
+            return self.scaled(other)
+        if isinstance(other, Scalar):
+            return self.scaled(other.value)
+        return MultOperation(self, other)
+
+    def __rmul__(self, other):
+        if not isinstance(other, int):
+            return NotImplemented
+        return self.scaled(other)
+
+    def _combine(self, other, sign: int) -> "LinearCombination":
+        if isinstance(other, int):
+            return self.extended([], [], sign * other)
+        if isinstance(other, Scalar):
+            return self.extended([], [], sign * other.value)
+        if isinstance(other, LinearCombination):
+            coeffs = [sign * coeff for coeff in other.coeffs]
+            return self.extended(coeffs, other.terms, sign * other.constant)
+        if isinstance(other, MultOperation) and isinstance(other.left, Scalar):
+            return self.extended([sign * other.left.value], [other.right])
+        if isinstance(other, MultOperation) and isinstance(other.right, Scalar):
+            return self.extended([sign * other.right.value], [other.left])
+        return self.extended([sign], [other])
+
+
+class Sum(LinearCombination):
+    """Sum of any number of expressions."""
+
+    def __init__(self, terms: Sequence[Expression]):
+        super().__init__([1] * len(terms), terms)
+
 # Feel free to add as many classes as you like.
@@ -0,0 +1,286 @@
+"""
+Finite field backends.
+
+Shares are element-wise arrays over Z_q. How they are stored and reduced
+depends on the size of q, so the arithmetic goes through a Field:
+
+- PrimeField: primes below 2^31, held in int64 NumPy arrays. The product of
+  two reduced elements fits in 63 bits, so `%` is enough and shares can
+  reduce lazily (see `ShareVector`).
+- MersenneField: the Mersenne prime 2^61 - 1, held in uint64 NumPy arrays.
+  Products are split in 32-bit halves and reduced with shifts and adds,
+  since 2^61 = 1 mod q.
+- GmpyField: arbitrary moduli, held in object arrays of gmpy2 integers. It
+  needs the optional gmpy2 package.
+
+Scalar shares are plain Python ints, which work with every backend.
+
+Example:
+>>> field = MersenneField()
+>>> a = field.random(1000)
+>>> field.mul(a, field.array(2))
+"""
+
+from typing import (
+    Optional,
+    Tuple,
+    Union,
+)
+
+import numpy as np
+
+from randomness import RandomSource, default_source
+
+try:
+    import gmpy2
+except ImportError:
+    gmpy2 = None
+
+
+class Field:
+    """
+    Element-wise arithmetic over Z_q. Operands of the array operations are
+    reduced arrays of the field (see `array`) or public ints.
+
+    Attributes:
+        q: Modulus of the field
+        dtype: NumPy dtype of the arrays of elements
+        element_bytes: Size of an element on the wire
+        lazy: Whether int64 raw values below 2^62 can be reduced later,
+            see `ShareVector`
+    """
+
+    name = "field"
+    lazy = False
+
+    def __init__(self, q: int, dtype, element_bytes: int):
+        self.q = q
+        self.dtype = np.dtype(dtype)
+        self.element_bytes = element_bytes
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.q})"
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.q == other.q
+
+    def __hash__(self):
+        return hash((type(self), self.q))
+
+    def array(self, values) -> np.ndarray:
+        """Reduces public ints or arrays of any integer type into an array of the field."""
+        return np.asarray(np.asarray(values, dtype=object) % self.q, dtype=self.dtype)
+
+    def random(self, shape: Union[int, Tuple[int, ...]], source: Optional[RandomSource] = None) -> np.ndarray:
+        """Returns an array of the given shape of uniform elements."""
+        source = source or default_source
+        return source.field_elements(shape, self.q).astype(self.dtype)
+
+    def add(self, a, b) -> np.ndarray:
+        raise NotImplementedError
+
+    def sub(self, a, b) -> np.ndarray:
+        raise NotImplementedError
+
+    def neg(self, a) -> np.ndarray:
+        raise NotImplementedError
+
+    def mul(self, a, b) -> np.ndarray:
+        raise NotImplementedError
+
+    def sum(self, a, axis: Optional[int] = None) -> np.ndarray:
+        raise NotImplementedError
+
+    def matmul(self, a, b) -> np.ndarray:
+        raise NotImplementedError
+
+    def pack(self, values) -> bytes:
+        """Write elements as fixed-width little-endian integers."""
+        return np.asarray(values, dtype=self.dtype).astype(f"<u{self.element_bytes}").tobytes()
+
+    def unpack(self, buffer: bytes, count: int = -1, offset: int = 0) -> np.ndarray:
+        """Read fixed-width elements into an array of the field."""
+        return np.frombuffer(buffer, dtype=f"<u{self.element_bytes}", count=count, offset=offset).astype(self.dtype)
+
+
+class PrimeField(Field):
+    """Primes below 2^31 in int64 arrays, reduced with `%`."""
+
+    name = "prime"
+    lazy = True
+
+    def __init__(self, q: int):
+        if q >= 2 ** 31:
+            raise ValueError("PrimeField needs q < 2^31, use MersenneField or GmpyField")
+        super().__init__(q, np.int64, 4)
+
+    def array(self, values) -> np.ndarray:
+        values = np.asarray(values)
+        if values.dtype.kind in "iu" and values.dtype.itemsize <= 8 and values.dtype != np.uint64:
+            return values.astype(np.int64) % self.q
+        return super().array(values)
+
+    def add(self, a, b) -> np.ndarray:
+        return (np.asarray(a, dtype=np.int64) + b) % self.q
+
+    def sub(self, a, b) -> np.ndarray:
+        return (np.asarray(a, dtype=np.int64) - b) % self.q
+
+    def neg(self, a) -> np.ndarray:
+        return -np.asarray(a, dtype=np.int64) % self.q
+
+    def mul(self, a, b) -> np.ndarray:
+        return (np.asarray(a, dtype=np.int64) * b) % self.q
+
+    def sum(self, a, axis: Optional[int] = None) -> np.ndarray:
+        # Less than 2^32 reduced elements add up below 2^63.
+        return np.asarray(a, dtype=np.int64).sum(axis=axis) % self.q
+
+    def matmul(self, a, b) -> np.ndarray:
+        # Every entry of a product of two reduced matrices is below k * q^2,
+        # so the inner dimension is split into chunks whose products fit in int64.
+        a, b = np.asarray(a, dtype=np.int64), np.asarray(b, dtype=np.int64)
+        chunk = max(1, (2 ** 63 - 1) // (self.q - 1) ** 2)
+        k = a.shape[-1]
+        result = (a[..., :chunk] @ b[:chunk]) % self.q
+        for start in range(chunk, k, chunk):
+            result = (result + (a[..., start:start + chunk] @ b[start:start + chunk]) % self.q) % self.q
+        return result
+
+
+class MersenneField(Field):
+    """The Mersenne prime 2^61 - 1 in uint64 arrays, reduced with shifts and adds."""
+
+    name = "mersenne61"
+
+    MASK_32 = np.uint64(2 ** 32 - 1)
+    MASK_29 = np.uint64(2 ** 29 - 1)
+
+    def __init__(self):
+        super().__init__(2 ** 61 - 1, np.uint64, 8)
+        self._p = np.uint64(self.q)
+
+    def array(self, values) -> np.ndarray:
+        values = np.asarray(values)
+        if values.dtype.kind == "u" or (values.dtype.kind == "i" and values.size and values.min() >= 0):
+            return self._reduce(values.astype(np.uint64))
+        return super().array(values)
+
+    def _reduce(self, x: np.ndarray) -> np.ndarray:
+        """Reduces uint64 values: x = hi * 2^61 + lo = hi + lo mod q."""
+        x = (x & self._p) + (x >> np.uint64(61))
+        return x - (x >= self._p).astype(np.uint64) * self._p
+
+    def _operand(self, a) -> np.ndarray:
+        if isinstance(a, np.ndarray) and a.dtype == np.uint64:
+            return a
+        return self.array(a)
+
+    def add(self, a, b) -> np.ndarray:
+        # Both operands are below 2^61, their sum does not overflow.
+        return self._reduce(self._operand(a) + self._operand(b))
+
+    def sub(self, a, b) -> np.ndarray:
+        return self._reduce(self._operand(a) + (self._p - self._operand(b)))
+
+    def neg(self, a) -> np.ndarray:
+        return self._reduce(self._p - self._operand(a))
+
+    def mul(self, a, b) -> np.ndarray:
+        a, b = self._operand(a), self._operand(b)
+        shift_32 = np.uint64(32)
+        a_hi, a_lo = a >> shift_32, a & self.MASK_32
+        b_hi, b_lo = b >> shift_32, b & self.MASK_32
+        # a * b = hi * 2^64 + mid * 2^32 + lo, with 2^64 = 2^3 mod q.
+        high = (a_hi * b_hi) << np.uint64(3)
+        mid = a_hi * b_lo + a_lo * b_hi
+        # mid * 2^32 = (mid >> 29) * 2^61 + (mid & (2^29 - 1)) * 2^32 = (mid >> 29) + ... mod q
+        mid = (mid >> np.uint64(29)) + ((mid & self.MASK_29) << shift_32)
+        low = self._reduce(a_lo * b_lo)
+        return self._reduce(self._reduce(high + mid) + low)
+
+    def sum(self, a, axis: Optional[int] = None) -> np.ndarray:
+        # Sum the 32-bit halves separately so that the sums cannot overflow.
+        a = self._operand(a)
+        low = self._reduce((a & self.MASK_32).sum(axis=axis, dtype=np.uint64))
+        high = self._reduce((a >> np.uint64(32)).sum(axis=axis, dtype=np.uint64))
+        return self.add(self.mul(high, 2 ** 32), low)
+
+    def matmul(self, a, b) -> np.ndarray:
+        # Elements are split into three 21-bit limbs, so the products of limbs are below
+        # 2^42 and integer matrix products of up to 2^22 limbs fit in uint64. Each limb
+        # product is reduced and shifted back, memory stays that of the operands.
+        a, b = self._operand(a), self._operand(b)
+        bits, mask = 21, np.uint64(2 ** 21 - 1)
+        a_limbs = [(a >> np.uint64(bits * i)) & mask for i in range(3)]
+        b_limbs = [(b >> np.uint64(bits * j)) & mask for j in range(3)]
+        chunk = 2 ** 22
+        result = None
+        for start in range(0, max(a.shape[-1], 1), chunk):
+            for i, a_limb in enumerate(a_limbs):
+                for j, b_limb in enumerate(b_limbs):
+                    part = self._reduce(a_limb[..., start:start + chunk] @ b_limb[start:start + chunk])
+                    part = self.mul(part, pow(2, bits * (i + j), self.q))
+                    result = part if result is None else self.add(result, part)
+        return result
+
+
+class GmpyField(Field):
+    """Arbitrary moduli in object arrays of gmpy2 integers."""
+
+    name = "gmpy2"
+
+    def __init__(self, q: int):
+        if gmpy2 is None:
+            raise ImportError("GmpyField needs the gmpy2 package: pip install gmpy2")
+        super().__init__(q, object, (q.bit_length() + 7) // 8)
+        self._q = gmpy2.mpz(q)
+        self._mpz = np.frompyfunc(gmpy2.mpz, 1, 1)
+
+    def array(self, values) -> np.ndarray:
+        values = np.asarray(values, dtype=object)
+        return np.asarray(self._mpz(values) % self._q, dtype=object)
+
+    def random(self, shape: Union[int, Tuple[int, ...]], source: Optional[RandomSource] = None) -> np.ndarray:
+        source = source or default_source
+        count = int(np.prod(shape))
+        bits = (self.q - 1).bit_length()
+        accepted = []
+        # Rejection sampling on bits-wide integers, more than half of them are below q.
+        while len(accepted) < count:
+            chunk = source.bytes(self.element_bytes * (count - len(accepted)) * 2)
+            for start in range(0, len(chunk), self.element_bytes):
+                value = int.from_bytes(chunk[start:start + self.element_bytes], "little") >> (8 * self.element_bytes - bits)
+                if value < self.q and len(accepted) < count:
+                    accepted.append(gmpy2.mpz(value))
+        return np.array(accepted, dtype=object).reshape(shape)
+
+    def add(self, a, b) -> np.ndarray:
+        return (self.array(a) + self.array(b)) % self._q
+
+    def sub(self, a, b) -> np.ndarray:
+        return (self.array(a) - self.array(b)) % self._q
+
+    def neg(self, a) -> np.ndarray:
+        return -self.array(a) % self._q
+
+    def mul(self, a, b) -> np.ndarray:
+        return (self.array(a) * self.array(b)) % self._q
+
+    def sum(self, a, axis: Optional[int] = None) -> np.ndarray:
+        return np.asarray(self.array(a).sum(axis=axis) % self._q, dtype=object)
+
+    def matmul(self, a, b) -> np.ndarray:
+        return np.asarray((self.array(a) @ self.array(b)) % self._q, dtype=object)
+
+    def pack(self, values) -> bytes:
+        return b"".join(int(value).to_bytes(self.element_bytes, "little") for value in np.ravel(values))
+
+    def unpack(self, buffer: bytes, count: int = -1, offset: int = 0) -> np.ndarray:
+        if count < 0:
+            count = (len(buffer) - offset) // self.element_bytes
+        size = self.element_bytes
+        return np.array([
+            gmpy2.mpz(int.from_bytes(buffer[offset + i * size:offset + (i + 1) * size], "little"))
+            for i in range(count)
+        ], dtype=object)
@@ -0,0 +1,460 @@
+"""
+Optimization passes over arithmetic expressions.
+
+Every pass takes an expression and returns an equivalent one (over Z_q) that
+is cheaper to evaluate with SMC. The passes never recurse, so they can be run
+on arbitrarily deep expressions.
+
+Example:
+>>> expr, depth = reduce_tree_height(a * b * c * d)
+"""
+
+import heapq
+from typing import (
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+
+from compiler import compile_expression
+from expression import (
+    Expression,
+    Secret,
+    Scalar,
+    AddOperation,
+    InnerProduct,
+    LinearCombination,
+    MatMul,
+    MultOperation,
+    Polynomial,
+    SecretVector,
+    SubOperation,
+)
+from secret_sharing import default_q
+
+
+def optimize(expr: Expression, q: int = default_q) -> Expression:
+    """Runs all optimization passes on the expression, constants are computed mod q."""
+    expr = eliminate_common_subexpressions(expr, q)
+    expr = fold_constants(expr, q)
+    # Folding rebuilds the operands of products, share them again.
+    expr = eliminate_common_subexpressions(expr, q)
+    expr, _ = reduce_tree_height(expr)
+    return expr
+
+
+def multiplicative_depth(expr: Expression) -> int:
+    """Returns the number of Beaver multiplication rounds needed to evaluate the expression."""
+    return compile_expression(expr).depth
+
+
+def count_parents(expr: Expression) -> Dict[int, int]:
+    """Returns, for each node of the expression, the number of nodes using it as operand."""
+    parents: Dict[int, int] = {id(expr): 0}
+    stack = [expr]
+    while stack:
+        node = stack.pop()
+        for child in node.children():
+            if id(child) not in parents:
+                parents[id(child)] = 0
+                stack.append(child)
+            parents[id(child)] += 1
+    return parents
+
+
+def flatten_chain(node: Expression, parents: Dict[int, int]) -> List[Tuple[int, Expression]]:
+    """
+    Returns the operands of the product or sum chain rooted at the node.
+
+    Products are flattened into their factors and sums/differences into signed
+    terms `(sign, term)`. Nodes shared with other parts of the expression are
+    kept as operands, so that they are still evaluated once.
+    """
+    product = isinstance(node, MultOperation)
+    operands: List[Tuple[int, Expression]] = []
+    stack = [(1, node)]
+    while stack:
+        sign, current = stack.pop()
+        inner = current is node or parents[id(current)] == 1
+        if product and inner and isinstance(current, MultOperation):
+            stack.append((1, current.right))
+            stack.append((1, current.left))
+        elif not product and inner and isinstance(current, (AddOperation, SubOperation)):
+            right_sign = sign if isinstance(current, AddOperation) else -sign
+            stack.append((right_sign, current.right))
+            stack.append((sign, current.left))
+        else:
+            operands.append((sign, current))
+    return operands
+
+
+def balanced_sum(terms: List[Expression]) -> Expression:
+    """Adds the terms pairwise, giving a tree of logarithmic height."""
+    while len(terms) > 1:
+        paired = [AddOperation(terms[i], terms[i + 1]) for i in range(0, len(terms) - 1, 2)]
+        if len(terms) % 2 == 1:
+            paired.append(terms[-1])
+        terms = paired
+    return terms[0]
+
+
+def reduce_tree_height(expr: Expression) -> Tuple[Expression, int]:
+    """
+    Re-associate product and sum chains into balanced trees.
+
+    Secret factors of a product are combined two by two, always picking the
+    two of lowest multiplicative depth, so a chain of n products needs
+    ceil(log2(n)) rounds instead of n - 1. Public factors are multiplied
+    together and applied last, which is free. Sums are balanced too, with all
+    subtracted terms grouped in a single subtraction.
+
+    Returns the balanced expression with its multiplicative depth.
+    """
+    parents = count_parents(expr)
+    # Rebuilt node and (multiplicative depth, is secret) of every visited node.
+    rebuilt: Dict[int, Expression] = {}
+    info: Dict[int, Tuple[int, bool]] = {}
+
+    # Each entry is (node, operands), the operands are known once they were pushed.
+    stack: List[Tuple[Expression, Optional[List[Tuple[int, Expression]]]]] = [(expr, None)]
+    while stack:
+        node, operands = stack.pop()
+        if id(node) in rebuilt:
+            continue
+        if node.is_term():
+            rebuilt[id(node)] = node
+            info[id(node)] = (0, isinstance(node, Secret))
+            continue
+
+        if operands is None:
+            if isinstance(node, (MultOperation, AddOperation, SubOperation)):
+                operands = flatten_chain(node, parents)
+            else:
+                operands = [(1, child) for child in node.children()]
+            stack.append((node, operands))
+            stack.extend((operand, None) for _, operand in reversed(operands))
+            continue
+
+        if isinstance(node, MultOperation):
+            new_node = _balanced_product([rebuilt[id(operand)] for _, operand in operands], info)
+        elif isinstance(node, (AddOperation, SubOperation)):
+            positive = [rebuilt[id(operand)] for sign, operand in operands if sign > 0]
+            negative = [rebuilt[id(operand)] for sign, operand in operands if sign < 0]
+            if not negative:
+                new_node = balanced_sum(positive)
+            else:
+                minuend = balanced_sum(positive) if positive else Scalar(0)
+                new_node = SubOperation(minuend, balanced_sum(negative))
+            _annotate_sum(new_node, info)
+        else:
+            # Linear combinations, vector sums, matrix products...: only their operands are balanced.
+            children = [rebuilt[id(operand)] for _, operand in operands]
+            new_node = node if all(a is b for a, b in zip(children, node.children())) else node.with_children(children)
+            depths, secrets = zip(*(info[id(child)] for child in children)) if children else ((0,), (False,))
+            opens = isinstance(node, (MatMul, InnerProduct)) or (isinstance(node, Polynomial) and node.degree > 1)
+            # Constant polynomials are public, whatever their operand.
+            secret = any(secrets) and not (isinstance(node, Polynomial) and node.degree == 0)
+            info[id(new_node)] = (max(depths) + (1 if opens and all(secrets) else 0), secret)
+        rebuilt[id(node)] = new_node
+
+    balanced = rebuilt[id(expr)]
+    depth = info[id(balanced)][0]
+    print(f"Optimizer: tree height reduction, multiplicative depth {depth}")
+    return balanced, depth
+
+
+def _balanced_product(factors: List[Expression], info: Dict[int, Tuple[int, bool]]) -> Expression:
+    """Multiplies the factors, pairing the secret ones by increasing multiplicative depth."""
+    public = [factor for factor in factors if not info[id(factor)][1]]
+    # The counter keeps the order deterministic, all parties must build the same tree.
+    heap = [
+        (info[id(factor)][0], counter, factor)
+        for counter, factor in enumerate(factors) if info[id(factor)][1]
+    ]
+    heapq.heapify(heap)
+    counter = len(factors)
+    while len(heap) > 1:
+        left_depth, _, left = heapq.heappop(heap)
+        right_depth, _, right = heapq.heappop(heap)
+        product = MultOperation(left, right)
+        depth = max(left_depth, right_depth) + 1
+        info[id(product)] = (depth, True)
+        heapq.heappush(heap, (depth, counter, product))
+        counter += 1
+
+    result = None
+    for factor in public:
+        result = factor if result is None else MultOperation(result, factor)
+        info[id(result)] = (0, False)
+    if heap:
+        depth, _, secret_product = heap[0]
+        result = secret_product if result is None else MultOperation(secret_product, result)
+        info[id(result)] = (depth, True)
+    return result
+
+
+def _annotate_sum(node: Expression, info: Dict[int, Tuple[int, bool]]) -> None:
+    """Records depth and secrecy of the freshly built addition/subtraction nodes."""
+    stack = [(node, False)]
+    while stack:
+        current, children_done = stack.pop()
+        if id(current) in info:
+            continue
+        if current.is_term():
+            info[id(current)] = (0, isinstance(current, Secret))
+            continue
+        if not children_done:
+            stack.append((current, True))
+            stack.append((current.right, False))
+            stack.append((current.left, False))
+            continue
+        left_depth, left_secret = info[id(current.left)]
+        right_depth, right_secret = info[id(current.right)]
+        info[id(current)] = (max(left_depth, right_depth), left_secret or right_secret)
+
+
+class LinearForm:
+    """
+    An expression normalized as `sum(coefficient * atom) + constant` over Z_q.
+
+    Atoms are secrets and products of two non-constant expressions.
+
+    Attributes:
+        constant: Public additive constant
+        terms: Maps the identity of each atom to `[atom, coefficient]`
+        q: Modulus of the field
+        anchor: First vector or matrix atom of the form, None for scalar forms. It keeps
+            the shape of the form when its terms cancel out, like in `v - v`.
+    """
+
+    def __init__(
+            self,
+            constant: int = 0,
+            terms: Optional[Dict[int, List]] = None,
+            q: int = default_q,
+            anchor: Optional[Expression] = None
+        ):
+        self.q = q
+        self.constant = constant % q
+        self.terms: Dict[int, List] = terms if terms is not None else {}
+        self.anchor = anchor
+
+    @staticmethod
+    def of_atom(atom: Expression, q: int = default_q, vector: bool = False) -> "LinearForm":
+        return LinearForm(0, {id(atom): [atom, 1]}, q, atom if vector else None)
+
+    def is_constant(self) -> bool:
+        return not self.terms
+
+    def copy(self) -> "LinearForm":
+        return LinearForm(self.constant, {key: list(term) for key, term in self.terms.items()}, self.q, self.anchor)
+
+    def broadcast(self, other: "LinearForm") -> None:
+        """Takes the shape of the other form if this one is scalar, in place."""
+        if self.anchor is None:
+            self.anchor = other.anchor
+
+    def add(self, other: "LinearForm", sign: int = 1) -> None:
+        """Adds (sign = 1) or subtracts (sign = -1) the other form, in place."""
+        self.broadcast(other)
+        self.constant = (self.constant + sign * other.constant) % self.q
+        for key, (atom, coefficient) in other.terms.items():
+            if key in self.terms:
+                coefficient = (self.terms[key][1] + sign * coefficient) % self.q
+                if coefficient == 0:
+                    del self.terms[key]
+                else:
+                    self.terms[key][1] = coefficient
+            else:
+                self.terms[key] = [atom, (sign * coefficient) % self.q]
+
+    def scale(self, factor: int) -> None:
+        """Multiplies the form by a public factor, in place."""
+        factor %= self.q
+        self.constant = (self.constant * factor) % self.q
+        if factor == 0:
+            self.terms = {}
+        for term in self.terms.values():
+            term[1] = (term[1] * factor) % self.q
+
+    def to_expression(self, with_constant: bool = True) -> Expression:
+        """
+        Builds the expression. Sums become a single linear combination node,
+        with all the constants in one final adjustment.
+        """
+        constant = _signed(self.constant, self.q) if with_constant else 0
+        terms = list(self.terms.values())
+        if self.anchor is not None and id(self.anchor) not in self.terms:
+            # The vector terms cancelled out, a null term keeps the shape.
+            terms.append([self.anchor, 0])
+        if not terms:
+            return Scalar(constant)
+        if len(terms) == 1 and constant == 0:
+            (atom, coefficient), = terms
+            if coefficient <= self.q // 2:
+                return _scaled(atom, coefficient)
+        return LinearCombination(
+            [_signed(coefficient, self.q) for _, coefficient in terms],
+            [atom for atom, _ in terms],
+            constant,
+        )
+
+
+def _signed(value: int, q: int = default_q) -> int:
+    """Returns the representative of value mod q closest to 0."""
+    return value - q if value > q // 2 else value
+
+
+def _scaled(atom: Expression, coefficient: int) -> Expression:
+    return atom if coefficient == 1 else MultOperation(Scalar(coefficient), atom)
+
+
+def fold_constants(expr: Expression, q: int = default_q) -> Expression:
+    """
+    Fold all public computations of the expression at compile time.
+
+    The expression is rewritten as a linear combination of secrets and of
+    products of non-constant subexpressions: subtrees of scalars are computed
+    mod q, nested scalar multipliers are merged (`Scalar(3) * (Scalar(2) * s)`
+    becomes `Scalar(6) * s`), terms of the same atom are merged and products
+    are distributed over additive constants. All constants of a sum end up in
+    a single addition, applied once by the party holding the share of index 0.
+    """
+    parents = count_parents(expr)
+    forms: Dict[int, LinearForm] = {}
+
+    def operand_form(child: Expression) -> LinearForm:
+        # A form used by a single parent can be updated in place, this keeps
+        # long chains like `expr += Scalar(k)` linear.
+        if parents[id(child)] == 1:
+            return forms.pop(id(child))
+        return forms[id(child)].copy()
+
+    stack: List[Tuple[Expression, bool]] = [(expr, False)]
+    while stack:
+        node, children_done = stack.pop()
+        if id(node) in forms:
+            continue
+        if isinstance(node, Scalar):
+            forms[id(node)] = LinearForm(node.value, q=q)
+            continue
+        if isinstance(node, Secret):
+            forms[id(node)] = LinearForm.of_atom(node, q, isinstance(node, SecretVector))
+            continue
+        if not children_done:
+            stack.append((node, True))
+            stack.extend((child, False) for child in reversed(node.children()))
+            continue
+
+        if isinstance(node, LinearCombination):
+            form = LinearForm(node.constant, q=q)
+            for coeff, term in zip(node.coeffs, node.terms):
+                term_form = operand_form(term)
+                term_form.scale(coeff)
+                form.add(term_form)
+            forms[id(node)] = form
+            continue
+        if not isinstance(node, (AddOperation, SubOperation, MultOperation)):
+            # Other operations, like vector sums, are atoms with folded operands.
+            child_forms = [operand_form(child) for child in node.children()]
+            children = [form.to_expression() for form in child_forms]
+            atom = node
+            if any(new is not old for new, old in zip(children, node.children())):
+                atom = node.with_children(children)
+            # Polynomials keep the shape of their operand, sums and inner products are scalars.
+            vector = isinstance(node, MatMul) or (isinstance(node, Polynomial) and child_forms[0].anchor is not None)
+            forms[id(node)] = LinearForm.of_atom(atom, q, vector)
+            continue
+
+        left = operand_form(node.left)
+        right = operand_form(node.right)
+        if isinstance(node, AddOperation):
+            left.add(right)
+            form = left
+        elif isinstance(node, SubOperation):
+            left.add(right, -1)
+            form = left
+        elif left.is_constant():
+            right.scale(left.constant)
+            right.broadcast(left)
+            form = right
+        elif right.is_constant():
+            left.scale(right.constant)
+            left.broadcast(right)
+            form = left
+        else:
+            # (L + l) * (R + r) = L * R + r * L + l * R + l * r
+            product = MultOperation(
+                left.to_expression(with_constant=False),
+                right.to_expression(with_constant=False),
+            )
+            form = LinearForm.of_atom(product, q, left.anchor is not None or right.anchor is not None)
+            left_constant, right_constant = left.constant, right.constant
+            left.constant = right.constant = 0
+            if right_constant:
+                left.scale(right_constant)
+                form.add(left)
+            if left_constant:
+                right.scale(left_constant)
+                form.add(right)
+            form.constant = (left_constant * right_constant) % q
+        forms[id(node)] = form
+
+    form = forms[id(expr)]
+    print(f"Optimizer: constant folding, {len(parents)} nodes -> {len(form.terms)} terms")
+    folded = form.to_expression()
+    return folded
+
+
+def eliminate_common_subexpressions(expr: Expression, q: int = default_q) -> Expression:
+    """
+    Turn the expression tree into a DAG where identical subtrees are shared.
+
+    Nodes are hash-consed: every node is identified by its type and the
+    canonical numbers of its operands (sorted for additions and
+    multiplications, which commute), and only the first node of every class
+    is kept. The compiler evaluates a shared node once, so a repeated product
+    consumes a single Beaver triplet and a single opening.
+    """
+    # Canonical number of every visited node, number of every class and node of every number.
+    numbers: Dict[int, int] = {}
+    table: Dict[tuple, int] = {}
+    canonical: List[Expression] = []
+
+    stack: List[Tuple[Expression, bool]] = [(expr, False)]
+    while stack:
+        node, children_done = stack.pop()
+        if id(node) in numbers:
+            continue
+        if isinstance(node, Scalar):
+            key = ("scalar", node.value % q)
+        elif isinstance(node, Secret):
+            key = ("secret", node.id)
+        elif not children_done:
+            stack.append((node, True))
+            stack.extend((child, False) for child in reversed(node.children()))
+            continue
+        elif isinstance(node, Polynomial):
+            key = ("polynomial", tuple(c % q for c in node.coeffs), numbers[id(node.operand)])
+        elif isinstance(node, LinearCombination):
+            weighted = zip((numbers[id(term)] for term in node.terms), (c % q for c in node.coeffs))
+            key = ("linear", tuple(sorted(weighted)), node.constant % q)
+        else:
+            operands = tuple(numbers[id(child)] for child in node.children())
+            if isinstance(node, (AddOperation, MultOperation)):
+                operands = tuple(sorted(operands))
+            key = (node.__class__.__name__,) + operands
+
+        if key not in table:
+            representative = node
+            if not node.is_term():
+                children = [canonical[numbers[id(child)]] for child in node.children()]
+                if any(new is not old for new, old in zip(children, node.children())):
+                    representative = node.with_children(children)
+            table[key] = len(canonical)
+            canonical.append(representative)
+        numbers[id(node)] = table[key]
+
+    print(f"Optimizer: common subexpression elimination, {len(numbers)} -> {len(canonical)} nodes")
+    return canonical[numbers[id(expr)]]
@@ -8,19 +8,16 @@ from multiprocessing import Process, Queue
 import numpy as np
 import pytest
 import random
-import sys
 import os
-sys.setrecursionlimit(5000)
 
 
 from expression import Scalar, Secret
 from protocol import ProtocolSpec
 from server import run
 
+from secret_sharing import default_q
 from smc_party import SMCParty
 
-default_q = 520633 
-
 def smc_client(client_id, prot, value_dict, queue):
     cli = SMCParty(
         client_id,
@@ -0,0 +1,213 @@
+"""
+Push-based trusted server over asyncio.
+
+Every party keeps a single TCP connection to the server, on which both sides
+write frames (see `codec.encode_frame`). A retrieval is a subscription to a
+channel: the server answers it as soon as the message is stored, so nobody
+polls, and a single event loop serves hundreds of connected parties. The
+trusted parameters are generated in a thread pool, off the event loop.
+
+Frames sent by the parties, all fields are strings but `data`:
+
+    hello       client                      identifies the party, sent first
+    private     receiver, label, data       stores a private message
+    public      label, data                 publishes a message
+    get_private id, label                   subscribes to a private message
+    get_public  id, sender, label           subscribes to a public message
+    open        id, label, data             sends a share of a value to open, data
+                                            is packed field elements; answered with
+                                            the opened value once all shares are in
+    preprocess  id, data                    requests trusted parameters, data is
+                                            JSON as for POST /preprocessing
+
+The server answers subscriptions and requests with `message` frames (`id`,
+`data`), or `error` frames (`id`, `data` is the reason).
+
+Run it like server.py:
+
+    python push_server.py Alice Bob Charlie
+"""
+
+import asyncio
+import collections
+import json
+import sys
+
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+from codec import encode_frame, read_frame
+from field import Field
+from secret_sharing import serialize_share_batch
+from ttp import TrustedParamGenerator
+
+
+class PushServer:
+    """
+    Relay of the messages of the parties and interface to the trusted parameters.
+
+    Attributes:
+        ttp: Generator of the trusted parameters
+    """
+
+    def __init__(self, ttp: TrustedParamGenerator):
+        self.ttp = ttp
+        self.store: Dict[str, Dict[Tuple[str, str], bytes]] = collections.defaultdict(dict)
+        # Subscriptions waiting for a message, by pool and channel: the connections and request ids.
+        self.subscribers: Dict[Tuple[str, Tuple[str, str]], List[Tuple[asyncio.StreamWriter, str]]] = collections.defaultdict(list)
+        self.connections = 0
+        # Shares of the values being opened by label, then by sender, until every participant sent theirs.
+        self.openings: Dict[str, Dict[str, bytes]] = collections.defaultdict(dict)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Serve the frames of a party until it disconnects.
+        """
+        self.connections += 1
+        client_id = ""
+        try:
+            while True:
+                frame = await read_frame(reader)
+                request = {name: value.decode("utf-8") for name, value in frame.items() if name != "data"}
+                op = request["op"]
+                if op == "hello":
+                    client_id = request["client"]
+                    print(f"[ CONNECT  ] CLIENT {client_id}")
+                elif op == "private":
+                    print(f"[ SEND     ] SENDER {client_id} / LABEL {request['label']} / RECEIVER {request['receiver']}")
+                    self._set_value("private", (request["receiver"], request["label"]), frame["data"])
+                elif op == "public":
+                    print(f"[ PUBLISH  ] SENDER {client_id} / LABEL {request['label']}")
+                    self._set_value("public", (client_id, request["label"]), frame["data"])
+                elif op == "get_private":
+                    self._subscribe("private", (client_id, request["label"]), writer, request["id"])
+                elif op == "get_public":
+                    self._subscribe("public", (request["sender"], request["label"]), writer, request["id"])
+                elif op == "open" and client_id not in self.ttp.participant_ids:
+                    self._reply(writer, "error", request["id"], f"Unknown participant {client_id}".encode("utf-8"))
+                elif op == "open":
+                    print(f"[ OPEN     ] SENDER {client_id} / LABEL {request['label']}")
+                    self._subscribe("opened", ("", request["label"]), writer, request["id"])
+                    self._add_opening_share(client_id, request["label"], frame["data"])
+                elif op == "preprocess":
+                    # Do not hold the connection while the parameters are generated.
+                    asyncio.ensure_future(self._preprocess(client_id, frame["data"], writer, request["id"]))
+                else:
+                    self._reply(writer, "error", request.get("id", ""), f"Unknown operation {op}".encode("utf-8"))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.connections -= 1
+            self._unsubscribe(writer)
+            writer.close()
+            print(f"[ LEAVE    ] CLIENT {client_id}")
+
+    def _set_value(self, pool: str, channel: Tuple[str, str], data: bytes) -> None:
+        """
+        Store data on a channel in a given pool and push it to its subscribers.
+        """
+        self.store[pool][channel] = data
+        for writer, request_id in self.subscribers.pop((pool, channel), []):
+            self._reply(writer, "message", request_id, data)
+
+    def _add_opening_share(self, sender_id: str, label: str, data: bytes) -> None:
+        """
+        Add the share of a participant to a value being opened, and push the
+        sum of the shares once all the participants sent theirs. They all
+        subscribed to the opened value with their share, so it is not kept.
+        """
+        self.openings[label][sender_id] = data
+        if len(self.openings[label]) < len(self.ttp.participant_ids):
+            return
+        shares = self.openings.pop(label).values()
+        field = self.ttp.field
+        opened = field.sum(np.stack([field.unpack(share) for share in shares]), axis=0)
+        self._set_value("opened", ("", label), field.pack(opened))
+        del self.store["opened"][("", label)]
+
+    def _subscribe(self, pool: str, channel: Tuple[str, str], writer: asyncio.StreamWriter, request_id: str) -> None:
+        """
+        Send the data of a channel in a given pool once it is stored.
+        """
+        if channel in self.store[pool]:
+            self._reply(writer, "message", request_id, self.store[pool][channel])
+        else:
+            self.subscribers[(pool, channel)].append((writer, request_id))
+
+    def _unsubscribe(self, writer: asyncio.StreamWriter) -> None:
+        """
+        Drop the subscriptions of a closed connection.
+        """
+        for key in list(self.subscribers):
+            self.subscribers[key] = [entry for entry in self.subscribers[key] if entry[0] is not writer]
+            if not self.subscribers[key]:
+                del self.subscribers[key]
+
+    async def _preprocess(self, client_id: str, data: bytes, writer: asyncio.StreamWriter, request_id: str) -> None:
+        """
+        Generate the trusted parameters of many operations and send them labeled by op_id.
+        """
+        print(f"[ PREPROC  ] CLIENT {client_id}")
+        loop = asyncio.get_running_loop()
+        try:
+            batch = await loop.run_in_executor(None, self._serialize_preprocessing, client_id, data)
+        except Exception as error:
+            self._reply(writer, "error", request_id, str(error).encode("utf-8"))
+        else:
+            self._reply(writer, "message", request_id, batch)
+        await writer.drain()
+
+    def _serialize_preprocessing(self, client_id: str, data: bytes) -> bytes:
+        material = self.ttp.retrieve_preprocessing(client_id, json.loads(data))
+        return serialize_share_batch([(op_id, share) for op_id, shares in material for share in shares])
+
+    @staticmethod
+    def _reply(writer: asyncio.StreamWriter, op: str, request_id: str, data: bytes) -> None:
+        if not writer.is_closing():
+            writer.write(encode_frame({"op": op, "id": request_id, "data": data}))
+
+    async def serve(self, host: str, port: int) -> None:
+        """
+        Accept connections until cancelled.
+        """
+        # All the parties connect at once, keep room for them in the backlog.
+        server = await asyncio.start_server(self.handle_connection, host, port, backlog=1024)
+        print(f"Serving on tcp://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+def run(
+        host: str,
+        port: int,
+        participants: List[str],
+        field: Optional[Field] = None,
+        pool_size: Optional[int] = None,
+        refill_threshold: Optional[int] = None
+    ) -> None:
+    """
+    Register the participants, start the pool of triplets, then run the server.
+    The settings are the ones of `server.run`.
+    """
+    ttp = TrustedParamGenerator(field)
+    if pool_size is not None:
+        ttp.pool_size = pool_size
+        ttp.refill_threshold = pool_size // 4
+    if refill_threshold is not None:
+        ttp.refill_threshold = refill_threshold
+    for participant in participants:
+        ttp.add_participant(participant)
+    ttp.start_pool()
+    asyncio.run(PushServer(ttp).serve(host, port))
+
+
+def main(args: List[str]) -> None:
+    """
+    Entrypoint of the program.
+    """
+    run("localhost", 5001, args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,92 @@
+"""
+Bulk randomness for shares and Beaver triplets.
+
+Random bytes are drawn in large buffers, either from the OS CSPRNG or, given a
+seed, from a deterministic PRG (SHAKE-256 over the seed and a block counter).
+They are turned into uniform elements of Z_q with vectorized rejection
+sampling: every word is masked down to the bit length of q and the words that
+are still >= q are dropped, so there is no modulo bias.
+
+Example:
+>>> values = default_source.field_elements(1000, 520633)
+>>> same = RandomSource(b"seed").field_elements(10, 520633)
+"""
+
+import hashlib
+import os
+import threading
+from typing import (
+    Optional,
+    Tuple,
+    Union,
+)
+
+import numpy as np
+
+
+class RandomSource:
+    """
+    A buffered source of random bytes and field elements.
+
+    Attributes:
+        seed: Seed of the PRG, None to draw from the OS CSPRNG
+        buffer_size: Number of random bytes fetched at once
+    """
+
+    # Bytes of PRG output per block, i.e. per counter value.
+    BLOCK_SIZE = 1 << 16
+
+    def __init__(self, seed: Optional[bytes] = None, buffer_size: int = 1 << 16):
+        self.seed = seed
+        self.buffer_size = buffer_size
+        self._buffer = b""
+        self._position = 0
+        self._counter = 0
+        # The TTP can serve several clients at once.
+        self._lock = threading.Lock()
+
+    def _fill(self, size: int) -> bytes:
+        """Returns at least `size` fresh random bytes."""
+        if self.seed is None:
+            return os.urandom(size)
+        blocks = []
+        for _ in range(-(-size // RandomSource.BLOCK_SIZE)):
+            counter = self._counter.to_bytes(8, "little")
+            blocks.append(hashlib.shake_256(self.seed + counter).digest(RandomSource.BLOCK_SIZE))
+            self._counter += 1
+        return b"".join(blocks)
+
+    def bytes(self, size: int) -> bytes:
+        """Returns the next `size` random bytes."""
+        with self._lock:
+            available = len(self._buffer) - self._position
+            if available < size:
+                fresh = self._fill(max(self.buffer_size, size - available))
+                self._buffer = self._buffer[self._position:] + fresh
+                self._position = 0
+            chunk = self._buffer[self._position:self._position + size]
+            self._position += size
+            return chunk
+
+    def field_elements(self, shape: Union[int, Tuple[int, ...]], q: int) -> np.ndarray:
+        """Returns an int64 array of the given shape of uniform elements of Z_q."""
+        count = int(np.prod(shape))
+        bits = max(q - 1, 1).bit_length()
+        word = np.dtype("<u4") if bits <= 32 else np.dtype("<u8")
+        mask = (1 << bits) - 1
+        # At least half of the masked words are below q, draw a bit more than needed on average.
+        acceptance = q / (mask + 1)
+        accepted = []
+        missing = count
+        while missing > 0:
+            draws = int(missing / acceptance * 1.05) + 16
+            words = np.frombuffer(self.bytes(draws * word.itemsize), dtype=word) & word.type(mask)
+            kept = words[words < q][:missing]
+            accepted.append(kept)
+            missing -= len(kept)
+        values = np.concatenate(accepted) if accepted else np.zeros(0, dtype=word)
+        return values.astype(np.int64).reshape(shape)
+
+
+# Shared source of the process, backed by the OS CSPRNG.
+default_source = RandomSource()
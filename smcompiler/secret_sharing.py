@@ -4,11 +4,15 @@ Secret sharing scheme.
 
 from __future__ import annotations
 import random
-import sys
 
 import base64
-from typing import List, Optional
+from typing import Dict, List, Optional, Sequence, Tuple, Union
 
+import numpy as np
+
+import codec
+from field import Field, PrimeField
+from randomness import RandomSource, default_source
 from expression import Scalar
 ID_BYTES = 4
 
@@ -21,75 +25,95 @@ def gen_id() -> bytes:
 
 # NOTE: Keep this large enough to pass the tests.
 default_q = 520633 
+default_field = PrimeField(default_q)
 
 
-def rand_Zq(q=default_q):
-    """Returns a random element from Z_q."""
-    return random.randint(0, q - 1)
-
 class Share:
     """
     A secret share in a finite field.
+
+    Shares are slotted and intermediate results never need an id, so it is
+    only generated when it is read. The binary wire format does not carry it. The state of a
+    Beaver multiplication lives in a BeaverState, not on the shares.
     """
 
-    def __init__(self, index, value, id: Optional[bytes] = None, beaver_triplets: Optional[List[Share]] = None):
+    __slots__ = ("index", "value", "field", "_id")
+
+    # Operations with public NumPy vectors go through the share operators, not element-wise.
+    __array_ufunc__ = None
+
+    def __init__(self, index, value, id: Optional[bytes] = None, field: Optional[Field] = None):
         self.index = index
-        self.value = value % default_q
-        if id is None:
-            id = gen_id()
-        self.id = id
-        self.beaver_triplets = beaver_triplets
-        self.d:int = None
-        self.e:int = None
+        self.field = field or default_field
+        self.value = int(value) % self.field.q
+        self._id = id
+
+    @property
+    def id(self) -> bytes:
+        if self._id is None:
+            self._id = gen_id()
+        return self._id
+
+    @id.setter
+    def id(self, id: Optional[bytes]):
+        self._id = id
 
     def __repr__(self):
         # Helps with debugging.
         return f"Share({self.id}, {self.index}, {self.value})"
 
+    def _broadcast(self, public: np.ndarray) -> ShareVector:
+        """This share repeated over the length of a public vector."""
+        return ShareVector(self.index, np.full(len(public), self.value), field=self.field)
+
     def __add__(self, other):
+        if isinstance(other, ShareVector):
+            return NotImplemented
+        if isinstance(other, np.ndarray):
+            return self._broadcast(other) + other
         if isinstance(other, int):
             if self.index == 0:
-                return Share(0, self.value + other)
-            return Share(self.index, self.value)    
+                return Share(0, self.value + other, field=self.field)
+            return Share(self.index, self.value, field=self.field)
         #else, both elements are shares
-        return Share(self.index, self.value + other.value)     
+        return Share(self.index, self.value + other.value, field=self.field)
     
     def __sub__(self, other):
+        if isinstance(other, ShareVector):
+            return NotImplemented
+        if isinstance(other, np.ndarray):
+            return self._broadcast(other) - other
         if isinstance(other, int):
             if self.index == 0:
-                return Share(0, self.value - other)
-            return Share(self.index, self.value)    
+                return Share(0, self.value - other, field=self.field)
+            return Share(self.index, self.value, field=self.field)
         #else, both elements are shares
-        return Share(self.index, self.value - other.value)
+        return Share(self.index, self.value - other.value, field=self.field)
     
     def __mul__(self, other):
-        if isinstance(other, int):
-            return Share(self.index, self.value * other)
-        else:
-            if(self.d is None): raise ValueError("d is not set, should NEVER happen")
-            if(self.e is None): raise ValueError("e is not set, should NEVER happen")
-            # Locally compute share of [sv] = de + d[b] + e[a] + [c]
-            a_share = self.beaver_triplets[0]
-            b_share = self.beaver_triplets[1]
-            c_share = self.beaver_triplets[2]
-            new_value = (c_share + self.d*self.e + b_share*self.d + a_share*self.e)
-            return Share(self.index, new_value.value)
+        if isinstance(other, (Share, ShareVector)):
+            raise ValueError("Multiplying two shares needs a Beaver triplet, see BeaverState")
+        if isinstance(other, np.ndarray):
+            return self._broadcast(other) * other
+        return Share(self.index, self.value * other, field=self.field)
 
     # Override reverse add
     def __radd__(self, other):
-        if(not isinstance(other, int)): raise ValueError("Should not happen")
+        if(not isinstance(other, (int, np.ndarray))): raise ValueError("Should not happen")
         return self.__add__(other)
     
     # Override reverse sub
     def __rsub__(self, other):
+        if isinstance(other, np.ndarray):
+            return other - self._broadcast(other)
         if(not isinstance(other, int)): raise ValueError("Should not happen")
         if self.index == 0:
-            return Share(0, other - self.value)
-        return Share(self.index, 0-self.value)   
+            return Share(0, other - self.value, field=self.field)
+        return Share(self.index, 0-self.value, field=self.field)
 
     # Override reverse mul
     def __rmul__(self, other):
-        if(not isinstance(other, int)): raise ValueError("Should not happen")
+        if(not isinstance(other, (int, np.ndarray))): raise ValueError("Should not happen")
         return self.__mul__(other) 
 
     def serialize(self):
@@ -98,42 +122,475 @@ class Share:
         return s
     
     def serialize_bytes(self):
-        """Convert object to a serialized representation."""
-        s = f"{self.index}|{self.value}|{self.id}"
-        return s.encode('utf-8')
+        """Convert object to its binary wire representation: magic, index and value."""
+        return codec.SCALAR_HEADER.pack(codec.MAGIC_SCALAR, self.index) + self.field.pack([self.value])
 
     @staticmethod
-    def deserialize(serialized) -> Share:
+    def deserialize(serialized, field: Optional[Field] = None) -> Share:
         """Restore object from its serialized representation."""
         index, value, id = serialized.split("|")
-        return Share(int(index), int(value), id=id)
+        return Share(int(index), int(value), id=id, field=field)
 
     @staticmethod
-    def deserialize_bytes(serialized) -> Share:
-        """Restore object from its serialized representation."""
-        index, value, id = serialized.split(b"|")
-        return Share(int(index), int(value), id=id.decode('utf-8'))
+    def deserialize_bytes(serialized, field: Optional[Field] = None) -> Share:
+        """Restore object from its binary wire representation."""
+        field = field or default_field
+        _, index = codec.SCALAR_HEADER.unpack_from(serialized)
+        return Share(index, int(field.unpack(serialized, 1, codec.SCALAR_HEADER.size)[0]), field=field)
+
+
+
+class ShareVector:
+    """
+    A vector of secret shares in a finite field, held by a single party.
+
+    The values live in a contiguous NumPy array of the field. Public operands
+    (ints and NumPy arrays) and scalar shares are broadcast element-wise.
+
+    With a PrimeField the values are int64 and q < 2^31, so the product of
+    two reduced values fits in 63 bits, and reduction mod q is lazy:
+    additions and subtractions keep a bound on the magnitude of the raw
+    values and only reduce once it could overflow, or when the reduced values
+    are read through `value`. Other fields reduce after every operation. The
+    whole vector is serialized as one binary payload.
+    """
+
+    __slots__ = ("index", "id", "field", "_value", "_bound")
+
+    # Operations with public NumPy vectors go through the share operators, not element-wise.
+    __array_ufunc__ = None
+
+    # Leading bytes and header of a serialized vector.
+    MAGIC = codec.MAGIC_VECTOR
+    HEADER = codec.VECTOR_HEADER
+    # Raw values stay below this bound in absolute value.
+    LAZY_BOUND = 2 ** 62
+
+    def __init__(
+            self,
+            index,
+            value,
+            id: Optional[bytes] = None,
+            bound: Optional[int] = None,
+            field: Optional[Field] = None
+        ):
+        self.index = index
+        self.id = id
+        self.field = field or default_field
+        if bound is None:
+            # Values of unknown magnitude are reduced right away.
+            self._value = self.field.array(value)
+            self._bound = self.field.q
+        else:
+            self._value = value
+            self._bound = bound
+
+    @property
+    def value(self) -> np.ndarray:
+        """The values reduced mod q."""
+        # Raw values within q may still be negative, after a negation for instance.
+        if self._bound > self.field.q or (self.field.lazy and (self._value < 0).any()):
+            self._value = self._value % self.field.q
+            self._bound = self.field.q
+        return self._value
+
+    def __repr__(self):
+        # Helps with debugging.
+        return f"ShareVector({self.id}, {self.index}, {self.value})"
+
+    def __len__(self):
+        return len(self._value)
+
+    @staticmethod
+    def public(value, field: Optional[Field] = None) -> np.ndarray:
+        """Reduces a public int or array mod q, so that the arithmetic of the field cannot overflow."""
+        return (field or default_field).array(value)
+
+    def _reduced(self, value) -> ShareVector:
+        """A vector of this party holding already reduced values."""
+        return ShareVector(self.index, value, bound=self.field.q, field=self.field)
+
+    def _raw(self, other_bound: int) -> Tuple[np.ndarray, int]:
+        """Raw values and their bound, reduced first if adding `other_bound` could overflow."""
+        if self._bound + other_bound >= ShareVector.LAZY_BOUND:
+            return self.value, self.field.q
+        return self._value, self._bound
+
+    def _combine(self, other, sign: int) -> ShareVector:
+        """self + sign * other, without reducing if the field allows it."""
+        q = self.field.q
+        if isinstance(other, ShareVector):
+            other_value, other_bound = other._raw(q) if self.field.lazy else (other.value, q)
+        elif isinstance(other, Share):
+            other_value, other_bound = other.value, q
+        elif self.index == 0:
+            # Public value, only added once.
+            other_value, other_bound = ShareVector.public(other, self.field), q
+        else:
+            return ShareVector(self.index, self._value, bound=self._bound, field=self.field)
+        if not self.field.lazy:
+            combine = self.field.add if sign > 0 else self.field.sub
+            return self._reduced(combine(self.value, other_value))
+        value, bound = self._raw(other_bound)
+        return ShareVector(self.index, value + sign * other_value, bound=bound + other_bound, field=self.field)
+
+    def __add__(self, other):
+        return self._combine(other, 1)
+
+    def __sub__(self, other):
+        return self._combine(other, -1)
+
+    def __mul__(self, other):
+        if isinstance(other, (Share, ShareVector)):
+            raise ValueError("Multiplying two shares needs a Beaver triplet, see beaver_multiply")
+        q = self.field.q
+        if not self.field.lazy:
+            return self._reduced(self.field.mul(self.value, ShareVector.public(other, self.field)))
+        # The factor is reduced below q, so the raw values may only need a reduction first.
+        if self._bound >= ShareVector.LAZY_BOUND // q:
+            value, bound = self.value, q
+        else:
+            value, bound = self._value, self._bound
+        return ShareVector(self.index, value * ShareVector.public(other, self.field), bound=bound * q, field=self.field)
+
+    def __radd__(self, other):
+        return self.__add__(other)
+
+    def __rsub__(self, other):
+        return (-self)._combine(other, 1)
+
+    def __rmul__(self, other):
+        return self.__mul__(other)
+
+    def __neg__(self):
+        if not self.field.lazy:
+            return self._reduced(self.field.neg(self.value))
+        # The negated values are in (-bound, 0], the larger bound forces their reduction on read.
+        return ShareVector(self.index, -self._value, bound=self._bound + self.field.q, field=self.field)
+
+    def serialize_bytes(self):
+        """Convert object to a binary representation: header, then fixed-width field elements."""
+        header = ShareVector.HEADER.pack(ShareVector.MAGIC, self.index, len(self))
+        return header + self.field.pack(self.value)
+
+    @staticmethod
+    def deserialize_bytes(serialized, field: Optional[Field] = None) -> ShareVector:
+        """Restore object from its binary representation."""
+        field = field or default_field
+        _, index, length = ShareVector.HEADER.unpack_from(serialized)
+        values = field.unpack(serialized, length, ShareVector.HEADER.size)
+        return ShareVector(index, values, bound=field.q, field=field)
+
+
+class SeededShareVector:
+    """
+    A vector of pseudo-random secret shares, sent as the seed it is expanded from.
+
+    All but one party of a seed-compressed sharing receive one of these
+    instead of a full ShareVector: whatever the length of the vector, only
+    the header and a SEED_BYTES seed go on the wire. The receiver expands it
+    back with `expand`.
+    """
+
+    __slots__ = ("index", "id", "seed", "length", "field")
+
+    MAGIC = codec.MAGIC_SEEDED
+    HEADER = codec.SEEDED_HEADER
+    SEED_BYTES = 16
+
+    def __init__(
+            self,
+            index,
+            seed: bytes,
+            length: int,
+            id: Optional[bytes] = None,
+            field: Optional[Field] = None
+        ):
+        self.index = index
+        self.id = id
+        self.seed = seed
+        self.length = length
+        self.field = field or default_field
+
+    def __repr__(self):
+        # Helps with debugging.
+        return f"SeededShareVector({self.id}, {self.index}, {self.length} elements)"
+
+    def __len__(self):
+        return self.length
+
+    def expand(self) -> ShareVector:
+        """Expand the seed into the shares it stands for."""
+        values = prg_expand(self.seed, self.length, self.field)
+        return ShareVector(self.index, values, id=self.id, bound=self.field.q, field=self.field)
+
+    def serialize_bytes(self):
+        """Convert object to a binary representation: header, then the seed."""
+        return SeededShareVector.HEADER.pack(SeededShareVector.MAGIC, self.index, self.length) + self.seed
+
+    @staticmethod
+    def deserialize_bytes(serialized, field: Optional[Field] = None) -> SeededShareVector:
+        """Restore object from its binary representation."""
+        _, index, length = SeededShareVector.HEADER.unpack_from(serialized)
+        return SeededShareVector(index, bytes(serialized[SeededShareVector.HEADER.size:]), length, field=field)
+
+
+def prg_expand(seed: bytes, length: int, field: Optional[Field] = None) -> np.ndarray:
+    """
+    Expand a seed into `length` pseudo-random elements of Z_q.
+
+    The seed keys a RandomSource, so the elements are drawn with the same
+    rejection sampling as fresh randomness.
+    """
+    return (field or default_field).random(length, RandomSource(seed))
+
+
+def deserialize_share(serialized: bytes, field: Optional[Field] = None) -> Union[Share, ShareVector]:
+    """Restore a share or a vector of shares from its serialized representation."""
+    if serialized.startswith(ShareVector.MAGIC):
+        return ShareVector.deserialize_bytes(serialized, field)
+    if serialized.startswith(SeededShareVector.MAGIC):
+        return SeededShareVector.deserialize_bytes(serialized, field).expand()
+    return Share.deserialize_bytes(serialized, field)
+
+
+def serialize_share_batch(shares: List[Tuple[str, Union[Share, ShareVector]]]) -> bytes:
+    """Serialize many labeled shares into a single batch envelope."""
+    return codec.encode_envelope([(label, share.serialize_bytes()) for label, share in shares])
+
 
+def deserialize_share_batch(
+        serialized: bytes,
+        field: Optional[Field] = None
+    ) -> List[Tuple[str, Union[Share, ShareVector]]]:
+    """Restore the labeled shares of a batch envelope, in order."""
+    return [(label, deserialize_share(payload, field)) for label, payload in codec.decode_envelope(serialized)]
 
 
-def gen_share(secret: int, num_shares: int, secret_id: Optional[bytes] = None) -> List[Share]:
+def group_share_batch(
+        shares: List[Tuple[str, Union[Share, ShareVector]]]
+    ) -> Dict[str, Tuple[Union[Share, ShareVector], ...]]:
+    """Group the shares of a batch by label, in order."""
+    groups: Dict[str, list] = {}
+    for label, share in shares:
+        groups.setdefault(label, []).append(share)
+    return {label: tuple(group) for label, group in groups.items()}
+
+
+def gen_share(
+        secret: int,
+        num_shares: int,
+        secret_id: Optional[bytes] = None,
+        field: Optional[Field] = None
+    ) -> List[Share]:
     """ Given a secret and the number of participants in the SMC protocol,
     generate the secret shares.
     """
+    field = field or default_field
     # Calculate s_i for i \in [1, N-1]
-    share_values = [rand_Zq() for _ in range(num_shares - 1)]
+    share_values = [int(value) for value in field.random(num_shares - 1)]
     # Calculate s_0 and prepend.
-    share_values = [(secret - sum(share_values)) % default_q] + share_values
+    share_values = [(secret - sum(share_values)) % field.q] + share_values
     # Return the shares s_0, s_1, ..., s_{N-1}
     if secret_id is not None:
-        return [Share(i, s, id=secret_id) for i, s in enumerate(share_values)]
-    return [Share(i, s) for i, s in enumerate(share_values)]
+        return [Share(i, s, id=secret_id, field=field) for i, s in enumerate(share_values)]
+    return [Share(i, s, field=field) for i, s in enumerate(share_values)]
     
 
+def gen_share_batch(secrets: Sequence[int], num_shares: int, field: Optional[Field] = None) -> List[ShareVector]:
+    """ Bulk equivalent of gen_share: share many secrets at once.
+    Returns the ShareVector of every participant, whose element i is its share of secrets[i].
+    """
+    field = field or default_field
+    secrets = field.array(secrets).ravel()
+    # Calculate s_i for i \in [1, N-1], one row per participant
+    share_values = field.random((num_shares - 1, len(secrets)))
+    # Calculate s_0 and prepend.
+    first = field.sub(secrets, field.sum(share_values, axis=0))
+    return [ShareVector(0, first, bound=field.q, field=field)] + [
+        ShareVector(i + 1, s, bound=field.q, field=field) for i, s in enumerate(share_values)
+    ]
+
+
+def gen_vector_share(
+        secret: List[int],
+        num_shares: int,
+        secret_id: Optional[bytes] = None,
+        field: Optional[Field] = None
+    ) -> List[ShareVector]:
+    """ Given a vector secret and the number of participants in the SMC protocol,
+    generate the shares of every element at once. Matrices are shared flat, row by row.
+    """
+    shares = gen_share_batch(secret, num_shares, field)
+    for share in shares:
+        share.id = secret_id
+    return shares
+
+
+def gen_seeded_vector_share(
+        secret: List[int],
+        num_shares: int,
+        secret_id: Optional[bytes] = None,
+        field: Optional[Field] = None
+    ) -> List[Union[ShareVector, SeededShareVector]]:
+    """ Seed-compressed equivalent of gen_vector_share. The shares of the
+    participants 1 to N-1 are expanded from fresh random seeds, and only the
+    participant 0 receives an explicit correction share.
+    """
+    field = field or default_field
+    secret = field.array(secret).ravel()
+    seeded = [
+        SeededShareVector(
+            i, default_source.bytes(SeededShareVector.SEED_BYTES), len(secret), id=secret_id, field=field
+        )
+        for i in range(1, num_shares)
+    ]
+    # Calculate s_0 so that all the shares sum to the secret.
+    first = secret
+    for share in seeded:
+        first = field.sub(first, share.expand().value)
+    return [ShareVector(0, first, id=secret_id, bound=field.q, field=field)] + seeded
+
+
 def reconstruct_shares(shares: List[Share]) -> int:
     """Reconstruct the secret from shares."""
     print("TO RECONSTRUCT: ", shares)
-    return sum([s.value for s in shares]) % default_q
+    if shares and isinstance(shares[0], ShareVector):
+        return reconstruct_share_batch(shares)
+    q = shares[0].field.q if shares else default_q
+    return sum([s.value for s in shares]) % q
+
+
+def reconstruct_share_batch(shares: List[ShareVector]) -> np.ndarray:
+    """ Bulk equivalent of reconstruct_shares: reconstruct every element of
+    the ShareVectors of all participants at once.
+    """
+    return shares[0].field.sum(np.stack([share.value for share in shares]), axis=0)
+
+
+def beaver_multiply(index: int, triplet, d, e):
+    """
+    Locally compute the share of x * y = de + d[b] + e[a] + [c], given the
+    shares of the triplet (a, b, c = ab) and the opened d = x - a and e = y - b.
+
+    d and e are ints for scalars and NumPy arrays for vectors. The public de
+    term is only added by the party of share index 0.
+    """
+    a, b, c = triplet
+    field = c.field
+    if isinstance(c, ShareVector):
+        value = field.add(c.value, field.add(field.mul(b.value, d), field.mul(a.value, e)))
+        if index == 0:
+            value = field.add(value, field.mul(d, e))
+        return ShareVector(index, value, bound=field.q, field=field)
+    value = c.value + b.value * d + a.value * e
+    if index == 0:
+        value = value + d * e
+    return Share(index, value, field=field)
+
+class BeaverState:
+    """
+    A Beaver multiplication in progress: the shares of the triplet (a, b, c)
+    and, once they are opened, d = x - a and e = y - b.
+    """
+
+    __slots__ = ("triplet", "d", "e")
+
+    def __init__(self, triplet, d=None, e=None):
+        self.triplet = triplet
+        self.d = d
+        self.e = e
+
+    def multiply(self, index: int):
+        """Locally compute the share of the product, see beaver_multiply."""
+        if self.d is None or self.e is None:
+            raise ValueError("d and e must be opened before multiplying")
+        return beaver_multiply(index, self.triplet, self.d, self.e)
+
+def beaver_square(index: int, pair, d):
+    """
+    Locally compute the share of x^2 = d^2 + 2d[a] + [a^2], given the shares
+    of the square pair (a, a^2) and the opened d = x - a. Only d is opened,
+    instead of both d and e for a triplet.
+    """
+    a, a_squared = pair
+    field = a.field
+    if isinstance(a, ShareVector):
+        value = field.add(a_squared.value, field.mul(field.mul(d, 2), a.value))
+        if index == 0:
+            value = field.add(value, field.mul(d, d))
+        return ShareVector(index, value, bound=field.q, field=field)
+    value = a_squared.value + 2 * d * a.value
+    if index == 0:
+        value = value + d * d
+    return Share(index, value, field=field)
+
+def polynomial_coefficients(coeffs: List[int], d, field: Optional[Field] = None):
+    """
+    Rewrite the polynomial sum_j coeffs[j] x^j in the powers of r, with x = d + r:
+    returns the public a_0, ..., a_k with sum_j coeffs[j] (d + r)^j = sum_i a_i r^i.
+
+    a_i = sum_{j >= i} coeffs[j] * binomial(j, i) * d^(j - i), computed
+    element-wise when d is a vector.
+    """
+    field = field or default_field
+    if isinstance(d, np.ndarray):
+        add, mul = field.add, field.mul
+    else:
+        add = lambda a, b: (a + b) % field.q
+        mul = lambda a, b: (a * b) % field.q
+    # Horner: p(x) = (...(c_k x + c_{k-1}) x + ...) x + c_0, where multiplying
+    # by x = d + r maps a_i to d * a_i + a_{i-1}.
+    result = [coeffs[-1] % field.q]
+    for coeff in reversed(coeffs[:-1]):
+        shifted = [0] + result
+        result = [add(mul(a, d), b) for a, b in zip(result + [0], shifted)]
+        result[0] = add(result[0], coeff % field.q)
+    return result
+
+def beaver_polynomial(index: int, powers, d, coeffs: List[int]):
+    """
+    Locally compute the share of sum_j coeffs[j] x^j, given the shares of the
+    powers r, r^2, ..., r^k and the opened d = x - r. The public a_0 is only
+    added by the party of share index 0.
+    """
+    field = powers[0].field
+    a = polynomial_coefficients(coeffs, d, field)
+    if isinstance(powers[0], ShareVector):
+        value = field.array(0)
+        for a_i, power in zip(a[1:], powers):
+            value = field.add(value, field.mul(a_i, power.value))
+        if index == 0:
+            value = field.add(value, a[0])
+        return ShareVector(index, value, bound=field.q, field=field)
+    value = sum((a_i * power.value for a_i, power in zip(a[1:], powers)), 0)
+    if index == 0:
+        value = value + a[0]
+    return Share(index, value, field=field)
+
+def beaver_matmul(index: int, triplet, d, e, dimensions: Tuple[int, int, int]) -> ShareVector:
+    """
+    Locally compute the share of X @ Y = DE + D[B] + [A]E + [C], given the
+    shares of the matrix triplet (A, B, C = AB) and the opened D = X - A and
+    E = Y - B. Shares and opened values are flat, `dimensions` is `(m, k, n)`
+    for an m x k times k x n product.
+    """
+    m, k, n = dimensions
+    field = triplet[0].field
+    a, b, c = (share.value for share in triplet)
+    d, e = d.reshape(m, k), e.reshape(k, n)
+    value = field.add(c.reshape(m, n), field.add(field.matmul(d, b.reshape(k, n)), field.matmul(a.reshape(m, k), e)))
+    if index == 0:
+        value = field.add(value, field.matmul(d, e))
+    return ShareVector(index, value.ravel(), bound=field.q, field=field)
+
+def beaver_inner_product(index: int, triplet, d, e) -> Share:
+    """
+    Locally compute the share of the inner product of two vectors of length n,
+    from an inner-product triplet: a 1 x n times n x 1 matrix triplet.
+    """
+    product = beaver_matmul(index, triplet, d, e, (1, len(d), 1))
+    return Share(index, int(product.value[0]), field=product.field)
 
 #sends serialized message and returns the length of the serialized message
 def send_share(share: Share, receiver_id: str, secret_id: bytes, comm: Communication) -> None:
@@ -142,15 +599,34 @@ def send_share(share: Share, receiver_id: str, secret_id: bytes, comm: Communica
     print(f"SMCParty: Sending secret share {label}: {comm.client_id} -> {receiver_id}")
     serialized = share.serialize_bytes()
     comm.send_private_message(receiver_id, label, serialized)
-    return sys.getsizeof(serialized)
+    return len(serialized)
 
-def retrieve_share(id: bytes, comm: Communication) -> Share:
+def send_shares(shares: List[Tuple[str, bytes, Share]], comm: Communication) -> int:
+    """
+    Send the shares of many secrets in a single request, every share is
+    `(receiver_id, secret_id, share)`. Returns the number of bytes sent.
+    """
+    messages = [
+        (receiver_id, f"{int.from_bytes(secret_id, byteorder='big')}", share.serialize_bytes())
+        for receiver_id, secret_id, share in shares
+    ]
+    print(f"SMCParty: Sending {len(messages)} secret shares: {comm.client_id} ->")
+    comm.send_many(messages)
+    return sum(len(serialized) for _, _, serialized in messages)
+
+def retrieve_shares(ids: List[bytes], comm: Communication, field: Optional[Field] = None) -> List[Share]:
+    """Retrieve the shares of many secrets from the server at once."""
+    labels = [f"{int.from_bytes(id, byteorder='big')}" for id in ids]
+    print(f"SMCParty: Retrieving {len(labels)} secret shares: {comm.client_id}")
+    return [deserialize_share(payload, field) for payload in comm.retrieve_many(labels)]
+
+def retrieve_share(id: bytes, comm: Communication, field: Optional[Field] = None) -> Share:
     """Retrieve a share from the server."""
     secret_id_int = int.from_bytes(id, byteorder="big")
     label = f"{secret_id_int}"
     print(f"SMCParty: Retrieving secret share {label}: {comm.client_id}")
     retrieved = comm.retrieve_private_message(label)
-    share = Share.deserialize_bytes(retrieved)
+    share = deserialize_share(retrieved, field)
     print(f"SMCParty: Retrieved secret share {label}: {comm.client_id} -> {share}")
     return share
 
@@ -158,25 +634,58 @@ def publish_result(share: Share, comm: Communication):
     """Publicly announce the final result"""
     label = f"{comm.client_id}"
     print(f"SMCParty: Broadcasting result share {label}: {comm.client_id} ->")
-    serialized = Share.serialize_bytes(share)
+    serialized = share.serialize_bytes()
     comm.publish_message(label, serialized)
 
-def receive_public_results(comm: Communication, participant_ids: list):
-    public_shares = []
-    total_bytes = 0
-    for participant in participant_ids:
-        label = f"{participant}"
-        print(f"SMCParty: Receiving result share {label}: -> {comm.client_id}")
-        payload = comm.retrieve_public_message(participant, label)
-        public_shares.append(Share.deserialize_bytes(payload))
-    return public_shares
+def receive_public_results(comm: Communication, participant_ids: list, field: Optional[Field] = None):
+    print(f"SMCParty: Receiving {len(participant_ids)} result shares: -> {comm.client_id}")
+    payloads = comm.retrieve_public_many([(participant, f"{participant}") for participant in participant_ids])
+    return [deserialize_share(payload, field) for payload in payloads]
+
+def open_result(share: Union[Share, ShareVector], comm: Communication, computation_id: str):
+    """
+    Open the result on the server: every party sends its result share and gets
+    back their sum. The server learns the result, which is public anyway.
+    `computation_id` tells apart the results of the computations on the same server.
+    """
+    print(f"SMCParty: Opening result share on the server: {comm.client_id} ->")
+    field = share.field
+    label = f"{computation_id}-result"
+    opened = field.unpack(comm.open_message(label, field.pack(np.atleast_1d(share.value))))
+    if isinstance(share, ShareVector):
+        return opened
+    return int(opened[0])
 
-def get_beaver_triplet(comm: Communication, secret_id: int):
-    """Get a beaver triplet from the server."""
-    triplets = comm.retrieve_beaver_triplet_shares(str(secret_id))
+def get_beaver_triplet(comm: Communication, secret_id: int, length: Optional[int] = None):
+    """Get a beaver triplet from the server, of vectors if a length is given."""
+    triplets = comm.retrieve_beaver_triplet_shares(str(secret_id), length)
     print("GOT TRIPLETS: " + str(triplets) + " FOR SECRET ID: " + str(secret_id))
     return triplets
 
+def get_square_pair(comm: Communication, secret_id: int, length: Optional[int] = None):
+    """Get a square pair (a, a^2) from the server, of vectors if a length is given."""
+    pair = comm.retrieve_square_pair_shares(str(secret_id), length)
+    print("GOT SQUARE PAIR: " + str(pair) + " FOR SECRET ID: " + str(secret_id))
+    return pair
+
+def get_powers(comm: Communication, secret_id: int, degree: int, length: Optional[int] = None):
+    """Get the shares of r, r^2, ..., r^degree from the server, of vectors if a length is given."""
+    powers = comm.retrieve_power_shares(str(secret_id), degree, length)
+    print("GOT POWERS: " + str(powers) + " FOR SECRET ID: " + str(secret_id))
+    return powers
+
+def get_matrix_triplet(comm: Communication, secret_id: int, dimensions: Tuple[int, int, int]):
+    """Get a triplet of matrices (A, B, C = AB) from the server, for an m x k times k x n product."""
+    triplets = comm.retrieve_matrix_triplet_shares(str(secret_id), *dimensions)
+    print("GOT MATRIX TRIPLETS: " + str(triplets) + " FOR SECRET ID: " + str(secret_id))
+    return triplets
+
+def get_preprocessing(comm: Communication, requests: List[Tuple]):
+    """Get the preprocessed material of many Beaver multiplications from the server, by op_id."""
+    material = comm.retrieve_preprocessing(requests)
+    print(f"GOT PREPROCESSING: {len(material)} multiplications")
+    return material
+
 def publish_triplet(share: Share, comm: Communication, d_or_e: str, secret_id: int):
     """Publish computed triplet share"""
     label = f"{comm.client_id}-{d_or_e}-{str(secret_id)}"
@@ -184,32 +693,119 @@ def publish_triplet(share: Share, comm: Communication, d_or_e: str, secret_id: i
     serialized = Share.serialize_bytes(share)
     comm.publish_message(label, serialized)
 
-def get_all_triplets(comm: Communication, participant_ids: list, secret_id: int) -> tuple(int,int):
-    # First get all d values
-    d = None
-    e = None
+def get_all_triplets(
+        comm: Communication,
+        participant_ids: list,
+        secret_id: int,
+        field: Optional[Field] = None
+    ) -> Tuple[int, int]:
+    """Retrieve the d and e shares of a Beaver multiplication from every participant and open them."""
+    field = field or default_field
+    d = e = 0
     for participant in participant_ids:
         print(f"SMCParty: {comm.client_id}: Trying to receive d/e index: {str(secret_id)} from {participant}")
-        label = f"{participant}-d-{str(secret_id)}"
-        #print(f"SMCParty: Receiving triplet share {label}: -> {comm.client_id}")
-        payload = comm.retrieve_public_message(sender_id=participant, label=label)
-        print(f"SMCParty: {comm.client_id}: Received d{str(secret_id)} from {participant}: -> {Share.deserialize_bytes(payload)}")
-        if d is None:
-            d = Share.deserialize_bytes(payload).value
-        else:
-            d += Share.deserialize_bytes(payload).value
-        label = f"{participant}-e-{secret_id}" 
-        payload = comm.retrieve_public_message(sender_id=participant, label=label)
-        print(f"SMCParty: {comm.client_id}: Received e{str(secret_id)} from {participant}: -> {Share.deserialize_bytes(payload)}")
-        if e is None:
-            e = Share.deserialize_bytes(payload).value 
-        else:
-            e += Share.deserialize_bytes(payload).value
-        d = d % default_q
-        e = e % default_q
+        payload = comm.retrieve_public_message(sender_id=participant, label=f"{participant}-d-{str(secret_id)}")
+        d_share = Share.deserialize_bytes(payload, field)
+        print(f"SMCParty: {comm.client_id}: Received d{str(secret_id)} from {participant}: -> {d_share}")
+        payload = comm.retrieve_public_message(sender_id=participant, label=f"{participant}-e-{str(secret_id)}")
+        e_share = Share.deserialize_bytes(payload, field)
+        print(f"SMCParty: {comm.client_id}: Received e{str(secret_id)} from {participant}: -> {e_share}")
+        d = (d + d_share.value) % field.q
+        e = (e + e_share.value) % field.q
     print(f"SMCParty: {comm.client_id} Finished getting d/e index: {str(secret_id)}")
     return d, e
 
+def publish_triplet_batch(d_shares: List[Share], e_shares: List[Share], comm: Communication, round_id: int):
+    """
+    Publish the d and e shares of all multiplications of a round in a single
+    binary message: every d value, then every e value, as fixed-width field elements.
+    Vector shares contribute all their elements, None shares (the e of a
+    square, which is not opened) contribute nothing.
+    """
+    label = f"{comm.client_id}-de-{str(round_id)}"
+    print(f"SMCParty: Broadcasting {len(d_shares)} d/e shares {label}: {comm.client_id}")
+    comm.publish_message(label, _pack_triplet_batch(d_shares, e_shares))
+
+def _pack_triplet_batch(d_shares: List[Share], e_shares: List[Share]) -> bytes:
+    """Pack every d value, then every e value, as fixed-width field elements."""
+    field = d_shares[0].field
+    values = [
+        np.atleast_1d(np.asarray(share.value, dtype=field.dtype))
+        for share in list(d_shares) + list(e_shares) if share is not None
+    ]
+    return field.pack(np.concatenate(values))
+
+def get_all_triplet_batches(
+        comm: Communication,
+        participant_ids: list,
+        round_id: int,
+        lengths: List[Optional[int]],
+        e_lengths: Optional[List[Optional[int]]] = None,
+        field: Optional[Field] = None
+    ) -> List[Tuple[int, int]]:
+    """
+    Retrieve the d/e batches of a round from every participant and open them.
+
+    `lengths` gives the length of every d of the round, None for scalars, and
+    `e_lengths` the length of every e when it differs (matrix products, or
+    0 for squares, which do not open e). Opened scalars are ints, opened
+    vectors NumPy arrays and the e of squares None.
+    """
+    if e_lengths is None:
+        e_lengths = lengths
+    field = field or default_field
+    print(f"SMCParty: {comm.client_id}: Trying to receive d/e round: {str(round_id)} from {len(participant_ids)} participants")
+    payloads = comm.retrieve_public_many([
+        (participant, f"{participant}-de-{str(round_id)}") for participant in participant_ids
+    ])
+    opened = None
+    for payload in payloads:
+        values = field.unpack(payload)
+        opened = values if opened is None else field.add(opened, values)
+    print(f"SMCParty: {comm.client_id} Finished getting d/e round: {str(round_id)}")
+    return _split_triplet_batch(opened, lengths, e_lengths)
+
+def open_triplet_batch(
+        d_shares: List[Share],
+        e_shares: List[Share],
+        comm: Communication,
+        computation_id: str,
+        round_id: int,
+        lengths: List[Optional[int]],
+        e_lengths: Optional[List[Optional[int]]] = None,
+        field: Optional[Field] = None
+    ) -> List[Tuple[int, int]]:
+    """
+    Open the d and e shares of all multiplications of a round on the server:
+    every party sends its batch (see publish_triplet_batch) and gets back the
+    sums, instead of the batches of all the others. Returns the same as
+    get_all_triplet_batches.
+    """
+    field = field or default_field
+    label = f"{computation_id}-de-{str(round_id)}"
+    print(f"SMCParty: Opening {len(d_shares)} d/e shares {label} on the server: {comm.client_id}")
+    opened = field.unpack(comm.open_message(label, _pack_triplet_batch(d_shares, e_shares)))
+    return _split_triplet_batch(opened, lengths, e_lengths if e_lengths is not None else lengths)
+
+def _split_triplet_batch(
+        opened: np.ndarray,
+        lengths: List[Optional[int]],
+        e_lengths: List[Optional[int]]
+    ) -> List[Tuple[int, int]]:
+    """Split the opened values of a round into the (d, e) of every multiplication."""
+    split = []
+    position = 0
+    for length in list(lengths) + list(e_lengths):
+        if length is None:
+            split.append(int(opened[position]))
+            position += 1
+        elif length == 0:
+            split.append(None)
+        else:
+            split.append(opened[position:position + length])
+            position += length
+    return list(zip(split[:len(lengths)], split[len(lengths):]))
+
 # For use case
 def publish_result_for_class(share: Share, comm: Communication, lecture: str, type: str):
     """Publicly announce the final result"""
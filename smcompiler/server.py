@@ -4,10 +4,21 @@ You should not need to change this file.
 """
 
 import collections
+import http.server
+import io
+import socketserver
 import sys
-from typing import Dict, List, Optional, Tuple
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+from wsgiref.simple_server import ServerHandler, WSGIRequestHandler, WSGIServer, make_server
 
-from flask import Flask, request, Response, jsonify
+import numpy as np
+from flask import Flask, request, Response
+
+from codec import decode_envelope, encode_envelope
+from field import Field
+from secret_sharing import serialize_share_batch
 
 from ttp import TrustedParamGenerator
 
@@ -15,6 +26,15 @@ from ttp import TrustedParamGenerator
 app: Flask = Flask("Trusted Third Party Server")
 store: Dict[str, Dict[Tuple[str, str], bytes]] = collections.defaultdict(dict)
 ttp: TrustedParamGenerator = TrustedParamGenerator()
+# Guards the store. Retrievals waiting for a message block on the condition of its channel.
+store_lock = threading.Lock()
+channel_conditions: Dict[Tuple[str, Tuple[str, str]], threading.Condition] = {}
+# Longest time in seconds a retrieval waits for its message, see `_get_value`.
+poll_timeout: float = 30.0
+# Shares of the values being opened by label, then by sender, until every participant sent theirs.
+openings: Dict[str, Dict[str, bytes]] = collections.defaultdict(dict)
+# Participants who retrieved every opened value, by label, until all of them did.
+opened_readers: Dict[str, Set[str]] = collections.defaultdict(set)
 
 
 @app.route("/private/<sender_id>/<receiver_id>/<label>", methods=["POST"])
@@ -33,8 +53,9 @@ def send_private_message(sender_id: str, receiver_id: str, label: str):
 def retrieve_private_message(receiver_id: str, label: str):
     """
     The client retrieve a private message from the server.
+    With a `wait` query parameter, wait up to that many seconds for the message.
     """
-    res = _get_value("private", (receiver_id, label))
+    res = _get_value("private", (receiver_id, label), _requested_wait())
     if res is not None:
         print(f"[ RETRIEVE ] RECEIVER {receiver_id} / LABEL {label}")
         return res, 200
@@ -56,8 +77,9 @@ def publish_message(sender_id: str, label: str):
 def retrieve_public_message(receiver_id: str, sender_id: str, label: str):
     """
     The client retrieve a public message from the server.
+    With a `wait` query parameter, wait up to that many seconds for the message.
     """
-    res = _get_value("public", (sender_id, label))
+    res = _get_value("public", (sender_id, label), _requested_wait())
     if res is not None:
         print(
             f"[ RETRIEVE ] RECEIVER {receiver_id}. LABEL {label} / SENDER {sender_id}"
@@ -66,38 +88,332 @@ def retrieve_public_message(receiver_id: str, sender_id: str, label: str):
     return Response(status=404)
 
 
+@app.route("/private_many/<sender_id>", methods=["POST"])
+def send_private_messages(sender_id: str):
+    """
+    The client send many private messages to the server at once. The body is a batch
+    envelope (see codec.py) of the messages labeled `<receiver_id>/<label>`.
+    """
+    messages = decode_envelope(request.get_data())
+    print(f"[ SEND     ] SENDER {sender_id} / {len(messages)} MESSAGES")
+    for channel, message in messages:
+        receiver_id, label = channel.split("/", 1)
+        _set_value("private", (receiver_id, label), message)
+    return Response(status=200)
+
+
+@app.route("/private_many/<receiver_id>", methods=["GET"])
+def retrieve_private_messages(receiver_id: str):
+    """
+    The client retrieve many private messages from the server at once, given by the
+    `label` query parameters. With a `wait` query parameter, wait up to that many seconds
+    for all of them. The available messages are sent back in a batch envelope labeled
+    by label, the client asks again for the others.
+    """
+    labels = request.args.getlist("label")
+    found = _get_values("private", [(receiver_id, label) for label in labels], _requested_wait())
+    print(f"[ RETRIEVE ] RECEIVER {receiver_id} / {len(found)} OF {len(labels)} MESSAGES")
+    return encode_envelope([(label, message) for (_, label), message in found.items()]), 200
+
+
+@app.route("/public_many/<receiver_id>", methods=["GET"])
+def retrieve_public_messages(receiver_id: str):
+    """
+    The client retrieve many public messages from the server at once, given by pairs of
+    `sender` and `label` query parameters. With a `wait` query parameter, wait up to that
+    many seconds for all of them. The available messages are sent back in a batch
+    envelope labeled `<sender_id>/<label>`, the client asks again for the others.
+    """
+    channels = list(zip(request.args.getlist("sender"), request.args.getlist("label")))
+    found = _get_values("public", channels, _requested_wait())
+    print(f"[ RETRIEVE ] RECEIVER {receiver_id} / {len(found)} OF {len(channels)} MESSAGES")
+    return encode_envelope([(f"{sender_id}/{label}", message) for (sender_id, label), message in found.items()]), 200
+
+
+@app.route("/open/<sender_id>/<label>", methods=["POST"])
+def open_message(sender_id: str, label: str):
+    """
+    The client send its share of a public value to open, as packed field elements.
+    Once every participant sent theirs, the server sums them in the field of the
+    trusted parameters and serves the opened value to everyone. With a `wait` query
+    parameter, wait up to that many seconds for the opened value and send it back.
+    Labels are scoped by the parties to their computation.
+    """
+    if sender_id not in ttp.participant_ids:
+        return Response(status=403)
+    print(f"[ OPEN     ] SENDER {sender_id} / LABEL {label}")
+    _add_opening_share(sender_id, label, request.get_data())
+    return retrieve_opened_message(sender_id, label)
+
+
+@app.route("/open/<receiver_id>/<label>", methods=["GET"])
+def retrieve_opened_message(receiver_id: str, label: str):
+    """
+    The client retrieve an opened value from the server.
+    With a `wait` query parameter, wait up to that many seconds for it.
+    """
+    if receiver_id not in ttp.participant_ids:
+        return Response(status=403)
+    # Opened values are the same for everyone, they have no sender.
+    res = _get_value("opened", ("", label), _requested_wait())
+    if res is not None:
+        print(f"[ RETRIEVE ] RECEIVER {receiver_id} / OPENED {label}")
+        _mark_opened_read(receiver_id, label)
+        return res, 200
+    return Response(status=404)
+
+
 @app.route("/shares/<client_id>/<op_id>", methods=["GET"])
 def retrieve_share(client_id: str, op_id: str):
     """
     The client retrieve Beaver triplets generated by the server.
     """
     shares = ttp.retrieve_share(client_id, op_id)
-    return jsonify([share.serialize() for share in shares]), 200
+    return _serialize_shares(shares), 200
+
+
+@app.route("/shares/<client_id>/<op_id>/<int:length>", methods=["GET"])
+def retrieve_vector_share(client_id: str, op_id: str, length: int):
+    """
+    The client retrieve a triplet of vectors generated by the server.
+    """
+    shares = ttp.retrieve_share(client_id, op_id, length)
+    return _serialize_shares(shares), 200
+
+
+@app.route("/squares/<client_id>/<op_id>", methods=["GET"])
+def retrieve_square_share(client_id: str, op_id: str):
+    """
+    The client retrieve a square pair (a, a^2) generated by the server.
+    """
+    shares = ttp.retrieve_square_share(client_id, op_id)
+    return _serialize_shares(shares), 200
+
+
+@app.route("/squares/<client_id>/<op_id>/<int:length>", methods=["GET"])
+def retrieve_vector_square_share(client_id: str, op_id: str, length: int):
+    """
+    The client retrieve a square pair of vectors generated by the server.
+    """
+    shares = ttp.retrieve_square_share(client_id, op_id, length)
+    return _serialize_shares(shares), 200
+
+
+@app.route("/powers/<client_id>/<op_id>/<int:degree>", methods=["GET"])
+def retrieve_power_share(client_id: str, op_id: str, degree: int):
+    """
+    The client retrieve the shares of the powers r, ..., r^degree of a random r generated by the server.
+    """
+    shares = ttp.retrieve_power_share(client_id, op_id, degree)
+    return _serialize_shares(shares), 200
+
+
+@app.route("/powers/<client_id>/<op_id>/<int:degree>/<int:length>", methods=["GET"])
+def retrieve_vector_power_share(client_id: str, op_id: str, degree: int, length: int):
+    """
+    The client retrieve the element-wise powers of a random vector generated by the server.
+    """
+    shares = ttp.retrieve_power_share(client_id, op_id, degree, length)
+    return _serialize_shares(shares), 200
+
+
+@app.route("/matrix_shares/<client_id>/<op_id>/<int:m>/<int:k>/<int:n>", methods=["GET"])
+def retrieve_matrix_share(client_id: str, op_id: str, m: int, k: int, n: int):
+    """
+    The client retrieve a triplet of matrices generated by the server.
+    """
+    shares = ttp.retrieve_matrix_share(client_id, op_id, m, k, n)
+    return _serialize_shares(shares), 200
+
+
+@app.route("/preprocessing/<client_id>", methods=["POST"])
+def retrieve_preprocessing(client_id: str):
+    """
+    The client retrieve the preprocessed material of all its Beaver multiplications at once.
+    The body is a JSON list of `[op_id, kind, *parameters]` requests, the shares of
+    every request are labeled with its op_id.
+    """
+    requests = request.get_json(force=True)
+    material = ttp.retrieve_preprocessing(client_id, requests)
+    return serialize_share_batch([(op_id, share) for op_id, shares in material for share in shares]), 200
+
+
+class ThreadingWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    """
+    WSGI server handling every client connection in its own thread.
+    """
+    daemon_threads = True
+    # All the parties connect at once, the default backlog of 5 drops connections.
+    request_queue_size = 128
+
+
+class KeepAliveServerHandler(ServerHandler):
+    """
+    Runs the application for a request of a kept-alive HTTP/1.1 connection.
+    """
+    http_version = "1.1"
+
+    def cleanup_headers(self) -> None:
+        super().cleanup_headers()
+        # Without a length, the client reads the response until the connection is closed.
+        if "Content-Length" not in self.headers:
+            self.request_handler.close_connection = True
+        # Tell the client when the connection is closed after the response, or it may reuse it.
+        if self.request_handler.close_connection:
+            self.headers["Connection"] = "close"
+
+
+class KeepAliveRequestHandler(WSGIRequestHandler):
+    """
+    HTTP/1.1 request handler serving all the requests of a client on the same
+    connection, until the client closes it or asks to with `Connection: close`.
+    """
+    protocol_version = "HTTP/1.1"
+    # Write every response at once: small writes on a kept-alive connection wait for
+    # the delayed acknowledgement of the previous ones.
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def handle(self) -> None:
+        # The handler of wsgiref serves a single request per connection.
+        http.server.BaseHTTPRequestHandler.handle(self)
+
+    def handle_one_request(self) -> None:
+        self.raw_requestline = self.rfile.readline(65537)
+        if not self.raw_requestline or len(self.raw_requestline) > 65536:
+            self.close_connection = True
+            return
+        if not self.parse_request():
+            return
+        # Read the whole body, so that the next request line starts right after it.
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        handler = KeepAliveServerHandler(
+            io.BytesIO(body), self.wfile, self.get_stderr(), self.get_environ(), multithread=True
+        )
+        handler.request_handler = self
+        handler.run(self.server.get_app())
+        self.wfile.flush()
+
+
+def _serialize_shares(shares) -> bytes:
+    """
+    Pack the shares generated by the TTP into a single binary batch envelope.
+    """
+    return serialize_share_batch([(str(i), share) for i, share in enumerate(shares)])
+
+
+def _requested_wait() -> float:
+    """
+    Time in seconds the client is ready to wait for a message, at most `poll_timeout`.
+    """
+    return min(max(request.args.get("wait", 0.0, type=float), 0.0), poll_timeout)
 
 
 def _set_value(pool: str, channel: Tuple[str, str], data: bytes) -> None:
     """
     Push data to a channel in a given pool and send an event.
     """
-    store[pool][channel] = data
+    with store_lock:
+        store[pool][channel] = data
+        condition = channel_conditions.pop((pool, channel), None)
+        if condition is not None:
+            condition.notify_all()
+
+
+def _add_opening_share(sender_id: str, label: str, data: bytes) -> None:
+    """
+    Add the share of a participant to a value being opened, and publish the
+    sum of the shares once all the participants sent theirs.
+    """
+    with store_lock:
+        openings[label][sender_id] = data
+        if len(openings[label]) < len(ttp.participant_ids):
+            return
+        shares = list(openings.pop(label).values())
+    field = ttp.field
+    opened = field.sum(np.stack([field.unpack(share) for share in shares]), axis=0)
+    _set_value("opened", ("", label), field.pack(opened))
 
 
-def _get_value(pool: str, channel: Tuple[str, str]) -> Optional[bytes]:
+def _mark_opened_read(receiver_id: str, label: str) -> None:
+    """
+    Record that a participant retrieved an opened value, and drop the value once
+    all the participants did, so that the label can be opened again.
+    """
+    with store_lock:
+        opened_readers[label].add(receiver_id)
+        if len(opened_readers[label]) < len(ttp.participant_ids):
+            return
+        del opened_readers[label]
+        store["opened"].pop(("", label), None)
+
+
+def _get_value(pool: str, channel: Tuple[str, str], timeout: float = 0.0) -> Optional[bytes]:
     """
     Subscribe to a channel in a given pool and get it once ready.
+    Wait up to `timeout` seconds for the data, None if it is still missing.
+    """
+    with store_lock:
+        _wait_for_value(pool, channel, timeout)
+        return store[pool].get(channel)
+
+
+def _get_values(pool: str, channels: List[Tuple[str, str]], timeout: float = 0.0) -> Dict[Tuple[str, str], bytes]:
+    """
+    Get the data of many channels in a given pool, waiting up to `timeout` seconds
+    for all of them. Only the channels with data are returned.
+    """
+    deadline = time.monotonic() + timeout
+    with store_lock:
+        for channel in channels:
+            _wait_for_value(pool, channel, deadline - time.monotonic())
+        return {channel: store[pool][channel] for channel in channels if channel in store[pool]}
+
+
+def _wait_for_value(pool: str, channel: Tuple[str, str], timeout: float) -> None:
+    """
+    Wait up to `timeout` seconds for data on a channel, with the store lock held.
     """
-    if channel not in store[pool]:
-        return None
-    return store[pool][channel]
+    if channel not in store[pool] and timeout > 0:
+        # The condition is shared by all the retrievals waiting on the channel,
+        # `_set_value` wakes them up and drops it.
+        condition = channel_conditions.setdefault((pool, channel), threading.Condition(store_lock))
+        condition.wait_for(lambda: channel in store[pool], timeout)
 
 
-def run(host: str, port: int, participants: List[str]) -> None:
+def run(
+        host: str,
+        port: int,
+        participants: List[str],
+        field: Optional[Field] = None,
+        pool_size: Optional[int] = None,
+        refill_threshold: Optional[int] = None,
+        max_poll_timeout: Optional[float] = None
+    ) -> None:
     """
-    Register the participants, then run the server.
+    Register the participants, start the pool of triplets, then run the server.
+    The trusted parameters are generated in the given field, which must be the
+    one of the parties. See TrustedParamGenerator for the pool settings.
+    Every client connection is handled in its own thread and kept alive
+    between requests, see KeepAliveRequestHandler. The retrievals of messages
+    wait at most `max_poll_timeout` seconds for them (default: 30 s).
     """
+    global poll_timeout
+    if max_poll_timeout is not None:
+        poll_timeout = max_poll_timeout
+    if field is not None:
+        ttp.field = field
+    if pool_size is not None:
+        ttp.pool_size = pool_size
+        ttp.refill_threshold = pool_size // 4
+    if refill_threshold is not None:
+        ttp.refill_threshold = refill_threshold
     for participant in participants:
         ttp.add_participant(participant)
-    app.run(host, port, debug=True, threaded=False, processes=1, use_reloader=False)
+    ttp.start_pool()
+    server = make_server(host, port, app, server_class=ThreadingWSGIServer, handler_class=KeepAliveRequestHandler)
+    print(f"Serving on http://{host}:{port}")
+    server.serve_forever()
 
 
 def main(args: List[str]) -> None:
@@ -6,36 +6,78 @@ MODIFY THIS FILE.
 # You might want to import more classes if needed.
 
 import collections
+import hashlib
 import json
+import os
 from typing import (
     Dict,
+    List,
+    Optional,
     Set,
     Tuple,
     Union
 )
 
-from communication import Communication
+import numpy as np
+
+from communication import AsyncCommunication, Communication, sanitize_url_param
+from field import Field
+from compiler import (
+    ExecutionPlan,
+    Instruction,
+    compile_expression,
+    preprocessing_request,
+    PREP_MATRIX,
+    PREP_POWERS,
+    PREP_SQUARE,
+    OP_ADD,
+    OP_INNER_PRODUCT,
+    OP_LINEAR,
+    OP_MATMUL,
+    OP_MULT,
+    OP_POLYNOMIAL,
+    OP_SCALAR,
+    OP_SECRET,
+    OP_SUB,
+    OP_VECTOR_SUM,
+)
 from expression import (
     Expression,
     Secret,
-    Scalar,
-    AddOperation,
-    MultOperation, 
-    SubOperation
+    SecretVector,
 )
+from optimizer import optimize
 from protocol import ProtocolSpec
 from secret_sharing import(
     reconstruct_shares,
     publish_result,
     retrieve_share,
-    send_share,
-    gen_share,
+    retrieve_shares,
+    send_shares,
+    gen_vector_share,
+    gen_seeded_vector_share,
+    gen_share_batch,
+    beaver_multiply,
     Share,
+    ShareVector,
     receive_public_results,
     get_beaver_triplet,
-    publish_triplet,
-    get_all_triplets,
-    default_q,
+    get_matrix_triplet,
+    get_square_pair,
+    beaver_square,
+    get_powers,
+    beaver_polynomial,
+    beaver_matmul,
+    beaver_inner_product,
+    publish_triplet_batch,
+    get_all_triplet_batches,
+    open_triplet_batch,
+    open_result,
+    get_preprocessing,
+    group_share_batch,
+    deserialize_share_batch,
+    serialize_share_batch,
+    default_field,
 )
 import time
 # Feel free to add as many imports as you want.
@@ -52,6 +94,18 @@ class SMCParty:
         server_port: port of the server
         protocol_spec (ProtocolSpec): Protocol specification
         value_dict (dict): Dictionary assigning values to secrets belonging to this client.
+        optimize (bool): Whether to run the optimization passes on the expression before compiling it.
+        seeded_shares (bool): Whether to share vector secrets with PRG seeds, all participants but
+            one then receive a short seed instead of a full vector of shares.
+        field (Field): Field of the shares, all parties and the trusted server must use the same.
+        preprocessing_cache (str): Directory where preprocessed material is stored ahead of time,
+            see `store_preprocessing`. None to always retrieve it from the trusted server.
+        transport (str): "http" to talk to server.py, "push" to keep a single connection
+            to push_server.py, see AsyncCommunication.
+        server_opening (bool): Whether the server sums the shares of the opened values (d and e
+            of the multiplications, and the result), so that every party sends and receives a
+            single message per opening instead of one per participant. The server then learns
+            the opened values, which are public to the parties anyway.
     """
 
     def __init__(
@@ -60,13 +114,36 @@ class SMCParty:
             server_host: str,
             server_port: int,
             protocol_spec: ProtocolSpec,
-            value_dict: Dict[Secret, int]
+            value_dict: Dict[Secret, int],
+            optimize: bool = True,
+            seeded_shares: bool = True,
+            field: Optional[Field] = None,
+            preprocessing_cache: Optional[str] = None,
+            transport: str = "http",
+            server_opening: bool = False
         ):
-        self.comm = Communication(server_host, server_port, client_id)
+        self.field = field or default_field
+        if transport == "push":
+            self.comm = AsyncCommunication(server_host, server_port, client_id, field=self.field)
+        elif transport == "http":
+            self.comm = Communication(server_host, server_port, client_id, field=self.field)
+        else:
+            raise ValueError(f"Unknown transport {transport}")
         self.client_id = client_id
         self.protocol_spec = protocol_spec
         self.value_dict = value_dict
+        self.optimize = optimize
+        self.seeded_shares = seeded_shares
+        # Shares of the input secrets, by secret id.
+        self.shares: Dict[bytes, Share] = {}
+        # Preprocessed material of the Beaver multiplications, by op_id.
+        self.preprocessed: Dict[str, tuple] = {}
+        self.preprocessing_cache = preprocessing_cache
+        self.server_opening = server_opening
+        # Scopes the values opened on the server to this computation, see `identify_computation`.
+        self.computation_id = ""
         self.tripletIndex = 0
+        self.roundIndex = 0
         self.elapsed_time = 0
 
     def run(self) -> int:
@@ -76,82 +153,340 @@ class SMCParty:
         # publish i joined msg
         # check for other participants
         start = time.time()
-        print('Expression',self.protocol_spec.expr)
+        expr = self.protocol_spec.expr
+        if self.optimize:
+            expr = optimize(expr, self.field.q)
+        plan = compile_expression(expr)
+        print(f"SMCParty: {self.client_id} compiled the expression into {plan}")
+        self.computation_id = self.identify_computation(plan)
+        num_shares = len(self.protocol_spec.participant_ids)
+        # Share all the scalar secrets at once, element i of every vector shares the i-th one
+        scalars = [secret for secret in self.value_dict if not isinstance(secret, SecretVector)]
+        scalar_shares = gen_share_batch([self.value_dict[secret] for secret in scalars], num_shares, self.field)
+        positions = {id(secret): i for i, secret in enumerate(scalars)}
+        # The shares of all the secrets for all the participants, sent in a single request
+        outgoing = []
         for secret in self.value_dict:
-            # create shares of the secret
-            shares = gen_share(self.value_dict[secret], len(self.protocol_spec.participant_ids))
+            # create shares of the secret, a vector is shared all at once
+            if isinstance(secret, SecretVector) and self.seeded_shares:
+                shares = gen_seeded_vector_share(self.value_dict[secret], num_shares, field=self.field)
+            elif isinstance(secret, SecretVector):
+                shares = gen_vector_share(self.value_dict[secret], num_shares, field=self.field)
+            else:
+                shares = [
+                    Share(batch.index, int(batch.value[positions[id(secret)]]), field=self.field)
+                    for batch in scalar_shares
+                ]
             print(f"SMCParty: {self.client_id} has created shares for secret {secret.id} -> {shares}")
             for participant, share in zip(self.protocol_spec.participant_ids, shares):
-                # send share to participant using self.comm.send_private_message
-                #then, add the amount of bytes sent for evaluation part
-                send_share(share, participant, secret.id, self.comm)
+                outgoing.append((participant, secret.id, share))
+        send_shares(outgoing, self.comm)
+        # Fetch the share of every input once, before processing the expression
+        self.prefetch_shares(plan)
+        # Fetch the triplets of every Beaver multiplication at once
+        self.preprocess(plan)
         # Process the expression
-        result_share = self.process_expression(self.protocol_spec.expr)
-        if(isinstance(result_share, Share)):
+        result_share = self.execute_plan(plan)
+        if(isinstance(result_share, (Share, ShareVector))):
             print(f"SMCParty: {self.client_id} has found the result share!")
-            # Publish the result share.
-            publish_result(result_share, self.comm)
-            # Retrieve the other resulting shares.
-            all_result_shares = receive_public_results(self.comm,self.protocol_spec.participant_ids)
-            print(f"SMCParty: {self.client_id} has retrieved ALL shares", all_result_shares)
-            reconstructed = reconstruct_shares(all_result_shares)
+            if self.server_opening:
+                reconstructed = open_result(result_share, self.comm, self.computation_id)
+            else:
+                # Publish the result share.
+                publish_result(result_share, self.comm)
+                # Retrieve the other resulting shares.
+                all_result_shares = receive_public_results(self.comm,self.protocol_spec.participant_ids, self.field)
+                print(f"SMCParty: {self.client_id} has retrieved ALL shares", all_result_shares)
+                reconstructed = reconstruct_shares(all_result_shares)
             self.elapsed_time = time.time() - start
             # Return the reconstructed results with the calculated metrics
+            if isinstance(reconstructed, np.ndarray):
+                # Matrices are shared flat, give them back their shape.
+                return reconstructed.reshape(plan.instructions[plan.output].shape).tolist()
             return (reconstructed)
         elif isinstance(result_share, int):
-            return result_share % default_q
+            return result_share % self.field.q
+        elif isinstance(result_share, np.ndarray):
+            return (result_share % self.field.q).reshape(plan.instructions[plan.output].shape).tolist()
+        else:
+            raise Exception("Result share is not of type Share, ShareVector or int")
+
+
+    def preprocess(
+            self,
+            plan: ExecutionPlan
+        ):
+        """
+        Offline phase: retrieve the preprocessed material of every Beaver
+        multiplication of the plan with a single request, so that the online
+        phase only opens d and e. Material stored by `store_preprocessing` is
+        used instead if there is any, and deleted: it must never be used twice.
+        """
+        requests = self.preprocessing_requests(plan)
+        if not requests:
+            return
+        path = self.preprocessing_cache_path(requests)
+        if path is not None and os.path.exists(path):
+            print(f"SMCParty: {self.client_id} loading the preprocessed material from {path}")
+            with open(path, "rb") as cache:
+                material = group_share_batch(deserialize_share_batch(cache.read(), self.field))
+            os.remove(path)
         else:
-            raise Exception("Result share is not of type Share or int")
+            material = get_preprocessing(self.comm, requests)
+        self.preprocessed.update(material)
+
+    def identify_computation(
+            self,
+            plan: ExecutionPlan
+        ) -> str:
+        """
+        Identifier of the computation of the plan, the same for all its participants:
+        a digest of the participants and of the secrets, which are fresh for every computation.
+        """
+        secrets = [sanitize_url_param(instruction.value) for instruction in plan if instruction.op == OP_SECRET]
+        message = json.dumps([list(self.protocol_spec.participant_ids), secrets])
+        return hashlib.sha256(message.encode("utf-8")).hexdigest()[:16]
+
+    def store_preprocessing(
+            self,
+            plan: ExecutionPlan
+        ) -> str:
+        """
+        Retrieve the preprocessed material of the plan ahead of time and store
+        it in the cache directory, for a later `run` of the same expression.
+        Returns the path of the stored material.
+        """
+        if self.preprocessing_cache is None:
+            raise ValueError("No preprocessing cache directory is configured")
+        requests = self.preprocessing_requests(plan)
+        material = get_preprocessing(self.comm, requests)
+        path = self.preprocessing_cache_path(requests)
+        os.makedirs(self.preprocessing_cache, exist_ok=True)
+        with open(path, "wb") as cache:
+            cache.write(serialize_share_batch(
+                [(op_id, share) for op_id, shares in material.items() for share in shares]
+            ))
+        return path
+
+    def preprocessing_requests(
+            self,
+            plan: ExecutionPlan
+        ) -> List[Tuple]:
+        """The `(op_id, kind, *parameters)` requests of the Beaver multiplications of the plan."""
+        return [
+            (str(self.tripletIndex + i),) + request for i, request in enumerate(plan.preprocessing())
+        ]
+
+    def preprocessing_cache_path(
+            self,
+            requests: List[Tuple]
+        ) -> Optional[str]:
+        """Cache file of the material of the given requests, None without a cache directory."""
+        if self.preprocessing_cache is None:
+            return None
+        digest = hashlib.sha256(json.dumps(requests).encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.preprocessing_cache, f"{sanitize_url_param(self.client_id)}-{digest}.bin")
+
+    def get_preprocessed(
+            self,
+            op_id: str,
+            request: Tuple
+        ):
+        """The preprocessed material of a Beaver multiplication, retrieved on its own if it was not preprocessed."""
+        if op_id in self.preprocessed:
+            return self.preprocessed.pop(op_id)
+        kind, *parameters = request
+        if kind == PREP_POWERS:
+            return get_powers(comm=self.comm, secret_id=op_id, degree=parameters[0], length=parameters[1])
+        if kind == PREP_SQUARE:
+            return get_square_pair(comm=self.comm, secret_id=op_id, length=parameters[0])
+        if kind == PREP_MATRIX:
+            return get_matrix_triplet(comm=self.comm, secret_id=op_id, dimensions=tuple(parameters))
+        return get_beaver_triplet(comm=self.comm, secret_id=op_id, length=parameters[0])
 
+    def prefetch_shares(
+            self,
+            plan: ExecutionPlan
+        ):
+        """Retrieve the shares of all the secrets the plan reads at once, each one exactly once."""
+        missing = [secret_id for secret_id in dict.fromkeys(plan.secret_ids()) if secret_id not in self.shares]
+        if missing:
+            self.shares.update(zip(missing, retrieve_shares(missing, self.comm, self.field)))
 
-    # Suggestion: To process expressions, make use of the *visitor pattern* like so:
     def process_expression(
             self,
             expr: Expression
         ):
-        print("PROCESS EXPR: ", expr)
-        #TODO consider using match-case statement
-        if isinstance(expr, Scalar):          # if expr is a scalar, return the value of scalar
-            return self.handle_scalar(expr)
-        elif isinstance(expr, Secret):        
-            return self.handle_secret(expr)          
-        elif isinstance(expr, AddOperation):        #if expression is addition, add its operands
-            return self.handle_add(expr)
-        elif isinstance(expr, SubOperation):       
-            return self.handle_sub(expr)
-        elif isinstance(expr, MultOperation): 
-            return self.handle_mult(expr)
-
-    def handle_scalar(self, expression):
-        return expression.value
-    def handle_secret(self, expression):
-        received_share = retrieve_share(expression.id, self.comm)
-        return received_share
-    def handle_add(self, expression):
-        leftSide = self.process_expression(expression.left)
-        rightSide = self.process_expression(expression.right)
+        return self.execute_plan(compile_expression(expr))
+
+    def execute_plan(
+            self,
+            plan: ExecutionPlan
+        ):
+        """
+        Run the plan round by round, without recursion.
+
+        All Beaver multiplications of a round are opened together, so the
+        number of network rounds is the multiplicative depth of the expression.
+        """
+        registers = [None] * plan.num_registers
+        for multiplications, local in plan.rounds():
+            if multiplications:
+                self.handle_mult_round(multiplications, registers)
+            for instruction in local:
+                registers[instruction.dest] = self.process_instruction(instruction, registers)
+        return registers[plan.output]
+
+    def process_instruction(
+            self,
+            instruction: Instruction,
+            registers: list
+        ):
+        print("PROCESS INSTRUCTION: ", instruction)
+        if instruction.op == OP_SCALAR:        # if instruction is a scalar, return the value of scalar
+            return self.handle_scalar(instruction)
+        elif instruction.op == OP_SECRET:
+            return self.handle_secret(instruction)
+        elif instruction.op == OP_LINEAR:
+            return self.handle_linear(instruction, [registers[arg] for arg in instruction.args])
+        elif instruction.op == OP_VECTOR_SUM:
+            return self.handle_vector_sum(registers[instruction.args[0]])
+        elif instruction.op == OP_POLYNOMIAL:
+            return self.handle_polynomial(instruction.value, registers[instruction.args[0]])
+        left, right = (registers[arg] for arg in instruction.args)
+        if instruction.op == OP_ADD:           # if instruction is addition, add its operands
+            return self.handle_add(left, right)
+        elif instruction.op == OP_SUB:
+            return self.handle_sub(left, right)
+        elif instruction.op == OP_MULT:
+            return self.handle_mult(left, right)
+        elif instruction.op == OP_INNER_PRODUCT:
+            return self.handle_inner_product(left, right)
+        elif instruction.op == OP_MATMUL:
+            return self.handle_matmul(left, right, instruction.value)
+        raise ValueError(f"Unknown opcode {instruction.op}")
+
+    def handle_scalar(self, instruction):
+        return instruction.value
+    def handle_secret(self, instruction):
+        if instruction.value not in self.shares:
+            self.shares[instruction.value] = retrieve_share(instruction.value, self.comm, self.field)
+        return self.shares[instruction.value]
+    def handle_add(self, leftSide, rightSide):
         return leftSide + rightSide
-    def handle_sub(self, expression):
-        leftSide = self.process_expression(expression.left)
-        rightSide = self.process_expression(expression.right)
+    def handle_sub(self, leftSide, rightSide):
         return leftSide - rightSide
-    def handle_mult(self, expression):
-        l_expression = self.process_expression(expression.left)
-        r_expression = self.process_expression(expression.right)
-        if isinstance(l_expression, Share) and isinstance(r_expression, Share):
-            # Beaver Triplet logic
-            if l_expression.beaver_triplets is None:
-                l_expression.beaver_triplets = get_beaver_triplet(comm=self.comm,secret_id=self.tripletIndex)
-                # Each party locally computes a share of d = s - a
-                d_share = Share(index=l_expression.index, value=((l_expression.value - l_expression.beaver_triplets[0].value)))
-                # Each party locally computes a share of e = v - b
-                e_share = Share(index=r_expression.index, value=((r_expression.value - l_expression.beaver_triplets[1].value)))
-                # broadcast d and e to all parties
-                publish_triplet(d_share, self.comm, "d", self.tripletIndex)
-                publish_triplet(e_share, self.comm, "e", self.tripletIndex)
-                # Get all the d and e values
-                (d,e) = get_all_triplets(comm=self.comm, participant_ids=self.protocol_spec.participant_ids, secret_id=self.tripletIndex)
-                l_expression.d = d
-                l_expression.e = e
-                self.tripletIndex += 1
-        return l_expression * r_expression
\ No newline at end of file
+    def handle_linear(self, instruction, operands):
+        """Computes a linear combination of shares and public values in one vectorized pass."""
+        coeffs, constant = instruction.value
+        if instruction.length is not None:
+            # Vectors are already vectorized element-wise, accumulate with the share operators.
+            result = constant
+            for coeff, operand in zip(coeffs, operands):
+                result = operand * coeff + result
+            return result
+        shares = [operand for operand in operands if isinstance(operand, Share)]
+        # Public operands only contribute to the constant.
+        for coeff, operand in zip(coeffs, operands):
+            if not isinstance(operand, Share):
+                constant += coeff * operand
+        if not shares:
+            return constant
+        values = self.field.array([share.value for share in shares])
+        weights = self.field.array([coeff for coeff, operand in zip(coeffs, operands) if isinstance(operand, Share)])
+        total = int(self.field.sum(self.field.mul(values, weights)))
+        return Share(shares[0].index, total, field=self.field) + (constant % self.field.q)
+    def handle_vector_sum(self, operand):
+        if isinstance(operand, ShareVector):
+            return Share(operand.index, int(self.field.sum(operand.value)), field=self.field)
+        return int(self.field.sum(ShareVector.public(operand, self.field)))
+    def handle_polynomial(self, coeffs, operand):
+        # Public operand, or a polynomial of degree at most 1: no opening is needed.
+        if isinstance(operand, int):
+            return sum(coeff * pow(operand, j, self.field.q) for j, coeff in enumerate(coeffs)) % self.field.q
+        if len(coeffs) > 1:
+            return operand * coeffs[1] + coeffs[0]
+        if isinstance(operand, (ShareVector, np.ndarray)):
+            # A constant polynomial of a vector is a public vector of the constant.
+            return ShareVector.public(np.full(len(operand), coeffs[0]), self.field)
+        return coeffs[0]
+    def handle_mult(self, leftSide, rightSide):
+        # At least one side is public, Beaver multiplications are handled by rounds.
+        return leftSide * rightSide
+    def handle_inner_product(self, leftSide, rightSide):
+        # At least one side is public, the shares are scaled and summed locally.
+        if isinstance(rightSide, ShareVector):
+            leftSide, rightSide = rightSide, leftSide
+        public = ShareVector.public(rightSide, self.field)
+        if isinstance(leftSide, ShareVector):
+            return Share(leftSide.index, int(self.field.sum(self.field.mul(leftSide.value, public))), field=self.field)
+        return int(self.field.sum(self.field.mul(ShareVector.public(leftSide, self.field), public)))
+    def handle_matmul(self, leftSide, rightSide, dimensions):
+        # At least one side is public, the product is linear in the shares.
+        m, k, n = dimensions
+        left = leftSide.value if isinstance(leftSide, ShareVector) else ShareVector.public(leftSide, self.field)
+        right = rightSide.value if isinstance(rightSide, ShareVector) else ShareVector.public(rightSide, self.field)
+        product = self.field.matmul(left.reshape(m, k), right.reshape(k, n)).ravel()
+        share = leftSide if isinstance(leftSide, ShareVector) else rightSide
+        if isinstance(share, ShareVector):
+            return ShareVector(share.index, product, bound=self.field.q, field=self.field)
+        return product
+    def handle_mult_round(self, multiplications, registers):
+        """Multiply the operands of all the given instructions with a single d/e opening."""
+        pending = []
+        d_shares = []
+        e_shares = []
+        d_lengths = []
+        e_lengths = []
+        for instruction in multiplications:
+            # Polynomials have a single operand.
+            l_share, r_share = registers[instruction.args[0]], registers[instruction.args[-1]]
+            request = preprocessing_request(instruction)
+            triplet = self.get_preprocessed(str(self.tripletIndex), request)
+            kind = request[0]
+            if kind == PREP_POWERS or kind == PREP_SQUARE:
+                # Polynomials of any degree and squares only open d = x - r, using the powers of r.
+                d_lengths.append(request[-1])
+                e_lengths.append(0)
+            elif kind == PREP_MATRIX:
+                # A matrix product consumes one triplet of matrices, d and e have the sizes of the operands.
+                _, m, k, n = request
+                d_lengths.append(m * k)
+                e_lengths.append(k * n)
+            else:
+                # A vector multiplication consumes one triplet of vectors, scalar operands are broadcast.
+                d_lengths.append(instruction.length)
+                e_lengths.append(instruction.length)
+            # Each party locally computes a share of d = s - a
+            d_shares.append(l_share - triplet[0])
+            # Each party locally computes a share of e = v - b, squares do not need it
+            e_shares.append(None if e_lengths[-1] == 0 else r_share - triplet[1])
+            pending.append((instruction, l_share.index, triplet))
+            self.tripletIndex += 1
+        if self.server_opening:
+            # the server sums the d and e shares of the round and sends back the opened values
+            opened = open_triplet_batch(
+                d_shares, e_shares, self.comm, self.computation_id, self.roundIndex, d_lengths, e_lengths, self.field
+            )
+        else:
+            # broadcast all d and e shares of the round at once, then get everyone else's
+            publish_triplet_batch(d_shares, e_shares, self.comm, self.roundIndex)
+            opened = get_all_triplet_batches(
+                comm=self.comm, participant_ids=self.protocol_spec.participant_ids, round_id=self.roundIndex,
+                lengths=d_lengths, e_lengths=e_lengths, field=self.field
+            )
+        for (instruction, index, triplet), (d, e) in zip(pending, opened):
+            if instruction.op == OP_POLYNOMIAL:
+                registers[instruction.dest] = beaver_polynomial(index, triplet, d, instruction.value)
+            elif instruction.square:
+                square = beaver_square(index, triplet, d)
+                if instruction.op == OP_INNER_PRODUCT:
+                    square = Share(index, int(self.field.sum(square.value)), field=self.field)
+                registers[instruction.dest] = square
+            elif instruction.op == OP_MATMUL:
+                registers[instruction.dest] = beaver_matmul(index, triplet, d, e, instruction.value)
+            elif instruction.op == OP_INNER_PRODUCT:
+                registers[instruction.dest] = beaver_inner_product(index, triplet, d, e)
+            else:
+                registers[instruction.dest] = beaver_multiply(index, triplet, d, e)
+        self.roundIndex += 1
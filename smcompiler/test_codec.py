@@ -0,0 +1,71 @@
+"""
+Unit tests for the binary wire format.
+"""
+
+import asyncio
+
+import numpy as np
+import pytest
+
+from codec import (
+    FRAME_HEADER,
+    decode_envelope,
+    decode_frame,
+    decode_varint,
+    encode_envelope,
+    encode_frame,
+    encode_varint,
+    read_frame,
+)
+from secret_sharing import (
+    Share,
+    ShareVector,
+    default_field,
+    deserialize_share_batch,
+    serialize_share_batch,
+)
+
+
+def test_varint_roundtrip():
+    for value in [0, 1, 127, 128, 300, 2**31 - 1, 2**63]:
+        encoded = encode_varint(value)
+        assert decode_varint(b"xx" + encoded, 2) == (value, 2 + len(encoded))
+    assert encode_varint(127) == b"\x7f"
+    assert encode_varint(128) == b"\x80\x01"
+    with pytest.raises(ValueError):
+        encode_varint(-1)
+
+
+def test_envelope_roundtrip():
+    entries = [("a", b""), ("label", b"\x00" * 200), ("é", b"payload")]
+    assert decode_envelope(encode_envelope(entries)) == entries
+    assert decode_envelope(encode_envelope([])) == []
+    with pytest.raises(ValueError):
+        decode_envelope(b"not an envelope")
+
+
+def test_frame_roundtrip():
+    frame = encode_frame({"op": "private", "label": "é", "data": b"\x00\x01"})
+    (length,) = FRAME_HEADER.unpack_from(frame)
+    assert length == len(frame) - FRAME_HEADER.size
+    expected = {"op": b"private", "label": "é".encode("utf-8"), "data": b"\x00\x01"}
+    assert decode_frame(frame[FRAME_HEADER.size:]) == expected
+
+    async def read_all():
+        reader = asyncio.StreamReader()
+        reader.feed_data(frame + encode_frame({"op": "hello"}))
+        reader.feed_eof()
+        return [await read_frame(reader), await read_frame(reader)]
+
+    assert asyncio.run(read_all()) == [expected, {"op": b"hello"}]
+
+
+def test_share_batch_roundtrip():
+    vector = ShareVector(1, np.arange(5, dtype=np.int64))
+    batch = serialize_share_batch([("x", Share(0, 42)), ("v", vector)])
+    (x_label, x), (v_label, v) = deserialize_share_batch(batch)
+    assert (x_label, v_label) == ("x", "v")
+    assert (x.index, x.value) == (0, 42)
+    assert v.index == 1 and v.value.tolist() == list(range(5))
+    # The vector elements take 4 bytes each.
+    assert len(vector.serialize_bytes()) == 10 + default_field.element_bytes * 5
@@ -0,0 +1,212 @@
+"""
+Unit tests for the expression compiler.
+"""
+
+from compiler import (
+    compile_expression,
+    OP_ADD,
+    OP_INNER_PRODUCT,
+    OP_LINEAR,
+    OP_MATMUL,
+    OP_MULT,
+    OP_POLYNOMIAL,
+    OP_SCALAR,
+    OP_SECRET,
+    OP_SUB,
+    OP_VECTOR_SUM,
+    PREP_MATRIX,
+    PREP_POWERS,
+    PREP_SQUARE,
+    PREP_TRIPLET,
+)
+import pytest
+
+from expression import LinearCombination, Polynomial, Secret, SecretMatrix, SecretVector, Scalar
+from optimizer import optimize
+from protocol import ProtocolSpec
+from secret_sharing import default_q
+from smc_party import SMCParty
+
+
+def test_compile_order():
+    a, b = Secret(), Secret()
+    plan = compile_expression((a + b) * Scalar(3) - a)
+    ops = [instruction.op for instruction in plan]
+    assert ops == [OP_SECRET, OP_SECRET, OP_ADD, OP_SCALAR, OP_MULT, OP_SUB]
+    # Every operand is defined before it is used.
+    for position, instruction in enumerate(plan):
+        assert instruction.dest == position
+        assert all(arg < position for arg in instruction.args)
+    assert plan.output == len(plan) - 1
+
+
+def test_compile_reuses_shared_nodes():
+    a = Secret()
+    product = a * a
+    plan = compile_expression(product + product)
+    assert [instruction.op for instruction in plan] == [OP_SECRET, OP_MULT, OP_ADD]
+    assert plan.instructions[1].args == (0, 0)
+    assert plan.instructions[2].args == (1, 1)
+    assert plan.secret_ids() == [a.id]
+
+
+def test_compile_deep_chain():
+    expr = Scalar(0)
+    for i in range(20000):
+        expr += Scalar(i)
+    plan = compile_expression(expr)
+    assert len(plan) == 40001
+
+
+def test_execute_deep_chain():
+    expr = Scalar(1)
+    for i in range(1, 20000):
+        expr = expr * Scalar(i % 7 + 1) + Scalar(i)
+    expected = 1
+    for i in range(1, 20000):
+        expected = (expected * (i % 7 + 1) + i) % default_q
+
+    party = SMCParty("Alice", "localhost", 5000, ProtocolSpec(["Alice"], expr), {})
+    assert party.process_expression(expr) % default_q == expected
+
+
+def test_rounds():
+    a, b, c, d = Secret(), Secret(), Secret(), Secret()
+    # (a * b) and (c * d) are independent, the outer product depends on both.
+    plan = compile_expression((a * b + Scalar(1)) * (c * d) * Scalar(2))
+    assert plan.depth == 2
+    assert plan.beaver_count() == 3
+
+    rounds = plan.rounds()
+    assert len(rounds) == 3
+    multiplications, local = rounds[0]
+    assert multiplications == []
+    assert [instruction.op for instruction in local] == [
+        OP_SECRET, OP_SECRET, OP_SCALAR, OP_SECRET, OP_SECRET, OP_SCALAR
+    ]
+    multiplications, local = rounds[1]
+    assert len(multiplications) == 2
+    assert [instruction.op for instruction in local] == [OP_ADD]
+    multiplications, local = rounds[2]
+    assert len(multiplications) == 1
+    # Multiplying by a scalar does not need a round.
+    assert [instruction.op for instruction in local] == [OP_MULT]
+    assert not local[0].beaver and local[0].secret
+
+
+def test_rounds_of_chain():
+    secrets = [Secret() for _ in range(5)]
+    expr = secrets[0]
+    for secret in secrets[1:]:
+        expr *= secret
+    plan = compile_expression(expr)
+    assert plan.depth == 4
+    assert [len(multiplications) for multiplications, _ in plan.rounds()] == [0, 1, 1, 1, 1]
+
+
+def test_compile_linear_combination():
+    a, b = Secret(), Secret()
+    plan = compile_expression(LinearCombination([2, -1], [a, b * a], 5))
+    assert [instruction.op for instruction in plan] == [OP_SECRET, OP_SECRET, OP_MULT, OP_LINEAR]
+    linear = plan.instructions[-1]
+    assert linear.args == (0, 2)
+    assert linear.value == ((2, -1), 5)
+    assert linear.secret and linear.round == 1
+
+
+def test_compile_vector():
+    x, y, s = SecretVector(4), SecretVector(4), Secret()
+    plan = compile_expression((x * y + s * Scalar(2)).sum() + x.dot(x))
+    lengths = [instruction.length for instruction in plan]
+    assert lengths == [4, 4, 4, None, None, None, 4, None, None, None]
+    ops = [instruction.op for instruction in plan]
+    assert ops.count(OP_VECTOR_SUM) == 1 and ops.count(OP_INNER_PRODUCT) == 1
+    assert plan.beaver_count() == 2
+    assert plan.depth == 1
+
+
+def test_compile_vector_length_mismatch():
+    with pytest.raises(ValueError):
+        compile_expression(SecretVector(3) + SecretVector(4))
+    with pytest.raises(ValueError):
+        compile_expression(Secret().sum())
+
+
+def test_compile_matmul():
+    x, w, v = SecretVector(3), SecretMatrix(3, 2), SecretMatrix(2, 4)
+    plan = compile_expression((x @ w) @ v + Scalar(1))
+    matmuls = [instruction for instruction in plan if instruction.op == OP_MATMUL]
+    assert [instruction.value for instruction in matmuls] == [(1, 3, 2), (1, 2, 4)]
+    assert [instruction.shape for instruction in matmuls] == [(2,), (4,)]
+    assert plan.depth == 2 and plan.beaver_count() == 2
+    assert compile_expression(w @ v).instructions[-1].shape == (3, 4)
+    assert compile_expression(v @ SecretVector(4)).instructions[-1].shape == (2,)
+    # A public operand is multiplied locally, without a triplet.
+    public = compile_expression((w ** 0) @ v).instructions[-1]
+    assert public.secret and not public.beaver and public.round == 0 and public.shape == (3, 4)
+
+
+def test_compile_matmul_errors():
+    with pytest.raises(ValueError):
+        compile_expression(SecretMatrix(2, 3) @ SecretMatrix(2, 3))
+    with pytest.raises(ValueError):
+        compile_expression(SecretVector(3) @ SecretVector(3))
+    with pytest.raises(ValueError):
+        compile_expression(Secret() @ SecretMatrix(1, 1))
+
+
+def test_compile_inner_product():
+    x, y = SecretVector(1000), SecretVector(1000)
+    plan = compile_expression(x.dot(y) * Scalar(2))
+    inner = plan.instructions[2]
+    assert inner.op == OP_INNER_PRODUCT and inner.value == 1000 and inner.shape is None
+    assert plan.depth == 1 and plan.beaver_count() == 1
+    # A public operand is evaluated locally, without a triplet.
+    public = compile_expression((x ** 0).dot(y)).instructions[-1]
+    assert public.secret and not public.beaver and public.round == 0
+    assert not compile_expression((x ** 0).dot(y ** 0)).instructions[-1].secret
+    with pytest.raises(ValueError):
+        compile_expression(x.dot(SecretVector(999)))
+    with pytest.raises(ValueError):
+        compile_expression(x.dot(Secret()))
+
+
+def test_compile_squares():
+    a, b, x = Secret(), Secret(), SecretVector(5)
+    plan = compile_expression(a * a + a * b + (x * x).sum() + x.dot(x) + x.dot(x * a))
+    assert plan.beaver_count() == 6
+    assert plan.square_count() == 3
+    squares = [instruction for instruction in plan if instruction.square]
+    assert [(instruction.op, instruction.length) for instruction in squares] == [
+        (OP_MULT, None), (OP_MULT, 5), (OP_INNER_PRODUCT, None)
+    ]
+    # Equal but distinct subtrees are only squares once they are shared.
+    diff = (a - b) * (a - b)
+    assert compile_expression(diff).square_count() == 0
+    assert compile_expression(optimize(diff)).square_count() == 1
+
+
+def test_compile_polynomial():
+    x, a = Secret(), Secret()
+    plan = compile_expression(Polynomial(list(range(1, 10)), x * a) + x ** 3 + Polynomial([4, 5], x))
+    polynomials = [instruction for instruction in plan if instruction.op == OP_POLYNOMIAL]
+    assert [instruction.value for instruction in polynomials] == [tuple(range(1, 10)), (0, 0, 0, 1), (4, 5)]
+    # Any degree takes a single round, degree 1 is local.
+    assert [instruction.round for instruction in polynomials] == [2, 1, 0]
+    assert [instruction.beaver for instruction in polynomials] == [True, True, False]
+    assert plan.depth == 2
+
+
+def test_preprocessing():
+    a, b = Secret(), Secret()
+    x, m = SecretVector(3), SecretMatrix(2, 3)
+    y = m @ x
+    plan = compile_expression((a * b) * (a * a) + (x * x).sum() + y.dot(y) + (x ** 4).sum() + x.dot(x * b))
+    assert plan.preprocessing() == [
+        # Round 1
+        (PREP_TRIPLET, None), (PREP_SQUARE, None), (PREP_SQUARE, 3), (PREP_MATRIX, 2, 3, 1),
+        (PREP_POWERS, 4, 3), (PREP_TRIPLET, 3),
+        # Round 2
+        (PREP_TRIPLET, None), (PREP_SQUARE, 2), (PREP_MATRIX, 1, 3, 1),
+    ]
+    assert len(plan.preprocessing()) == plan.beaver_count()
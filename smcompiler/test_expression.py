@@ -5,7 +5,7 @@ Testing expressions is not obligatory.
 MODIFY THIS FILE.
 """
 
-from expression import Secret, Scalar, Expression
+from expression import Secret, Scalar, Expression, LinearCombination, Sum
 
 left_side_tests: list[Expression] = [
     Scalar(10) + Scalar(5) * Secret(1),
@@ -58,8 +58,38 @@ def test_unix_tree():
         test.print_tree_unix()
         print("_________________")
 
+
+def test_sum_builds_single_node():
+    secrets = [Secret() for _ in range(10000)]
+    expr = sum(secrets)
+    assert isinstance(expr, Sum)
+    assert expr.terms == secrets
+    assert expr.coeffs == [1] * 10000
+    assert expr.constant == 0
+
+
+def test_linear_combination_folding():
+    a, b, c = Secret(1), Secret(2), Secret(3)
+    partial = sum([a, b])
+    expr = partial + Scalar(2) * c - b * Scalar(3) + Scalar(5) - 1
+    assert isinstance(expr, LinearCombination) and not isinstance(expr, Sum)
+    assert repr(expr) == "Secret(1) + Secret(2) + Scalar(2) * Secret(3) - Scalar(3) * Secret(2) + Scalar(4)"
+    # Extending a combination leaves the original one untouched.
+    assert repr(partial) == "Secret(1) + Secret(2)"
+    assert repr(partial + c) == "Secret(1) + Secret(2) + Secret(3)"
+    assert repr(Scalar(3) * partial) == "Scalar(3) * Secret(1) + Scalar(3) * Secret(2)"
+    assert repr(a - partial) == "Secret(1) - Secret(1) - Secret(2)"
+    assert repr(partial * c) == "(Secret(1) + Secret(2)) * Secret(3)"
+    assert hash(sum([a, b, c])) == hash(sum([c, b, a]))
+
+
+def test_linear_combination_tree():
+    expr = LinearCombination([1, -2, 3], [Secret(1), Secret(2) * Secret(3), Secret(4)], 7) * Secret(5)
+    expr.print_tree()
+    expr.print_tree_unix()
+
 if __name__ == "__main__":
     #test_expr_construction()
     #test_unix_tree()
     #test_tree()
-    left_side()
\ No newline at end of file
+    left_side()
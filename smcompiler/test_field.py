@@ -0,0 +1,124 @@
+"""
+Unit tests for the field backends.
+"""
+
+import numpy as np
+import pytest
+
+from field import GmpyField, MersenneField, PrimeField
+from secret_sharing import (
+    beaver_matmul,
+    beaver_multiply,
+    beaver_polynomial,
+    beaver_square,
+    default_q,
+    deserialize_share,
+    gen_seeded_vector_share,
+    gen_share,
+    gen_share_batch,
+    reconstruct_shares,
+)
+
+
+FIELDS = [PrimeField(default_q), MersenneField()]
+
+
+def sample(field, length=200):
+    """Random elements, with the edge cases first."""
+    edges = [0, 1, 2, field.q - 2, field.q - 1]
+    return edges + [int(value) for value in field.random(length - len(edges))]
+
+
+@pytest.mark.parametrize("field", FIELDS, ids=lambda field: field.name)
+def test_arithmetic(field):
+    q = field.q
+    a, b = sample(field), sample(field)[::-1]
+    x, y = field.array(a), field.array(b)
+    assert [int(v) for v in field.add(x, y)] == [(u + v) % q for u, v in zip(a, b)]
+    assert [int(v) for v in field.sub(x, y)] == [(u - v) % q for u, v in zip(a, b)]
+    assert [int(v) for v in field.neg(x)] == [-u % q for u in a]
+    assert [int(v) for v in field.mul(x, y)] == [(u * v) % q for u, v in zip(a, b)]
+    assert [int(v) for v in field.mul(x, -3)] == [(u * -3) % q for u in a]
+    assert int(field.sum(x)) == sum(a) % q
+    assert [int(v) for v in field.array([-1, q, 2 * q + 5])] == [q - 1, 0, 5]
+
+
+@pytest.mark.parametrize("field", FIELDS, ids=lambda field: field.name)
+def test_matmul_and_wire_format(field):
+    q = field.q
+    a = np.array(sample(field, 12), dtype=object).reshape(3, 4)
+    b = np.array(sample(field, 8), dtype=object).reshape(4, 2)
+    product = field.matmul(field.array(a), field.array(b))
+    assert [[int(v) for v in row] for row in product] == ((a @ b) % q).tolist()
+    # A long inner dimension, with vector operands too.
+    a = np.array(sample(field, 3 * 500), dtype=object).reshape(3, 500)
+    b = np.array(sample(field, 500 * 4)[::-1], dtype=object).reshape(500, 4)
+    product = field.matmul(field.array(a), field.array(b))
+    assert [[int(v) for v in row] for row in product] == ((a @ b) % q).tolist()
+    assert [int(v) for v in field.matmul(field.array(a[0]), field.array(b))] == ((a[0] @ b) % q).tolist()
+    values = field.array(sample(field))
+    packed = field.pack(values)
+    assert len(packed) == field.element_bytes * len(values)
+    assert [int(v) for v in field.unpack(packed)] == [int(v) for v in values]
+
+
+@pytest.mark.parametrize("field", FIELDS, ids=lambda field: field.name)
+def test_shares_in_field(field):
+    q = field.q
+    secrets = sample(field, 50)
+    shares = gen_share_batch(secrets, 3, field)
+    restored = [deserialize_share(share.serialize_bytes(), field) for share in shares]
+    assert [int(v) for v in reconstruct_shares(restored)] == secrets
+    seeded = [deserialize_share(share.serialize_bytes(), field) for share in gen_seeded_vector_share(secrets, 3, field=field)]
+    assert [int(v) for v in reconstruct_shares(seeded)] == secrets
+    scalar = gen_share(q - 5, 3, field=field)
+    scalar = [deserialize_share(share.serialize_bytes(), field) for share in scalar]
+    assert reconstruct_shares([share * 2 + 7 for share in scalar]) == (2 * (q - 5) + 7) % q
+    vector = [share * -1 - 3 + share for share in shares]
+    assert [int(v) for v in reconstruct_shares(vector)] == [(-3) % q] * len(secrets)
+
+
+@pytest.mark.parametrize("field", FIELDS, ids=lambda field: field.name)
+def test_beaver_in_field(field):
+    q = field.q
+    x, y = field.array(sample(field, 6)), field.array(sample(field, 6)[::-1])
+    a, b = field.random(6), field.random(6)
+    triplet = list(zip(*(gen_share_batch(v, 2, field) for v in (a, b, field.mul(a, b)))))
+    d, e = field.sub(x, a), field.sub(y, b)
+    product = reconstruct_shares([beaver_multiply(i, triplet[i], d, e) for i in range(2)])
+    assert [int(v) for v in product] == [int(u) * int(v) % q for u, v in zip(x, y)]
+
+    pair = list(zip(*(gen_share_batch(v, 2, field) for v in (a, field.mul(a, a)))))
+    square = reconstruct_shares([beaver_square(i, pair[i], d) for i in range(2)])
+    assert [int(v) for v in square] == [int(u) ** 2 % q for u in x]
+
+    powers = list(zip(*(gen_share_batch(v, 2, field) for v in (a, field.mul(a, a), field.mul(field.mul(a, a), a)))))
+    coeffs = [5, -1, 0, 2]
+    poly = reconstruct_shares([beaver_polynomial(i, powers[i], d, coeffs) for i in range(2)])
+    assert [int(v) for v in poly] == [(5 - int(u) + 2 * int(u) ** 3) % q for u in x]
+
+    m_a, m_b = field.random((2, 3)), field.random((3, 2))
+    m_triplet = list(zip(*(
+        gen_share_batch(v.ravel(), 2, field) for v in (m_a, m_b, field.matmul(m_a, m_b))
+    )))
+    m_x, m_y = field.array(sample(field, 6)).reshape(2, 3), field.array(sample(field, 6)).reshape(3, 2)
+    m_d, m_e = field.sub(m_x, m_a).ravel(), field.sub(m_y, m_b).ravel()
+    matrix = reconstruct_shares([beaver_matmul(i, m_triplet[i], m_d, m_e, (2, 3, 2)) for i in range(2)])
+    expected = (np.array(m_x, dtype=object) @ np.array(m_y, dtype=object)) % q
+    assert [int(v) for v in matrix] == expected.ravel().tolist()
+
+
+def test_gmpy_field():
+    pytest.importorskip("gmpy2")
+    q = 2 ** 127 - 1
+    field = GmpyField(q)
+    a, b = sample(field, 20), sample(field, 20)[::-1]
+    assert [int(v) for v in field.mul(field.array(a), field.array(b))] == [(u * v) % q for u, v in zip(a, b)]
+    assert [int(v) for v in field.unpack(field.pack(field.array(a)))] == a
+    shares = gen_share_batch(a, 3, field)
+    assert [int(v) for v in reconstruct_shares(shares)] == a
+
+
+def test_prime_field_bounds():
+    with pytest.raises(ValueError):
+        PrimeField(2 ** 61 - 1)
@@ -10,36 +10,38 @@ import random
 import time
 from multiprocessing import Process, Queue
 import pytest
+from field import MersenneField
 from secret_sharing import default_q
-from expression import Scalar, Secret
+from expression import LinearCombination, Polynomial, Scalar, Secret, SecretMatrix, SecretVector
 from protocol import ProtocolSpec
 from server import run
 
 from smc_party import SMCParty
 
 
-def smc_client(client_id, prot, value_dict, queue):
+def smc_client(client_id, prot, value_dict, queue, field=None):
     cli = SMCParty(
         client_id,
         "localhost",
         8000,
         protocol_spec=prot,
-        value_dict=value_dict
+        value_dict=value_dict,
+        field=field
     )
     res = cli.run()
     queue.put(res)
     print(f"{client_id} has finished!")
 
 
-def smc_server(args):
-    run("localhost", 8000, args)
+def smc_server(args, field=None):
+    run("localhost", 8000, args, field)
 
 
-def run_processes(server_args, *client_args):
+def run_processes(server_args, *client_args, field=None):
     queue = Queue()
 
-    server = Process(target=smc_server, args=(server_args,))
-    clients = [Process(target=smc_client, args=(*args, queue)) for args in client_args]
+    server = Process(target=smc_server, args=(server_args, field))
+    clients = [Process(target=smc_client, args=(*args, queue, field)) for args in client_args]
 
     server.start()
     time.sleep(3)
@@ -64,16 +66,17 @@ def run_processes(server_args, *client_args):
     return results
 
 
-def suite(parties, expr, expected):
+def suite(parties, expr, expected, field=None):
     participants = list(parties.keys())
     prot = ProtocolSpec(expr=expr, participant_ids=participants)
     clients = [(name, prot, value_dict) for name, value_dict in parties.items()]
 
-    results = run_processes(participants, *clients)
+    results = run_processes(participants, *clients, field=field)
 
+    q = field.q if field is not None else default_q
     for result in results:
         print(f"Result: {result} (expected: {expected})")
-        assert result == expected%default_q
+        assert result == expected % q
 
 
 def test_suite1():
@@ -649,6 +652,90 @@ def just_one_party_secret():
     expected = expected * 5
     suite(parties, expr, expected % default_q)
 
+def test_sum_of_secrets():
+    """
+    f(a1, ..., c10) = sum(a) + 2 * sum(b) - c1 * c2 + 7
+    """
+    parties = {"Alice": {}, "Bob": {}, "Charlie": {}}
+    secrets = {}
+    for name in parties:
+        secrets[name] = [Secret() for _ in range(10)]
+        for i, secret in enumerate(secrets[name]):
+            parties[name][secret] = i + len(name)
+
+    expr = (
+        sum(secrets["Alice"])
+        + Scalar(2) * sum(secrets["Bob"])
+        - secrets["Charlie"][1] * secrets["Charlie"][2]
+        + LinearCombination([1, -1], [Scalar(10), Scalar(3)])
+    )
+    expected = sum(range(5, 15)) + 2 * sum(range(3, 13)) - 8 * 9 + 7
+    suite(parties, expr, expected)
+
+def test_vector_operations():
+    """
+    f(x, y, w, s) = sum(x * y + 3 * w - s) + x . (y * s) + 2
+    """
+    x, y, w, s = SecretVector(4), SecretVector(4), SecretVector(4), Secret()
+    parties = {
+        "Alice": {x: [1, 2, 3, 4]},
+        "Bob": {y: [5, 6, 7, default_q - 8], s: 3},
+        "Charlie": {w: [9, 10, 11, 12]},
+    }
+    expr = (x * y + Scalar(3) * w - s).sum() + x.dot(y * s) + Scalar(2)
+    xs, ys, ws = [1, 2, 3, 4], [5, 6, 7, -8], [9, 10, 11, 12]
+    expected = sum(a * b + 3 * c - 3 for a, b, c in zip(xs, ys, ws)) + sum(a * b * 3 for a, b in zip(xs, ys)) + 2
+    suite(parties, expr, expected)
+
+def test_matrix_product():
+    """
+    f(x, W, V) = (x @ W) @ V + 1, with x a vector, returned as a vector
+    """
+    x, w, v = SecretVector(3), SecretMatrix(3, 2), SecretMatrix(2, 2)
+    xs, ws, vs = [1, 2, 3], [[1, 2], [3, 4], [5, default_q - 6]], [[7, 8], [9, 10]]
+    parties = {"Alice": {x: xs}, "Bob": {w: ws}, "Charlie": {v: vs}}
+    expr = (x @ w) @ v + Scalar(1)
+    prot = ProtocolSpec(expr=expr, participant_ids=list(parties))
+    results = run_processes(list(parties), *[(name, prot, values) for name, values in parties.items()])
+
+    xw = [sum(xs[i] * ws[i][j] for i in range(3)) for j in range(2)]
+    expected = [(sum(xw[i] * vs[i][j] for i in range(2)) + 1) % default_q for j in range(2)]
+    for result in results:
+        assert result == expected
+
+def test_squares():
+    """
+    f(a, b, x) = (a - b)^2 + x . x + sum(x * x * a)
+    """
+    a, b, x = Secret(), Secret(), SecretVector(3)
+    parties = {"Alice": {a: 12, x: [1, 2, default_q - 3]}, "Bob": {b: 5}}
+    diff = a - b
+    expr = diff * diff + x.dot(x) + (x * x * a).sum()
+    expected = 7 * 7 + 14 + 14 * 12
+    suite(parties, expr, expected)
+
+def test_polynomial():
+    """
+    f(a, b) = 2 + 3(a + b) - (a + b)^4 + (a + b)^8 + b^2
+    """
+    a, b = Secret(), Secret()
+    parties = {"Alice": {a: 3}, "Bob": {b: 4}, "Charlie": {}}
+    expr = Polynomial([2, 3, 0, 0, -1, 0, 0, 0, 1], a + b) + b ** 2
+    expected = 2 + 3 * 7 - 7 ** 4 + 7 ** 8 + 16
+    suite(parties, expr, expected)
+
+def test_mersenne_field():
+    """
+    f(a, b, v, w) = (a * b - 3)^3 + <v, w> in the 61-bit Mersenne field,
+    where the result does not fit in the default field.
+    """
+    a, b = Secret(), Secret()
+    v, w = SecretVector(3), SecretVector(3)
+    parties = {"Alice": {a: 10 ** 6, v: [1, 2, 3]}, "Bob": {b: 10 ** 5, w: [4, 5, 6]}, "Charlie": {}}
+    expr = (a * b - Scalar(3)) ** 3 + v.dot(w)
+    expected = (10 ** 11 - 3) ** 3 + 32
+    suite(parties, expr, expected, field=MersenneField())
+
 tests = [
         test_suite1,
         test_suite2,
@@ -0,0 +1,299 @@
+"""
+Unit tests for the expression optimization passes.
+"""
+
+from functools import reduce
+import random
+
+import numpy as np
+
+from compiler import (
+    compile_expression,
+    OP_ADD,
+    OP_INNER_PRODUCT,
+    OP_LINEAR,
+    OP_MATMUL,
+    OP_POLYNOMIAL,
+    OP_SCALAR,
+    OP_SECRET,
+    OP_SUB,
+    OP_VECTOR_SUM,
+)
+from expression import LinearCombination, Polynomial, Power, Secret, SecretMatrix, SecretVector, Scalar
+from optimizer import (
+    eliminate_common_subexpressions,
+    fold_constants,
+    multiplicative_depth,
+    optimize,
+    reduce_tree_height,
+)
+from secret_sharing import default_q
+
+
+def evaluate(expr, values):
+    """Evaluates the expression in the clear, `values` maps secret ids to their value."""
+    plan = compile_expression(expr)
+    registers = [None] * plan.num_registers
+    for instruction in plan:
+        if instruction.op == OP_SCALAR:
+            result = instruction.value
+        elif instruction.op == OP_SECRET:
+            result = values[instruction.value]
+        elif instruction.op == OP_MATMUL:
+            m, k, n = instruction.value
+            left, right = (registers[arg] for arg in instruction.args)
+            result = (left.reshape(m, k) @ right.reshape(k, n)).ravel()
+        elif instruction.op == OP_INNER_PRODUCT:
+            left, right = (registers[arg] for arg in instruction.args)
+            result = int(np.dot(left, right))
+        elif instruction.op == OP_POLYNOMIAL:
+            operand = registers[instruction.args[0]]
+            result = sum((c * operand ** j for j, c in enumerate(instruction.value)), 0)
+        elif instruction.op == OP_VECTOR_SUM:
+            result = sum(registers[instruction.args[0]])
+        elif instruction.op == OP_LINEAR:
+            coeffs, constant = instruction.value
+            result = sum((c * registers[arg] for c, arg in zip(coeffs, instruction.args)), constant)
+        else:
+            left, right = (registers[arg] for arg in instruction.args)
+            if instruction.op == OP_ADD:
+                result = left + right
+            elif instruction.op == OP_SUB:
+                result = left - right
+            else:
+                result = left * right
+        registers[instruction.dest] = result % default_q
+    return registers[plan.output]
+
+
+def random_values(secrets):
+    return {secret.id: random.randint(0, default_q - 1) for secret in secrets}
+
+
+def test_product_chain_depth():
+    secrets = [Secret() for _ in range(64)]
+    expr = reduce(lambda x, y: x * y, secrets)
+    balanced, depth = reduce_tree_height(expr)
+    assert multiplicative_depth(expr) == 63
+    assert depth == 6
+    assert multiplicative_depth(balanced) == 6
+
+    values = random_values(secrets)
+    assert evaluate(balanced, values) == evaluate(expr, values)
+
+
+def test_product_chain_with_scalars():
+    # Built like perf_eval.secret_mult_test, with public factors in between.
+    secrets = [Secret() for _ in range(10)]
+    expr = Scalar(1)
+    for i, secret in enumerate(secrets):
+        expr *= secret * Scalar(i + 2)
+    balanced, depth = reduce_tree_height(expr)
+    assert multiplicative_depth(expr) == 9
+    assert depth == multiplicative_depth(balanced) == 4
+
+    values = random_values(secrets)
+    assert evaluate(balanced, values) == evaluate(expr, values)
+
+
+def test_sum_chain():
+    secrets = [Secret() for _ in range(9)]
+    expr = Scalar(100)
+    for i, secret in enumerate(secrets):
+        expr = expr - secret if i % 3 == 0 else expr + secret
+    expr = expr * secrets[0] - (secrets[1] - secrets[2] * secrets[3])
+    balanced, depth = reduce_tree_height(expr)
+    assert depth == multiplicative_depth(balanced) <= multiplicative_depth(expr)
+
+    values = random_values(secrets)
+    assert evaluate(balanced, values) == evaluate(expr, values)
+
+
+def test_shared_subexpression_is_kept():
+    a, b, c = Secret(), Secret(), Secret()
+    shared = a * b
+    expr = shared * c + shared
+    balanced, _ = reduce_tree_height(expr)
+    # The shared product must not be flattened into the outer product.
+    assert compile_expression(balanced).beaver_count() == 2
+
+    values = random_values([a, b, c])
+    assert evaluate(balanced, values) == evaluate(expr, values)
+
+
+def test_deep_chain():
+    secrets = [Secret() for _ in range(5000)]
+    expr = Scalar(1)
+    for secret in secrets:
+        expr *= secret
+    assert multiplicative_depth(optimize(expr)) == 13
+
+
+def test_fold_scalar_subtrees():
+    expr = (Scalar(3) + Scalar(4)) * Scalar(5) - Scalar(default_q + 2)
+    folded = fold_constants(expr)
+    assert isinstance(folded, Scalar)
+    assert folded.value == 33
+
+
+def test_fold_nested_scalar_multipliers():
+    s = Secret()
+    folded = fold_constants(Scalar(3) * (Scalar(2) * s))
+    assert repr(folded) == "Scalar(6) * Secret()"
+    assert folded.right is s
+
+
+def test_fold_single_constant_adjustment():
+    a, b = Secret(), Secret()
+    expr = Scalar(0)
+    for i in range(100):
+        expr += Scalar(i)
+    expr = (expr + a) * Scalar(2) + b - Scalar(10) + a
+    folded = fold_constants(expr)
+    assert repr(folded) == f"Scalar(3) * Secret() + Secret() + Scalar({2 * sum(range(100)) - 10})"
+
+    ops = [instruction.op for instruction in compile_expression(folded)]
+    assert ops == [OP_SECRET, OP_SECRET, OP_LINEAR]
+
+    values = random_values([a, b])
+    assert evaluate(folded, values) == evaluate(expr, values)
+
+
+def test_fold_distributes_constants():
+    a, b = Secret(), Secret()
+    expr = (a + Scalar(5)) * (Scalar(8) - b) - a * Scalar(8)
+    folded = fold_constants(expr)
+    plan = compile_expression(folded)
+    assert plan.beaver_count() == 1
+
+    values = random_values([a, b])
+    assert evaluate(folded, values) == evaluate(expr, values)
+
+
+def test_fold_cancelling_terms():
+    a, b = Secret(), Secret()
+    folded = fold_constants(a + b - a + Scalar(1))
+    assert repr(folded) == "Secret() + Scalar(1)"
+    assert folded.terms == [b]
+
+
+def test_optimize_preserves_value():
+    secrets = [Secret() for _ in range(12)]
+    s = secrets
+    expr = (
+        (s[0] + Scalar(5)) * (Scalar(8) - s[1]) + (s[2] * Scalar(2)) - (s[3] - s[4]) * s[5]
+        - s[6] + (Scalar(11) * Scalar(6)) + (Scalar(99) - Scalar(6) * s[7]) - s[8]
+        + s[9] * (s[10] - s[11])
+    )
+    values = random_values(secrets)
+    assert evaluate(optimize(expr), values) == evaluate(expr, values)
+
+
+def test_structural_hash():
+    a, b = Secret(), Secret()
+    assert hash(a) == hash(a.id)
+    assert hash(Scalar(3)) == hash(Scalar(3))
+    assert hash((a - b) * (a - b)) == hash((a - b) * (a - b))
+    assert hash(a * b + Scalar(1)) == hash(Scalar(1) + b * a)
+
+
+def test_cse_shares_repeated_product():
+    a, b, c = Secret(), Secret(), Secret()
+    expr = (a - b) * (a - b) + c * ((a - b) * (a - b))
+    shared = eliminate_common_subexpressions(expr)
+    plan = compile_expression(shared)
+    # (a - b) is computed once, and so is its square.
+    assert [instruction.op for instruction in plan].count(OP_SUB) == 1
+    assert plan.beaver_count() == 2
+    assert compile_expression(expr).beaver_count() == 3
+
+    values = random_values([a, b, c])
+    assert evaluate(shared, values) == evaluate(expr, values)
+
+
+def test_cse_commutative():
+    a, b = Secret(), Secret()
+    shared = eliminate_common_subexpressions(a * b - b * a)
+    assert shared.left is shared.right
+
+
+def test_optimize_repeated_product():
+    a, b = Secret(), Secret()
+    expr = (a - b) * (a - b) + Scalar(3) * ((a - b) * (a - b))
+    optimized = optimize(expr)
+    assert compile_expression(optimized).beaver_count() == 1
+
+    values = random_values([a, b])
+    assert evaluate(optimized, values) == evaluate(expr, values)
+
+
+def test_fold_linear_combination():
+    a, b, c = Secret(), Secret(), Secret()
+    expr = sum([a, b, c]) * Scalar(2) - LinearCombination([2, 1], [a, c * b], 3) + Scalar(4)
+    folded = fold_constants(expr)
+    assert isinstance(folded, LinearCombination)
+    assert folded.constant == 1
+    assert compile_expression(folded).beaver_count() == 1
+
+    values = random_values([a, b, c])
+    assert evaluate(folded, values) == evaluate(expr, values)
+    assert evaluate(optimize(expr), values) == evaluate(expr, values)
+
+
+def test_fold_long_chain_into_linear_combination():
+    secrets = [Secret() for _ in range(2000)]
+    expr = Scalar(0)
+    for secret in secrets:
+        expr += secret
+    plan = compile_expression(optimize(expr))
+    assert [instruction.op for instruction in plan].count(OP_LINEAR) == 1
+    assert len(plan) == 2001
+
+
+def test_optimize_vector_expression():
+    x, y, s = SecretVector(3), SecretVector(3), Secret()
+    expr = (x * y * s * x + (Scalar(2) + Scalar(3)) * x).sum() + (x - x + y).dot(y) * s
+    optimized = optimize(expr)
+    assert multiplicative_depth(optimized) == 2
+
+    values = {x.id: np.array([1, 2, 3]), y.id: np.array([4, 5, default_q - 6]), s.id: 7}
+    assert evaluate(optimized, values) == evaluate(expr, values)
+    # The pass tracks the depth of the plan it builds.
+    for expr in [expr, (x ** 3).sum() * s * s, (x ** 0).dot(y) * s]:
+        balanced, depth = reduce_tree_height(expr)
+        assert depth == multiplicative_depth(balanced)
+
+
+def test_fold_cancelling_vectors():
+    v, w, s = SecretVector(3), SecretVector(3), Secret()
+    values = {v.id: np.array([1, 2, 3]), w.id: np.array([4, 5, 6]), s.id: 7}
+    # The terms cancel out but the result is still a vector.
+    for expr in [v - v, Scalar(0) * v, v - v + Scalar(2), (v - v + Scalar(2)) * s, v * w - w * v + s]:
+        for optimized in [fold_constants(expr), optimize(expr)]:
+            plan = compile_expression(optimized)
+            assert plan.instructions[plan.output].shape == (3,)
+            assert evaluate(optimized, values).tolist() == evaluate(expr, values).tolist()
+    assert evaluate(optimize((v - v + Scalar(2)).sum()), values) == 6
+    assert evaluate(optimize((Scalar(0) * v).dot(w) + s), values) == 7
+
+
+def test_optimize_matrix_product():
+    w, v = SecretMatrix(2, 2), SecretMatrix(2, 2)
+    expr = ((w + Scalar(1)) @ v) @ (v * w) + (Scalar(2) + Scalar(3)) * (w @ v)
+    optimized = optimize(expr)
+    assert compile_expression(optimized).beaver_count() == 4
+
+    values = {w.id: np.array([1, 2, 3, 4]), v.id: np.array([5, 6, 7, default_q - 8])}
+    assert evaluate(optimized, values).tolist() == evaluate(expr, values).tolist()
+
+
+def test_cse_polynomials():
+    x = Secret()
+    expr = x ** 2 * Polynomial([0, 0, 1], x) + Power(x, 3)
+    shared = eliminate_common_subexpressions(expr)
+    assert shared.left.left is shared.left.right
+    assert compile_expression(shared).square_count() == 1
+    assert hash(x ** 3) != hash(x ** 2)
+
+    values = random_values([x])
+    assert evaluate(optimize(expr), values) == evaluate(expr, values)
@@ -0,0 +1,167 @@
+"""
+Unit tests for the push server and AsyncCommunication.
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from communication import AsyncCommunication
+from compiler import PREP_TRIPLET
+from expression import Scalar, Secret, SecretVector
+from protocol import ProtocolSpec
+from push_server import PushServer
+from secret_sharing import default_q, reconstruct_shares
+from smc_party import SMCParty
+from ttp import TrustedParamGenerator
+
+
+def start_server(participants):
+    ttp = TrustedParamGenerator(pool_size=0)
+    for participant in participants:
+        ttp.add_participant(participant)
+    server = PushServer(ttp)
+    loop = asyncio.new_event_loop()
+    tcp = loop.run_until_complete(asyncio.start_server(server.handle_connection, "localhost", 0))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    async def shutdown():
+        tcp.close()
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stop():
+        asyncio.run_coroutine_threadsafe(shutdown(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+    return server, tcp.sockets[0].getsockname()[1], stop
+
+
+@pytest.fixture
+def push_server():
+    server, port, stop = start_server(["Alice", "Bob", "Charlie"])
+    yield port
+    stop()
+
+
+def test_messages(push_server):
+    alice = AsyncCommunication("localhost", push_server, "Alice")
+    bob = AsyncCommunication("localhost", push_server, "Bob")
+    alice.send_private_message("Bob", "stored", b"first")
+    assert bob.retrieve_private_message("stored") == b"first"
+
+    # A retrieval waiting for its message gets it pushed as soon as it is published.
+    sent = []
+
+    def publish_later():
+        time.sleep(0.3)
+        sent.append(time.perf_counter())
+        alice.publish_message("pushed", "second")
+
+    publisher = threading.Thread(target=publish_later)
+    publisher.start()
+    assert bob.retrieve_public_message("Alice", "pushed") == b"second"
+    assert time.perf_counter() - sent[0] < 0.1
+    publisher.join()
+    assert alice.get_bytes_sent() == len(b"first") + len(b"second")
+    assert bob.get_bytes_received() == len(b"first") + len(b"second")
+    alice.close()
+    bob.close()
+
+
+def test_batches(push_server):
+    alice = AsyncCommunication("localhost", push_server, "Alice")
+    bob = AsyncCommunication("localhost", push_server, "Bob")
+    alice.send_many([("Bob", "batch-0", b"zero"), ("Bob", "batch-1", "one")])
+    alice.publish_message("batch-public", b"from Alice")
+    bob.publish_message("batch-public", b"from Bob")
+    assert bob.retrieve_many(["batch-1", "batch-0"]) == [b"one", b"zero"]
+    channels = [("Alice", "batch-public"), ("Bob", "batch-public")]
+    assert alice.retrieve_public_many(channels) == [b"from Alice", b"from Bob"]
+    alice.close()
+    bob.close()
+
+
+def test_trusted_parameters(push_server):
+    clients = [AsyncCommunication("localhost", push_server, name) for name in ["Alice", "Bob", "Charlie"]]
+    triplets = [client.retrieve_beaver_triplet_shares("0") for client in clients]
+    a, b, c = (reconstruct_shares([triplet[i] for triplet in triplets]) for i in range(3))
+    assert (a * b - c) % default_q == 0
+
+    batches = [client.retrieve_preprocessing([("1", PREP_TRIPLET, 4)]) for client in clients]
+    a, b, c = (reconstruct_shares([batch["1"][i] for batch in batches]) for i in range(3))
+    assert ((a * b - c) % default_q).tolist() == [0] * 4
+
+    with pytest.raises(RuntimeError):
+        AsyncCommunication("localhost", push_server, "Mallory").retrieve_beaver_triplet_shares("2")
+    for client in clients:
+        client.close()
+
+
+def test_smc_party(push_server):
+    a, b, c = Secret(), Secret(), Secret()
+    v, w = SecretVector(3), SecretVector(3)
+    parties = {"Alice": {a: 3, v: [1, 2, 3]}, "Bob": {b: 14, w: [4, 5, 6]}, "Charlie": {c: 2}}
+    expr = a * b * c + Scalar(5) + v.dot(w)
+    prot = ProtocolSpec(expr=expr, participant_ids=list(parties))
+    results = {}
+
+    def party(name):
+        results[name] = SMCParty(name, "localhost", push_server, prot, parties[name], transport="push").run()
+
+    threads = [threading.Thread(target=party, args=(name,)) for name in parties]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == {name: 3 * 14 * 2 + 5 + 32 for name in parties}
+
+
+def test_server_opening(push_server):
+    a, b, c = Secret(), Secret(), Secret()
+    v, w = SecretVector(3), SecretVector(3)
+    parties = {"Alice": {a: 3, v: [1, 2, 3]}, "Bob": {b: 14, w: [4, 5, 6]}, "Charlie": {c: 2}}
+    results = {}
+
+    def party(name, prot, values):
+        smc_party = SMCParty(name, "localhost", push_server, prot, values, transport="push", server_opening=True)
+        results[name] = smc_party.run()
+
+    def run(expr, values):
+        prot = ProtocolSpec(expr=expr, participant_ids=list(values))
+        threads = [threading.Thread(target=party, args=(name, prot, values[name])) for name in values]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    run(a * b * c * v + w, parties)
+    assert results == {name: [84 + 4, 168 + 5, 252 + 6] for name in parties}
+    # A second computation on the same server opens its own result. The trusted
+    # parameters are indexed by operation, so it has no multiplication.
+    x, y, z = Secret(), Secret(), Secret()
+    run(x * Scalar(2) + y - z, {"Alice": {x: 5}, "Bob": {y: 6}, "Charlie": {z: 7}})
+    assert results == {name: 9 for name in parties}
+
+
+def test_many_parties():
+    names = [f"p{i}" for i in range(200)]
+    server, port, stop = start_server(names)
+    clients = [AsyncCommunication("localhost", port, name) for name in names]
+    for i, client in enumerate(clients):
+        client.send_private_message(names[(i + 1) % len(names)], "ring", str(i))
+        client.publish_message("all", str(i))
+    for i, client in enumerate(clients):
+        assert client.retrieve_private_message("ring") == str((i - 1) % len(names)).encode()
+    assert server.connections == len(names)
+    assert [clients[0].retrieve_public_message(name, "all") for name in names] == [str(i).encode() for i in range(len(names))]
+    for client in clients:
+        client.close()
+    stop()
@@ -0,0 +1,47 @@
+"""
+Unit tests for the bulk randomness.
+"""
+
+import numpy as np
+
+from randomness import RandomSource, default_source
+from secret_sharing import default_q
+
+
+def test_field_elements_range_and_shape():
+    values = default_source.field_elements((3, 1000), default_q)
+    assert values.shape == (3, 1000)
+    assert values.dtype == np.int64
+    assert values.min() >= 0 and values.max() < default_q
+    # 3000 draws among ~500000 values are almost never all equal.
+    assert len(np.unique(values)) > 2900
+
+
+def test_field_elements_uniform():
+    # With q = 5, three bits are drawn and 5, 6, 7 must be rejected.
+    values = default_source.field_elements(50000, 5)
+    counts = np.bincount(values, minlength=5)
+    assert len(counts) == 5
+    assert (abs(counts - 10000) < 600).all()
+
+
+def test_large_modulus():
+    q = 2**61 - 1
+    values = RandomSource().field_elements(1000, q)
+    assert values.min() >= 0 and values.max() < q
+    assert values.max() > 2**59
+
+
+def test_seeded_source_is_deterministic():
+    first = RandomSource(b"seed", buffer_size=64)
+    second = RandomSource(b"seed")
+    assert first.bytes(100000) == second.bytes(100000)
+    assert first.field_elements(10, default_q).tolist() == second.field_elements(10, default_q).tolist()
+    assert RandomSource(b"other").bytes(32) != RandomSource(b"seed").bytes(32)
+
+
+def test_bytes_are_consumed():
+    source = RandomSource(buffer_size=16)
+    chunks = [source.bytes(10) for _ in range(10)]
+    assert all(len(chunk) == 10 for chunk in chunks)
+    assert len(set(chunks)) == 10
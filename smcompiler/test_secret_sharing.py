@@ -5,6 +5,196 @@ Testing secret sharing is not obligatory.
 MODIFY THIS FILE.
 """
 
+import numpy as np
+import pytest
+
+import secret_sharing
+from secret_sharing import (
+    BeaverState,
+    Share,
+    beaver_inner_product,
+    beaver_matmul,
+    beaver_multiply,
+    beaver_polynomial,
+    beaver_square,
+    default_q,
+    deserialize_share,
+    ShareVector,
+    gen_share,
+    gen_seeded_vector_share,
+    gen_share_batch,
+    gen_vector_share,
+    prg_expand,
+    reconstruct_share_batch,
+    reconstruct_shares,
+)
+
 
 def test():
     raise NotImplementedError("You can create some tests.")
+
+
+def test_vector_share_roundtrip():
+    secret = [0, 1, default_q - 1, 123456, 7]
+    shares = gen_vector_share(secret, 3)
+    assert reconstruct_shares(shares).tolist() == secret
+
+    restored = [deserialize_share(share.serialize_bytes()) for share in shares]
+    assert [share.index for share in restored] == [0, 1, 2]
+    assert reconstruct_shares(restored).tolist() == secret
+    # A scalar share is still deserialized as one.
+    assert isinstance(deserialize_share(Share(1, 5).serialize_bytes()), Share)
+
+
+def test_vector_share_operations():
+    x, y = [1, 2, 3], [10, 20, 30]
+    x_shares, y_shares = gen_vector_share(x, 2), gen_vector_share(y, 2)
+    scalar_shares = gen_share(4, 2)
+
+    added = [a + b - 1 for a, b in zip(x_shares, y_shares)]
+    assert reconstruct_shares(added).tolist() == [10, 21, 32]
+    scaled = [2 - share * -3 for share in x_shares]
+    assert reconstruct_shares(scaled).tolist() == [5, 8, 11]
+    broadcast = [s + v for s, v in zip(scalar_shares, x_shares)]
+    assert reconstruct_shares(broadcast).tolist() == [5, 6, 7]
+
+
+def test_vector_beaver_multiply():
+    a, b = np.array([3, 5, 7]), np.array([11, 13, 17])
+    triplets = list(zip(*(gen_vector_share(v, 3) for v in (a, b, (a * b) % default_q))))
+    x, y = np.array([2, default_q - 1, 9]), np.array([4, 6, default_q - 8])
+    d, e = (x - a) % default_q, (y - b) % default_q
+    products = [beaver_multiply(i, triplet, d, e) for i, triplet in enumerate(triplets)]
+    assert reconstruct_shares(products).tolist() == ((x * y) % default_q).tolist()
+
+
+def test_matrix_beaver_multiply():
+    rng = np.random.default_rng()
+    a, b = rng.integers(0, default_q, (2, 3)), rng.integers(0, default_q, (3, 4))
+    triplets = list(zip(*(gen_vector_share(v, 3) for v in (a, b, (a @ b) % default_q))))
+    x, y = rng.integers(0, default_q, (2, 3)), rng.integers(0, default_q, (3, 4))
+    d, e = ((x - a) % default_q).ravel(), ((y - b) % default_q).ravel()
+    products = [beaver_matmul(i, triplet, d, e, (2, 3, 4)) for i, triplet in enumerate(triplets)]
+    assert reconstruct_shares(products).tolist() == ((x @ y) % default_q).ravel().tolist()
+
+
+def test_inner_product():
+    rng = np.random.default_rng()
+    a, b = rng.integers(0, default_q, 50), rng.integers(0, default_q, 50)
+    triplets = list(zip(*(gen_vector_share(v, 2) for v in (a, b, [int(a @ b) % default_q]))))
+    x, y = rng.integers(0, default_q, 50), rng.integers(0, default_q, 50)
+    d, e = (x - a) % default_q, (y - b) % default_q
+    products = [beaver_inner_product(i, triplet, d, e) for i, triplet in enumerate(triplets)]
+    assert all(isinstance(product, Share) for product in products)
+    assert reconstruct_shares(products) == int(x @ y) % default_q
+
+
+def test_square():
+    a, x = 1234, default_q - 77
+    pairs = list(zip(gen_share(a, 3), gen_share(a * a, 3)))
+    squares = [beaver_square(i, pair, (x - a) % default_q) for i, pair in enumerate(pairs)]
+    assert reconstruct_shares(squares) == (x * x) % default_q
+
+    a, x = np.array([3, 5, 7]), np.array([default_q - 1, 2, 100000])
+    pairs = list(zip(gen_vector_share(a, 2), gen_vector_share(a * a, 2)))
+    squares = [beaver_square(i, pair, (x - a) % default_q) for i, pair in enumerate(pairs)]
+    assert reconstruct_shares(squares).tolist() == ((x * x) % default_q).tolist()
+
+
+def test_polynomial():
+    coeffs = [5, -3, 0, 7, 1, 0, 0, 0, 2]
+    r, x = 98765, 4321
+    powers = [pow(r, j, default_q) for j in range(1, 9)]
+    shares = list(zip(*(gen_share(power, 3) for power in powers)))
+    results = [beaver_polynomial(i, power_shares, (x - r) % default_q, coeffs) for i, power_shares in enumerate(shares)]
+    assert reconstruct_shares(results) == sum(c * x ** j for j, c in enumerate(coeffs)) % default_q
+
+    r, x = np.array([3, 99, default_q - 5]), np.array([7, 0, 12345])
+    powers = [(r ** j) % default_q for j in range(1, 4)]
+    shares = list(zip(*(gen_vector_share(power, 2) for power in powers)))
+    results = [beaver_polynomial(i, power_shares, (x - r) % default_q, [1, 0, 0, 1]) for i, power_shares in enumerate(shares)]
+    assert reconstruct_shares(results).tolist() == [(int(v) ** 3 + 1) % default_q for v in x]
+
+
+def test_share_batch():
+    secrets = [5, default_q - 1, 0, 123, default_q + 7]
+    shares = gen_share_batch(secrets, 4)
+    assert [share.index for share in shares] == [0, 1, 2, 3]
+    assert reconstruct_share_batch(shares).tolist() == [s % default_q for s in secrets]
+
+
+def test_seeded_vector_share():
+    secret = np.arange(1000) * 997
+    shares = gen_seeded_vector_share(secret, 4)
+    assert [share.index for share in shares] == [0, 1, 2, 3]
+    restored = [deserialize_share(share.serialize_bytes()) for share in shares]
+    assert all(isinstance(share, ShareVector) for share in restored)
+    assert reconstruct_shares(restored).tolist() == (secret % default_q).tolist()
+    # Only the correction share is sent in full, the others are a header and a seed.
+    assert len(shares[0].serialize_bytes()) > 4 * len(secret)
+    assert all(len(share.serialize_bytes()) == 10 + 16 for share in shares[1:])
+
+
+def test_prg_expand():
+    seed = b"0123456789abcdef"
+    values = prg_expand(seed, 10000)
+    assert values.tolist() == prg_expand(seed, 10000).tolist()
+    assert values[:10].tolist() == prg_expand(seed, 10).tolist()
+    assert values.min() >= 0 and values.max() < default_q
+    assert values.tolist() != prg_expand(b"fedcba9876543210", 10000).tolist()
+
+
+def test_lazy_reduction():
+    x = gen_vector_share(np.arange(100), 3)
+    total = [share for share in x]
+    for _ in range(1000):
+        total = [t + share * (default_q - 1) - 3 for t, share in zip(total, x)]
+    # The raw values were not reduced at every step.
+    assert total[1]._bound > default_q
+    expected = (np.arange(100) * (1 - 1000) - 3000) % default_q
+    assert reconstruct_shares(total).tolist() == expected.tolist()
+
+    # Adding raw values close to the int64 limit reduces them first.
+    big = ShareVector(1, np.full(3, 2 ** 61), bound=2 ** 61)
+    assert ((big + big + big).value == (3 * (2 ** 61 % default_q)) % default_q).all()
+
+    # Negated raw values are reduced before they are read or sent.
+    negated = -ShareVector(1, [5, 6, 7])
+    assert negated.value.tolist() == [default_q - 5, default_q - 6, default_q - 7]
+    differences = [4 - share for share in gen_vector_share([1, 2, 10], 3)]
+    restored = [deserialize_share(share.serialize_bytes()) for share in differences]
+    assert reconstruct_shares(restored).tolist() == [3, 2, default_q - 6]
+
+
+def test_share_ids_are_lazy(monkeypatch):
+    generated = []
+    gen_id = secret_sharing.gen_id
+    monkeypatch.setattr(secret_sharing, "gen_id", lambda: generated.append(1) or gen_id())
+    share = Share(0, 3)
+    for i in range(1000):
+        share = share * 2 + Share(1, i) - 5
+    assert not generated
+    assert not hasattr(share, "__dict__")
+    # The binary wire format does not carry ids.
+    payload = share.serialize_bytes()
+    assert not generated
+    assert len(payload) == 10
+    assert Share.deserialize_bytes(payload).value == share.value
+    # The id is generated once the share is sent in the text format.
+    share.serialize()
+    assert len(generated) == 1
+
+
+def test_beaver_state():
+    x, y = 1234, 98765
+    a, b = 111, 222
+    triplet_shares = list(zip(gen_share(a, 2), gen_share(b, 2), gen_share(a * b, 2)))
+    states = [BeaverState(triplet) for triplet in triplet_shares]
+    with pytest.raises(ValueError):
+        states[0].multiply(0)
+    with pytest.raises(ValueError):
+        Share(0, x) * Share(0, y)
+    for state in states:
+        state.d, state.e = (x - a) % default_q, (y - b) % default_q
+    products = [state.multiply(i) for i, state in enumerate(states)]
+    assert reconstruct_shares(products) == (x * y) % default_q
@@ -0,0 +1,206 @@
+"""
+Unit tests for the HTTP transport of the trusted server.
+"""
+
+import http.client
+import http.server
+import socket
+import threading
+import time
+from wsgiref.simple_server import make_server
+
+import pytest
+import requests
+
+import server as server_module
+from codec import decode_envelope
+from communication import Communication
+from secret_sharing import default_field
+from server import KeepAliveRequestHandler, ThreadingWSGIServer, app
+from ttp import TrustedParamGenerator
+
+
+@pytest.fixture
+def server():
+    httpd = make_server("localhost", 0, app, server_class=ThreadingWSGIServer, handler_class=KeepAliveRequestHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd.server_address[1]
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_keep_alive(server):
+    connection = http.client.HTTPConnection("localhost", server)
+    connection.request("POST", "/private/Alice/Bob/keep-alive", b"hello")
+    assert connection.getresponse().read() == b""
+    sock = connection.sock
+    # All the requests go through the same socket.
+    connection.request("GET", "/private/Bob/keep-alive")
+    response = connection.getresponse()
+    assert (response.status, response.read()) == (200, b"hello")
+    connection.request("GET", "/private/Bob/missing")
+    response = connection.getresponse()
+    assert (response.status, response.read()) == (404, b"")
+    assert connection.sock is sock
+    # The server announces that it closes the connection when asked to.
+    connection.request("GET", "/private/Bob/keep-alive", headers={"Connection": "close"})
+    response = connection.getresponse()
+    assert response.getheader("Connection") == "close"
+    assert response.read() == b"hello"
+    connection.close()
+
+
+@pytest.mark.parametrize("keep_alive", [True, False])
+def test_communication(server, keep_alive):
+    alice = Communication("localhost", server, "Alice", keep_alive=keep_alive)
+    bob = Communication("localhost", server, "Bob", keep_alive=keep_alive)
+    for i in range(5):
+        alice.send_private_message("Bob", f"message-{i}", f"hello {i}")
+        alice.publish_message(f"public-{i}", b"\x00\x01")
+    for i in range(5):
+        assert bob.retrieve_private_message(f"message-{i}") == f"hello {i}".encode()
+        assert bob.retrieve_public_message("Alice", f"public-{i}") == b"\x00\x01"
+    alice.close()
+    bob.close()
+
+
+def test_trusted_parameters_are_not_retried():
+    # A server that reads every request and drops the connection without answering.
+    listener = socket.create_server(("localhost", 0))
+    requests_seen = []
+
+    def drop_requests():
+        while True:
+            try:
+                connection, _ = listener.accept()
+            except OSError:
+                return
+            requests_seen.append(connection.recv(4096).split(b" ")[1])
+            connection.close()
+
+    thread = threading.Thread(target=drop_requests, daemon=True)
+    thread.start()
+    client = Communication("localhost", listener.getsockname()[1], "Alice", retries=2, backoff=0)
+    with pytest.raises(requests.ConnectionError):
+        client.retrieve_beaver_triplet_shares("0")
+    # Sending it again would hand out the next triplet of the client.
+    assert requests_seen == [b"/shares/Alice/0"]
+    with pytest.raises(requests.ConnectionError):
+        client.retrieve_private_message("message")
+    assert len(requests_seen) == 1 + 3
+    client.close()
+    listener.close()
+
+
+def test_polling_errors():
+    class FailingHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests_seen.append(self.path)
+            self.send_error(500)
+
+    requests_seen = []
+    httpd = http.server.ThreadingHTTPServer(("localhost", 0), FailingHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    client = Communication("localhost", httpd.server_address[1], "Alice", retries=0)
+    # A failing server is reported at once instead of being polled forever.
+    with pytest.raises(requests.HTTPError):
+        client.retrieve_private_message("message")
+    with pytest.raises(requests.HTTPError):
+        client.retrieve_many(["message"])
+    assert len(requests_seen) == 2
+    client.close()
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_long_poll(server):
+    alice = Communication("localhost", server, "Alice")
+    bob = Communication("localhost", server, "Bob")
+    sent = []
+
+    def send_later():
+        time.sleep(0.3)
+        sent.append(time.perf_counter())
+        alice.send_private_message("Bob", "long-poll", "hello")
+
+    sender = threading.Thread(target=send_later)
+    sender.start()
+    assert bob.retrieve_private_message("long-poll") == b"hello"
+    received = time.perf_counter()
+    sender.join()
+    # The pending retrieval is answered right away, not at the next poll.
+    assert received - sent[0] < 0.1
+
+
+def test_long_poll_timeout(server):
+    connection = http.client.HTTPConnection("localhost", server)
+    start = time.perf_counter()
+    connection.request("GET", "/public/Bob/Alice/never-sent?wait=0.2")
+    response = connection.getresponse()
+    assert (response.status, response.read()) == (404, b"")
+    assert time.perf_counter() - start >= 0.2
+    connection.close()
+
+
+def test_batches(server):
+    alice = Communication("localhost", server, "Alice")
+    bob = Communication("localhost", server, "Bob")
+    alice.send_many([("Bob", "batch-0", b"zero"), ("Bob", "batch-1", "one"), ("Alice", "batch-0", b"self")])
+    assert bob.retrieve_many(["batch-1", "batch-0"]) == [b"one", b"zero"]
+    assert alice.retrieve_many(["batch-0"]) == [b"self"]
+
+    # The server sends back the available messages and the client asks again for the others.
+    connection = http.client.HTTPConnection("localhost", server)
+    alice.publish_message("batch-public", b"from Alice")
+    connection.request("GET", "/public_many/Bob?sender=Alice&label=batch-public&sender=Bob&label=batch-public")
+    assert decode_envelope(connection.getresponse().read()) == [("Alice/batch-public", b"from Alice")]
+    connection.close()
+
+    def publish_later():
+        time.sleep(0.3)
+        bob.publish_message("batch-public", b"from Bob")
+
+    publisher = threading.Thread(target=publish_later)
+    publisher.start()
+    channels = [("Alice", "batch-public"), ("Bob", "batch-public")]
+    assert alice.retrieve_public_many(channels) == [b"from Alice", b"from Bob"]
+    publisher.join()
+
+
+def test_opening(server, monkeypatch):
+    ttp = TrustedParamGenerator(pool_size=0)
+    ttp.add_participant("Alice")
+    ttp.add_participant("Bob")
+    monkeypatch.setattr(server_module, "ttp", ttp)
+    alice = Communication("localhost", server, "Alice")
+    bob = Communication("localhost", server, "Bob")
+    opened = {}
+
+    def open_later():
+        time.sleep(0.3)
+        opened["Bob"] = bob.open_message("opening", default_field.pack([default_field.q - 1, 5]))
+
+    opener = threading.Thread(target=open_later)
+    opener.start()
+    # Alice waits for the share of Bob, a retried share is not counted twice.
+    connection = http.client.HTTPConnection("localhost", server)
+    connection.request("POST", "/open/Alice/opening", default_field.pack([3, 4]))
+    assert connection.getresponse().status == 404
+    connection.close()
+    opened["Alice"] = alice.open_message("opening", default_field.pack([3, 4]))
+    opener.join()
+    assert {name: default_field.unpack(data).tolist() for name, data in opened.items()} == {"Alice": [2, 9], "Bob": [2, 9]}
+
+    # Once everyone retrieved it, the opened value is dropped and the label can be opened again.
+    assert server_module.store["opened"] == {}
+    opener = threading.Thread(target=lambda: opened.update(Bob=bob.open_message("opening", default_field.pack([1]))))
+    opener.start()
+    assert default_field.unpack(alice.open_message("opening", default_field.pack([1]))).tolist() == [2]
+    opener.join()
+    # Only the participants open values.
+    mallory = Communication("localhost", server, "Mallory")
+    with pytest.raises(requests.HTTPError):
+        mallory.open_message("opening", default_field.pack([1]))
+    assert server_module.openings == {}
@@ -0,0 +1,146 @@
+"""
+Unit tests for the SMC party, run without a server.
+"""
+
+import os
+
+from compiler import compile_expression
+from expression import LinearCombination, Secret, SecretMatrix, SecretVector, Scalar
+from protocol import ProtocolSpec
+from secret_sharing import Share, ShareVector, default_q
+from smc_party import SMCParty
+from ttp import TrustedParamGenerator
+
+
+class RecordingCommunication:
+    """Serves the shares of a single party from memory and records the requests."""
+
+    def __init__(self, client_id, shares):
+        self.client_id = client_id
+        self.shares = shares
+        self.requests = []
+
+    def retrieve_private_message(self, label):
+        self.requests.append(label)
+        return self.shares[label]
+
+    def retrieve_many(self, labels):
+        return [self.retrieve_private_message(label) for label in labels]
+
+
+def make_party(expr, shares):
+    party = SMCParty("Alice", "localhost", 5000, ProtocolSpec(["Alice"], expr), {})
+    messages = {
+        f"{int.from_bytes(secret.id, byteorder='big')}": (
+            ShareVector(0, value) if isinstance(secret, SecretVector) else Share(0, value)
+        ).serialize_bytes()
+        for secret, value in shares.items()
+    }
+    party.comm = RecordingCommunication("Alice", messages)
+    return party
+
+
+def test_shares_are_retrieved_once():
+    a, b = Secret(), Secret()
+    expr = a + a + b * Scalar(3) + a - b
+    party = make_party(expr, {a: 5, b: 7})
+
+    plan = compile_expression(expr)
+    party.prefetch_shares(plan)
+    assert len(party.comm.requests) == 2
+
+    result = party.execute_plan(plan)
+    assert result.value == (5 + 5 + 21 + 5 - 7) % default_q
+    assert len(party.comm.requests) == 2
+
+
+def test_shares_retrieved_lazily():
+    a = Secret()
+    party = make_party(a + a, {a: 5})
+    assert party.process_expression(Secret(id=a.id) - a + a).value == 5
+    assert len(party.comm.requests) == 1
+
+
+def test_linear_combination():
+    secrets = [Secret() for _ in range(1000)]
+    values = {secret: i for i, secret in enumerate(secrets)}
+    expr = sum(secrets) * Scalar(3) - Scalar(2) * secrets[0] + (Scalar(4) + Scalar(5)) - default_q
+    party = make_party(expr, values)
+    result = party.process_expression(expr)
+    assert result.value == (3 * sum(range(1000)) + 9) % default_q
+
+    public = LinearCombination([2, 3], [Scalar(4), Scalar(5)], 1)
+    assert party.process_expression(public) % default_q == 24
+
+
+def test_vector_operations():
+    x, y, s = SecretVector(3), SecretVector(3), Secret()
+    party = make_party(None, {x: [1, 2, 3], y: [10, 20, default_q - 1], s: 4})
+    result = party.process_expression(x * Scalar(2) + y - s + Scalar(1))
+    assert isinstance(result, ShareVector)
+    assert result.value.tolist() == [9, 21, 2]
+
+    total = party.process_expression(LinearCombination([3, -1], [x, s], 5).sum())
+    assert total.value == 3 * 6 + 3 * (5 - 4)
+
+
+def test_constant_polynomial_of_vector():
+    x, s = SecretVector(3), Secret()
+    party = make_party(None, {x: [1, 2, 3], s: 4})
+    assert party.process_expression(x ** 0).tolist() == [1, 1, 1]
+    assert party.process_expression((x ** 0).sum()) == 3
+    assert party.process_expression(x ** 0 + x).value.tolist() == [2, 3, 4]
+    assert party.process_expression(x ** 0 * Scalar(2) - x).value.tolist() == [1, 0, default_q - 1]
+    assert party.process_expression(s * (x ** 0) - x ** 0).value.tolist() == [3, 3, 3]
+    assert party.process_expression((x ** 0).dot(x * Scalar(2))).value == 12
+    assert party.process_expression(x.dot(x ** 0) + (x ** 0).dot(x ** 0)).value == 9
+
+
+def test_public_matrix_product():
+    m, n = SecretMatrix(2, 3), SecretMatrix(3, 2)
+    party = make_party(None, {m: [1, 2, 3, 4, 5, 6], n: [1, 2, 3, 4, 5, 6]})
+    assert party.process_expression((m ** 0) @ n).value.tolist() == [9, 12, 9, 12]
+    assert party.process_expression(m @ (n ** 0)).value.tolist() == [6, 6, 15, 15]
+    assert party.process_expression((m ** 0) @ (n ** 0)).tolist() == [3, 3, 3, 3]
+
+
+class PreprocessingCommunication(RecordingCommunication):
+    """Also serves preprocessed material from an in-memory trusted server."""
+
+    def __init__(self, client_id, shares, ttp):
+        super().__init__(client_id, shares)
+        self.ttp = ttp
+
+    def retrieve_preprocessing(self, requests):
+        self.requests.append("preprocessing")
+        return dict(self.ttp.retrieve_preprocessing(self.client_id, requests))
+
+
+def test_preprocessing_cache(tmp_path):
+    a, b = Secret(), Secret()
+    expr = a * b + a * a
+    plan = compile_expression(expr)
+    ttp = TrustedParamGenerator()
+    ttp.add_participant("Alice")
+
+    offline = SMCParty("Alice", "localhost", 5000, ProtocolSpec(["Alice"], expr), {}, preprocessing_cache=str(tmp_path))
+    offline.comm = PreprocessingCommunication("Alice", {}, ttp)
+    path = offline.store_preprocessing(plan)
+    assert offline.comm.requests == ["preprocessing"]
+
+    online = SMCParty("Alice", "localhost", 5000, ProtocolSpec(["Alice"], expr), {}, preprocessing_cache=str(tmp_path))
+    online.comm = PreprocessingCommunication("Alice", {}, ttp)
+    online.preprocess(plan)
+    # The stored material is used once, without asking the server.
+    assert online.comm.requests == []
+    assert not os.path.exists(path)
+    assert [len(online.preprocessed[op_id]) for op_id in ("0", "1")] == [3, 2]
+    a_share, b_share, c_share = online.get_preprocessed("0", ("triplet", None))
+    assert (a_share.value * b_share.value) % default_q == c_share.value
+    assert "0" not in online.preprocessed
+
+    # Without stored material, it is retrieved from the server.
+    online.comm.ttp = TrustedParamGenerator()
+    online.comm.ttp.add_participant("Alice")
+    online.preprocess(plan)
+    assert online.comm.requests == ["preprocessing"]
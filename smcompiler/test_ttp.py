@@ -5,8 +5,106 @@ Testing ttp is not obligatory.
 MODIFY THIS FILE.
 """
 
+import time
+
+from secret_sharing import default_q, reconstruct_shares
 from ttp import TrustedParamGenerator
 
 
 def test():
     raise NotImplementedError("You can create some tests.")
+
+
+def test_vector_triplet():
+    ttp = TrustedParamGenerator()
+    for participant in ["Alice", "Bob", "Charlie"]:
+        ttp.add_participant(participant)
+    triplets = [ttp.retrieve_share(participant, "0", 5) for participant in ["Alice", "Bob", "Charlie"]]
+    a, b, c = (reconstruct_shares(list(shares)) for shares in zip(*triplets))
+    assert len(a) == 5
+    assert ((a * b) % default_q).tolist() == c.tolist()
+    # Every party gets its own share.
+    assert sorted(triplet[0].index for triplet in triplets) == [0, 1, 2]
+
+
+def test_matrix_triplet():
+    ttp = TrustedParamGenerator()
+    for participant in ["Alice", "Bob"]:
+        ttp.add_participant(participant)
+    triplets = [ttp.retrieve_matrix_share(participant, "0", 2, 3, 4) for participant in ["Alice", "Bob"]]
+    a, b, c = (reconstruct_shares(list(shares)) for shares in zip(*triplets))
+    assert (len(a), len(b), len(c)) == (6, 12, 8)
+    assert ((a.reshape(2, 3) @ b.reshape(3, 4)) % default_q).ravel().tolist() == c.tolist()
+
+
+def test_square_pair():
+    ttp = TrustedParamGenerator()
+    for participant in ["Alice", "Bob"]:
+        ttp.add_participant(participant)
+    pairs = [ttp.retrieve_square_share(participant, "0") for participant in ["Alice", "Bob"]]
+    a, a_squared = (reconstruct_shares(list(shares)) for shares in zip(*pairs))
+    assert (a * a) % default_q == a_squared
+
+    pairs = [ttp.retrieve_square_share(participant, "1", 4) for participant in ["Alice", "Bob"]]
+    a, a_squared = (reconstruct_shares(list(shares)) for shares in zip(*pairs))
+    assert ((a * a) % default_q).tolist() == a_squared.tolist()
+
+
+def test_powers():
+    ttp = TrustedParamGenerator()
+    for participant in ["Alice", "Bob"]:
+        ttp.add_participant(participant)
+    shares = [ttp.retrieve_power_share(participant, "0", 5) for participant in ["Alice", "Bob"]]
+    powers = [reconstruct_shares(list(power)) for power in zip(*shares)]
+    assert powers == [pow(powers[0], j, default_q) for j in range(1, 6)]
+
+
+def test_preprocessing():
+    ttp = TrustedParamGenerator()
+    for participant in ["Alice", "Bob"]:
+        ttp.add_participant(participant)
+    requests = [("0", "triplet", None), ("1", "square", 4), ("2", "powers", 3, None), ("3", "matrix", 2, 2, 1)]
+    material = [dict(ttp.retrieve_preprocessing(participant, requests)) for participant in ["Alice", "Bob"]]
+    assert [list(shares) for shares in material] == [["0", "1", "2", "3"]] * 2
+    assert [len(material[0][op_id]) for op_id in "0123"] == [3, 2, 3, 3]
+    assert [share.index for share in material[0]["0"]] == [0, 0, 0]
+    assert [share.index for share in material[1]["0"]] == [1, 1, 1]
+    a, b, c = (reconstruct_shares([alice, bob]) for alice, bob in zip(material[0]["0"], material[1]["0"]))
+    assert (a * b) % default_q == c
+    r, r2, r3 = (reconstruct_shares([alice, bob]) for alice, bob in zip(material[0]["2"], material[1]["2"]))
+    assert (r2, r3) == (r * r % default_q, r * r * r % default_q)
+
+
+def test_triplet_pool():
+    ttp = TrustedParamGenerator(pool_size=100, refill_threshold=40, batch_size=30)
+    for participant in ["Alice", "Bob", "Charlie"]:
+        ttp.add_participant(participant)
+    batch = ttp.generate_triplet_batch(50)
+    for a, b, c in batch:
+        assert [share.index for share in a] == [0, 1, 2]
+        assert reconstruct_shares(a) * reconstruct_shares(b) % default_q == reconstruct_shares(c)
+
+    # Without the worker, an empty pool is refilled by a single batch.
+    ttp.retrieve_share("Alice", "0")
+    assert len(ttp.pool) == 29
+
+    ttp.start_pool()
+    deadline = time.time() + 10
+    while len(ttp.pool) < 100 and time.time() < deadline:
+        time.sleep(0.01)
+    assert len(ttp.pool) == 100
+    # Taking triplets down to the threshold wakes the worker up.
+    for op in range(1, 62):
+        triplets = [ttp.retrieve_share(participant, str(op)) for participant in ["Alice", "Bob", "Charlie"]]
+        a, b, c = (reconstruct_shares(list(shares)) for shares in zip(*triplets))
+        assert (a * b) % default_q == c
+    # 100 - 61 triplets are left, below the threshold.
+    deadline = time.time() + 10
+    while len(ttp.pool) <= 40 and time.time() < deadline:
+        time.sleep(0.01)
+    assert len(ttp.pool) > 40
+
+    # Triplets pooled for other participants are dropped.
+    ttp.add_participant("Dave")
+    triplet = ttp.retrieve_share("Dave", "100")
+    assert len(ttp.triplets["100"][0]) == 4
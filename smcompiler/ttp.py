@@ -5,18 +5,28 @@ MODIFY THIS FILE.
 """
 
 import collections
+import threading
 from typing import (
+    Deque,
     Dict,
+    List,
     Set,
+    Optional,
     Tuple,
 )
 
+import numpy as np
+
 from communication import Communication
+from compiler import PREP_MATRIX, PREP_POWERS, PREP_SQUARE, PREP_TRIPLET
+from field import Field
 from secret_sharing import(
+    default_field,
     gen_share,
+    gen_share_batch,
+    gen_vector_share,
     Share,
 )
-import random
 
 
 # Feel free to add as many imports as you want.
@@ -25,47 +35,250 @@ import random
 class TrustedParamGenerator:
     """
     A trusted third party that generates random values for the Beaver triplet multiplication scheme.
+
+    Scalar triplets are taken from a pool of pre-generated ones, so a request
+    is served from memory. The pool is filled by batches of `batch_size`
+    triplets generated at once with vectorized arithmetic, and topped up to
+    `pool_size` by a background worker (see `start_pool`) whenever it falls
+    to `refill_threshold`. Without the worker, an empty pool is refilled by
+    a single batch when a triplet is needed.
+
+    Attributes:
+        field: Field of the generated values (default: the default field)
+        pool_size: Number of scalar triplets the worker keeps ready, 0 disables it
+        refill_threshold: Size of the pool below which the worker tops it up (default: a quarter of pool_size)
+        batch_size: Number of triplets generated at once
     """
 
-    def __init__(self):
+    def __init__(
+            self,
+            field: Optional[Field] = None,
+            pool_size: int = 4096,
+            refill_threshold: Optional[int] = None,
+            batch_size: int = 1024
+        ):
+        self.field = field or default_field
         self.participant_ids: Set[str] = set()
         self.a = -1
         self.b = -1
         self.c = -1
         self.triplets = {}
         self.tripletIndeces = {}
+        self.pool_size = pool_size
+        self.refill_threshold = refill_threshold if refill_threshold is not None else pool_size // 4
+        self.batch_size = batch_size
+        # Shares of every participant of the pre-generated triplets, each entry is ([a], [b], [c]).
+        self.pool: Deque[Tuple[List[Share], List[Share], List[Share]]] = collections.deque()
+        self._pool_condition = threading.Condition()
+        self._worker: Optional[threading.Thread] = None
+        # The server handles its clients in threads, an operation must be generated once
+        # and its shares handed out in order.
+        self._lock = threading.RLock()
 
     def add_participant(self, participant_id: str) -> None:
         """
         Add a participant.
         """
         self.participant_ids.add(participant_id)
+        with self._pool_condition:
+            # The pooled triplets were shared among the previous participants.
+            self.pool.clear()
+            self._pool_condition.notify()
+
+    def start_pool(self) -> None:
+        """
+        Start the background worker keeping the pool of triplets topped up.
+        Call it once all the participants are registered.
+        """
+        if self._worker is not None or self.pool_size <= 0:
+            return
+        self._worker = threading.Thread(target=self._fill_pool, name="triplet-pool", daemon=True)
+        self._worker.start()
+
+    def _fill_pool(self) -> None:
+        """Worker loop: wait until the pool falls to the threshold, then top it up."""
+        while True:
+            with self._pool_condition:
+                while len(self.pool) > self.refill_threshold:
+                    self._pool_condition.wait()
+                missing = self.pool_size - len(self.pool)
+            while missing > 0:
+                num_shares = len(self.participant_ids)
+                batch = self.generate_triplet_batch(min(self.batch_size, missing))
+                with self._pool_condition:
+                    # Drop the batch if the participants changed while it was generated.
+                    if num_shares == len(self.participant_ids):
+                        self.pool.extend(batch)
+                    missing = self.pool_size - len(self.pool)
+            print(f"TTP: Triplet pool topped up to {len(self.pool)}")
+
+    def _take_triplet(self) -> Tuple[List[Share], List[Share], List[Share]]:
+        """Take a triplet from the pool, generating a batch if it is empty."""
+        with self._pool_condition:
+            if not self.pool:
+                self.pool.extend(self.generate_triplet_batch(self.batch_size))
+            triplet = self.pool.popleft()
+            if len(self.pool) <= self.refill_threshold:
+                self._pool_condition.notify()
+            return triplet
+
+    def generate_triplet_batch(self, count: int) -> List[Tuple[List[Share], List[Share], List[Share]]]:
+        """
+        Generate `count` scalar triplets at once: the values and their shares
+        are computed as vectors, then split into the shares of every triplet.
+        """
+        num_shares = len(self.participant_ids)
+        a = self.field.random(count)
+        b = self.field.random(count)
+        c = self.field.mul(a, b)
+        # For each of a, b and c, the shares of every participant as lists of ints.
+        columns = [
+            [share.value.tolist() for share in gen_share_batch(values, num_shares, self.field)]
+            for values in (a, b, c)
+        ]
+        return [
+            tuple([Share(i, column[i][j], field=self.field) for i in range(num_shares)] for column in columns)
+            for j in range(count)
+        ]
 
-    def retrieve_share(self, client_id: str, op_id: str) -> Tuple[Share, Share, Share]:
+    def retrieve_share(self, client_id: str, op_id: str, length: Optional[int] = None) -> Tuple[Share, Share, Share]:
         """
         Retrieve a triplet of shares for a given client_id.
+        If a length is given, the triplet is made of vectors of that length.
+        """
+        with self._lock:
+            if client_id not in self.participant_ids:
+                raise ValueError("Client not registered")
+            if op_id not in self.triplets:
+                if length is None:
+                    self.generate_new_triplet(op_id)
+                else:
+                    self.generate_new_vector_triplet(op_id, length)
+            currentIndex = self.tripletIndeces[op_id]
+            toReturn = (self.triplets[op_id][0][currentIndex], self.triplets[op_id][1][currentIndex], self.triplets[op_id][2][currentIndex])
+            self.tripletIndeces[op_id] += 1
+            return toReturn
+
+    def retrieve_matrix_share(self, client_id: str, op_id: str, m: int, k: int, n: int) -> Tuple[Share, Share, Share]:
+        """
+        Retrieve the shares of a matrix triplet (A, B, C = AB) for an m x k times k x n product.
         """
-        if client_id not in self.participant_ids:
-            raise ValueError("Client not registered")
-        if op_id not in self.triplets:
-            self.generate_new_triplet(op_id)
-        currentIndex = self.tripletIndeces[op_id]
-        toReturn = (self.triplets[op_id][0][currentIndex], self.triplets[op_id][1][currentIndex], self.triplets[op_id][2][currentIndex])
-        self.tripletIndeces[op_id] += 1
-        return toReturn
+        with self._lock:
+            if client_id not in self.participant_ids:
+                raise ValueError("Client not registered")
+            if op_id not in self.triplets:
+                self.generate_new_matrix_triplet(op_id, m, k, n)
+            return self.retrieve_share(client_id, op_id)
+
+    def retrieve_square_share(self, client_id: str, op_id: str, length: Optional[int] = None) -> Tuple[Share, Share]:
+        """
+        Retrieve the shares of a square pair (a, a^2) for a given client_id.
+        If a length is given, the pair is made of vectors of that length.
+        """
+        with self._lock:
+            if client_id not in self.participant_ids:
+                raise ValueError("Client not registered")
+            if op_id not in self.triplets:
+                self.generate_new_square(op_id, length)
+            currentIndex = self.tripletIndeces[op_id]
+            toReturn = (self.triplets[op_id][0][currentIndex], self.triplets[op_id][1][currentIndex])
+            self.tripletIndeces[op_id] += 1
+            return toReturn
+
+    def retrieve_power_share(self, client_id: str, op_id: str, degree: int, length: Optional[int] = None) -> Tuple[Share, ...]:
+        """
+        Retrieve the shares of the powers r, r^2, ..., r^degree of a random r.
+        If a length is given, r is a vector and the powers are element-wise.
+        """
+        with self._lock:
+            if client_id not in self.participant_ids:
+                raise ValueError("Client not registered")
+            if op_id not in self.triplets:
+                self.generate_new_powers(op_id, degree, length)
+            currentIndex = self.tripletIndeces[op_id]
+            toReturn = tuple(power[currentIndex] for power in self.triplets[op_id])
+            self.tripletIndeces[op_id] += 1
+            return toReturn
+
+    def retrieve_preprocessing(self, client_id: str, requests: List[Tuple]) -> List[Tuple[str, Tuple[Share, ...]]]:
+        """
+        Retrieve the preprocessed material of many Beaver multiplications at once.
+        Every request is `(op_id, kind, *parameters)`, see `compiler.preprocessing_request`.
+        """
+        material = []
+        for op_id, kind, *parameters in requests:
+            if kind == PREP_TRIPLET:
+                shares = self.retrieve_share(client_id, op_id, *parameters)
+            elif kind == PREP_SQUARE:
+                shares = self.retrieve_square_share(client_id, op_id, *parameters)
+            elif kind == PREP_POWERS:
+                shares = self.retrieve_power_share(client_id, op_id, *parameters)
+            elif kind == PREP_MATRIX:
+                shares = self.retrieve_matrix_share(client_id, op_id, *parameters)
+            else:
+                raise ValueError(f"Unknown preprocessing kind {kind}")
+            material.append((op_id, shares))
+        return material
 
     def generate_new_triplet(self, secret_id: str) -> None:
-        self.a = random.randint(0,520633-1) #default_q
-        self.b = random.randint(0,520633-1) #default_q
-        self.c = (self.a * self.b) % 520633 #default_q
-        print(f"Generated new triplet: {self.a}, {self.b}, {self.c} for {secret_id}")
-        shares = []
-        for secret in [self.a,self.b,self.c]:
-            shares.append(gen_share(secret, len(self.participant_ids)))
+        """Assign a pre-generated triplet of the pool to the operation."""
+        self.triplets[secret_id] = self._take_triplet()
+        self.tripletIndeces[secret_id] = 0
+
+    def generate_new_vector_triplet(self, secret_id: str, length: int) -> None:
+        """Generate `length` element-wise triplets at once, shared as one vector each."""
+        a = self.field.random(length)
+        b = self.field.random(length)
+        c = self.field.mul(a, b)
+        print(f"Generated new vector triplet of length {length} for {secret_id}")
+        self.triplets[secret_id] = [self._share_vector(secret) for secret in (a, b, c)]
+        self.tripletIndeces[secret_id] = 0
+
+    def generate_new_square(self, secret_id: str, length: Optional[int] = None) -> None:
+        """Generate a square pair (a, a^2), a single multiplication instead of a full triplet."""
+        if length is None:
+            a = int(self.field.random(1)[0])
+            shares = [self._share(secret) for secret in (a, (a * a) % self.field.q)]
+        else:
+            a = self.field.random(length)
+            shares = [self._share_vector(secret) for secret in (a, self.field.mul(a, a))]
+        print(f"Generated new square pair for {secret_id}")
         self.triplets[secret_id] = shares
-        print(f"TTP: Generated new triplet shares: {shares} for {secret_id}")
         self.tripletIndeces[secret_id] = 0
-        
+
+    def generate_new_powers(self, secret_id: str, degree: int, length: Optional[int] = None) -> None:
+        """Generate the powers r, r^2, ..., r^degree of a random r, for polynomial evaluation."""
+        if length is None:
+            r = int(self.field.random(1)[0])
+            powers = [r]
+            for _ in range(degree - 1):
+                powers.append((powers[-1] * r) % self.field.q)
+            shares = [self._share(power) for power in powers]
+        else:
+            r = self.field.random(length)
+            powers = [r]
+            for _ in range(degree - 1):
+                powers.append(self.field.mul(powers[-1], r))
+            shares = [self._share_vector(power) for power in powers]
+        print(f"Generated new powers up to {degree} for {secret_id}")
+        self.triplets[secret_id] = shares
+        self.tripletIndeces[secret_id] = 0
+
+    def generate_new_matrix_triplet(self, secret_id: str, m: int, k: int, n: int) -> None:
+        """Generate random m x k and k x n matrices A and B with C = AB, shared as flat vectors."""
+        a = self.field.random((m, k))
+        b = self.field.random((k, n))
+        c = self.field.matmul(a, b)
+        print(f"Generated new {m}x{k} by {k}x{n} matrix triplet for {secret_id}")
+        self.triplets[secret_id] = [self._share_vector(secret.ravel()) for secret in (a, b, c)]
+        self.tripletIndeces[secret_id] = 0
+
+    def _share(self, secret: int):
+        return gen_share(secret, len(self.participant_ids), field=self.field)
+
+    def _share_vector(self, secret: np.ndarray):
+        return gen_vector_share(secret, len(self.participant_ids), field=self.field)
+
 
 # a: [Share(b'5cWs8g==', 0, 377149), Share(b'ISLUmg==', 1, 200216), Share(b'6jH88g==', 2, 345401)], 
 # b: [Share(b'GTPKrw==', 0, 465161), Share(b'x8/YTw==', 1, 336692), Share(b'9B1cQw==', 2, 380692)], 
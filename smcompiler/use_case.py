@@ -11,12 +11,20 @@ from expression import (
 )
 
 from secret_sharing import (
+    BeaverState,
     Share,
+    ShareVector,
+    beaver_inner_product,
     gen_share,
     send_share,
     retrieve_share,
     get_all_triplets,
     get_beaver_triplet,
+    get_matrix_triplet,
+    get_square_pair,
+    beaver_square,
+    publish_triplet_batch,
+    get_all_triplet_batches,
     publish_triplet,
     reconstruct_shares,
     publish_result_for_class,
@@ -103,13 +111,13 @@ class Student():
             print(f'Class: {self.client_id} has shares for lecture {lecture} -> {shares}')
             # Compute the standard variance
             # first compute for all the shares the difference between the share and the mean
-            # then square the result
-            # then sum all the results
+            # then take the inner product of these differences with themselves,
+            # which squares and sums them with a single opening
             # then publish the result
-            sum = 0
             student_count = len(self.cl.students)
-            for share in shares:
-                sum += self.handle_mult((student_count*share - self.means[lecture]),(student_count*share - self.means[lecture]))
+            deviations = [student_count*share - self.means[lecture] for share in shares]
+            deviations = ShareVector(deviations[0].index, [deviation.value for deviation in deviations])
+            sum = self.handle_inner_product(deviations, deviations)
             # Publish the result
             print(f'Class: {self.client_id} has computed the SUM VAR     of lecture {lecture} -> {sum}')
             publish_result_for_class(sum, self.comm, lecture, 'variance')
@@ -137,22 +145,42 @@ class Student():
         
     def handle_mult(self, l_expression, r_expression):
         if isinstance(l_expression, Share) and isinstance(r_expression, Share):
-            # Beaver Triplet logic
-            if l_expression.beaver_triplets is None:
-                l_expression.beaver_triplets = get_beaver_triplet(comm=self.comm,secret_id=self.tripletIndex)
-                # Each party locally computes a share of d = s - a
-                d_share = Share(index=l_expression.index, value=((l_expression.value - l_expression.beaver_triplets[0].value)))
-                # Each party locally computes a share of e = v - b
-                e_share = Share(index=r_expression.index, value=((r_expression.value - l_expression.beaver_triplets[1].value)))
-                # broadcast d and e to all parties
-                print(f'Class: {self.client_id} publishing d/e {d_share},{e_share}')
-                publish_triplet(d_share, self.comm, "d", self.tripletIndex)
-                publish_triplet(e_share, self.comm, "e", self.tripletIndex)
-                # Get all the d and e values
-                (d,e) = get_all_triplets(comm=self.comm, participant_ids=self.cl.students, secret_id=self.tripletIndex)
-                l_expression.d = d
-                l_expression.e = e
-                self.tripletIndex += 1
+            # Beaver Triplet logic, the state of the multiplication is kept apart from the shares
+            beaver = BeaverState(get_beaver_triplet(comm=self.comm,secret_id=self.tripletIndex))
+            # Each party locally computes a share of d = s - a
+            d_share = l_expression - beaver.triplet[0]
+            # Each party locally computes a share of e = v - b
+            e_share = r_expression - beaver.triplet[1]
+            # broadcast d and e to all parties
+            print(f'Class: {self.client_id} publishing d/e {d_share},{e_share}')
+            publish_triplet(d_share, self.comm, "d", self.tripletIndex)
+            publish_triplet(e_share, self.comm, "e", self.tripletIndex)
+            # Get all the d and e values
+            (beaver.d, beaver.e) = get_all_triplets(comm=self.comm, participant_ids=self.cl.students, secret_id=self.tripletIndex)
+            self.tripletIndex += 1
+            return beaver.multiply(l_expression.index)
         return l_expression * r_expression
 
-        
\ No newline at end of file
+    def handle_inner_product(self, l_vector: ShareVector, r_vector: ShareVector) -> Share:
+        # Inner-product triplet: a 1 x n times n x 1 matrix triplet, opened in a single batch
+        n = len(l_vector)
+        if l_vector is r_vector:
+            # Sum of squares: a square pair (a, a^2) of vectors only needs d = x - a to be opened
+            pair = get_square_pair(comm=self.comm, secret_id=self.tripletIndex, length=n)
+            d_share = l_vector - pair[0]
+            print(f'Class: {self.client_id} publishing d vector {d_share}')
+            publish_triplet_batch([d_share], [None], self.comm, self.tripletIndex)
+            [(d, _)] = get_all_triplet_batches(
+                comm=self.comm, participant_ids=self.cl.students, round_id=self.tripletIndex, lengths=[n], e_lengths=[0]
+            )
+            self.tripletIndex += 1
+            squares = beaver_square(l_vector.index, pair, d)
+            return Share(l_vector.index, int(squares.value.sum()))
+        triplet = get_matrix_triplet(comm=self.comm, secret_id=self.tripletIndex, dimensions=(1, n, 1))
+        d_share = l_vector - triplet[0]
+        e_share = r_vector - triplet[1]
+        print(f'Class: {self.client_id} publishing d/e vectors {d_share},{e_share}')
+        publish_triplet_batch([d_share], [e_share], self.comm, self.tripletIndex)
+        [(d, e)] = get_all_triplet_batches(comm=self.comm, participant_ids=self.cl.students, round_id=self.tripletIndex, lengths=[n])
+        self.tripletIndex += 1
+        return beaver_inner_product(l_vector.index, triplet, d, e)